@@ -1,18 +1,26 @@
 import os
 import json
+import time
+import hashlib
+import sqlite3
+import re
+import threading
+from types import SimpleNamespace
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, Future
 from groq import Groq
 from dotenv import load_dotenv
 
+import instrumentation as instr
+from instrumentation import CHARS_PER_TOKEN, estimate_tokens
+from llm_retry import TokenBucket, with_retries
+
 # --------------------------------------------------
-# LOAD ENV & INITIALIZE GROQ
+# LOAD ENV
 # --------------------------------------------------
 load_dotenv()
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-if not GROQ_API_KEY:
-    raise EnvironmentError("❌ GROQ_API_KEY not found in .env file")
-
-client = Groq(api_key=GROQ_API_KEY)
 
 # --------------------------------------------------
 # FILE PATHS
@@ -22,102 +30,597 @@ CACHE_FILE = r"D:\AI-Powered-RegulatoryCompliance-Checker-for-Contracts\processe
 FINAL_RESULT_FILE = r"D:\AI-Powered-RegulatoryCompliance-Checker-for-Contracts\final_result.txt"
 
 # --------------------------------------------------
-# LOAD CACHE
+# LLM CONFIG
 # --------------------------------------------------
-if os.path.exists(CACHE_FILE):
-    with open(CACHE_FILE, "r", encoding="utf-8") as f:
-        cache = json.load(f)
-else:
-    cache = {}
+MODEL_NAME = "llama-3.1-8b-instant"
+TEMPERATURE = 0.3
+MAX_TOKENS = 1000
+SYSTEM_PROMPT = (
+    "You are a legal compliance assistant. "
+    "Extract key clauses, identify compliance risks, "
+    "and summarize regulatory issues clearly."
+)
+
+# Chunking: whole contracts are packed into chunks of at most CHUNK_TOKENS.
+# Dataset contracts estimate at 520-570 tokens, so 1200 fits two per call
+# (250 calls for Dataset.txt vs 269 with the old 4000-character slices).
+CHUNK_TOKENS = int(os.getenv("APP_CHUNK_TOKENS", "1200"))
+CONTRACT_RE = re.compile(r"^\s*Contract #(\w+)")
+CLAUSE_RE = re.compile(r"^\s*\d+\.\s")
+
+# Concurrency / rate limiting (override via .env; retries: see llm_retry.py)
+MAX_WORKERS = int(os.getenv("APP_MAX_WORKERS", "4"))
+REQUESTS_PER_MINUTE = float(os.getenv("APP_REQUESTS_PER_MINUTE", "30"))
+
+# Result store backend: "sqlite" (WAL) or "jsonl" (append-only)
+RESULT_STORE = os.getenv("APP_RESULT_STORE", "sqlite")
+RESULT_STORE_BASE = os.path.splitext(CACHE_FILE)[0]
+
+# Maximum number of cached chunk analyses kept (least recently used evicted)
+CACHE_MAX_ENTRIES = int(os.getenv("APP_CACHE_MAX_ENTRIES", "5000"))
+
 
 # --------------------------------------------------
-# LOAD DATASET
+# RESULT STORES
 # --------------------------------------------------
-if not os.path.exists(DATASET_FILE):
-    raise FileNotFoundError(f"❌ Dataset file not found: {DATASET_FILE}")
+class JsonlResultStore:
+    """
+    Append-only JSONL store. Every put/delete is a single appended line,
+    so a crash can at worst leave one torn trailing line (skipped on load).
+    The file is compacted on open once dead lines dominate.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.data = OrderedDict()
+        self._lock = threading.Lock()
+        self._lines = 0
+
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    self._lines += 1
+                    if record.get("deleted"):
+                        self.data.pop(record["key"], None)
+                    else:
+                        self.data[record["key"]] = record["value"]
+                        self.data.move_to_end(record["key"])
+
+        if self._lines > 2 * len(self.data) + 100:
+            self.compact()
+
+        # A torn last line must not swallow the next record
+        partial = False
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                partial = f.read(1) != b"\n"
+        self._file = open(path, "a", encoding="utf-8")
+        if partial:
+            self._file.write("\n")
+
+    def _append(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._lines += 1
+
+    def keys(self):
+        return list(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key):
+        return self.data.get(key)
 
-with open(DATASET_FILE, "r", encoding="utf-8") as f:
-    content = f.read().strip()
+    def put(self, key, value):
+        with self._lock:
+            self.data[key] = value
+            self._append({"key": key, "value": value})
 
-if not content:
-    raise ValueError("❌ Dataset file is empty")
+    def delete(self, key):
+        with self._lock:
+            if self.data.pop(key, None) is not None:
+                self._append({"key": key, "deleted": True})
+
+    def compact(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for key, value in self.data.items():
+                f.write(json.dumps({"key": key, "value": value}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._lines = len(self.data)
+
+    def close(self):
+        self._file.close()
+
+
+class SqliteResultStore:
+    """SQLite store in WAL mode; each put is its own committed transaction."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    def keys(self):
+        with self._lock:
+            rows = self.conn.execute("SELECT key FROM results ORDER BY updated").fetchall()
+        return [r[0] for r in rows]
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def get(self, key):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value FROM results WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key, value):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, updated) VALUES (?, ?, ?)",
+                (key, value, time.time()),
+            )
+
+    def delete(self, key):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM results WHERE key = ?", (key,))
+
+    def close(self):
+        self.conn.close()
+
+
+def open_result_store(backend=RESULT_STORE, base_path=RESULT_STORE_BASE):
+    if backend == "jsonl":
+        return JsonlResultStore(base_path + ".jsonl")
+    if backend == "sqlite":
+        return SqliteResultStore(base_path + ".sqlite")
+    raise ValueError(f"❌ Unknown result store backend: {backend}")
+
+
+def migrate_legacy_cache(store, legacy_path=CACHE_FILE):
+    """One-time import of the old processed_results.json into `store`."""
+    if not os.path.exists(legacy_path):
+        return 0
+
+    with open(legacy_path, "r", encoding="utf-8") as f:
+        try:
+            data = json.load(f)
+        except ValueError:
+            data = {}
+
+    # Positional "chunk_N" keys from older runs cannot be trusted
+    migrated = 0
+    for key, value in data.items():
+        if not key.startswith("chunk_") and store.get(key) is None:
+            store.put(key, value)
+            migrated += 1
+
+    os.replace(legacy_path, legacy_path + ".migrated")
+    print(f"📦 Migrated {migrated} cached results from {legacy_path}")
+    return migrated
 
-print(f"✅ Loaded dataset.txt ({len(content)} characters)")
 
 # --------------------------------------------------
-# CHUNK PROCESSING FUNCTION
+# RESULT CACHE
 # --------------------------------------------------
-def process_large_text(
-    text,
-    model_name="llama-3.1-8b-instant",
-    chunk_size=4000
-):
+class ResultCache:
     """
-    Process large text using safe chunking with caching.
+    Content-addressed LRU cache of chunk analyses.
+    Keys hash the chunk text together with every request parameter, so
+    editing one contract only invalidates the chunks whose text changed.
+    Values live in a result store; only the LRU order is kept in memory.
     """
-    results = []
-    total_chunks = (len(text) + chunk_size - 1) // chunk_size
 
-    for i in range(total_chunks):
-        start = i * chunk_size
-        end = start + chunk_size
-        chunk = text[start:end].strip()
+    def __init__(self, store, max_entries=CACHE_MAX_ENTRIES):
+        self.store = store
+        self.max_entries = max_entries
+        self.order = OrderedDict((key, None) for key in store.keys())
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._evict()
 
-        if not chunk:
-            continue
+    @staticmethod
+    def make_key(
+        chunk,
+        model_name=MODEL_NAME,
+        system_prompt=SYSTEM_PROMPT,
+        temperature=TEMPERATURE,
+        max_tokens=MAX_TOKENS,
+    ):
+        payload = json.dumps(
+            [chunk, model_name, system_prompt, temperature, max_tokens],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
-        chunk_id = f"chunk_{i+1}"
+    def get(self, key):
+        with self._lock:
+            if key in self.order:
+                self.hits += 1
+                self.order.move_to_end(key)
+                return self.store.get(key)
+            self.misses += 1
+            return None
 
-        # Use cached result if available
-        if chunk_id in cache:
-            print(f"⚡ Using cached result for {chunk_id}")
-            results.append(cache[chunk_id])
-            continue
+    def put(self, key, value):
+        with self._lock:
+            self.store.put(key, value)
+            self.order[key] = None
+            self.order.move_to_end(key)
+            self._evict()
 
-        print(f"📝 Processing chunk {i+1}/{total_chunks}...")
+    def _evict(self):
+        while len(self.order) > self.max_entries:
+            key, _ = self.order.popitem(last=False)
+            self.store.delete(key)
+            self.evictions += 1
 
-        try:
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.order),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+def open_cache():
+    store = open_result_store()
+    migrate_legacy_cache(store)
+    return ResultCache(store)
+
+
+cache = None
+
+
+# --------------------------------------------------
+# LLM CLIENTS
+# --------------------------------------------------
+class StubClient:
+    """
+    Offline stand-in for Groq exposing `chat.completions.create`.
+    Useful for testing the worker pool without spending API credits.
+    """
+
+    def __init__(self, latency=0.0, fail_every=0):
+        self.latency = latency
+        self.fail_every = fail_every
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, temperature=None, max_tokens=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+            call_no = self.calls
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if self.fail_every and call_no % self.fail_every == 0:
+            err = RuntimeError("stub rate limit")
+            err.status_code = 429
+            raise err
+
+        prompt = messages[-1]["content"]
+        content = f"[stub:{model}] {len(prompt)} chars analysed: {prompt[:60]!r}"
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(
+                prompt_tokens=estimate_tokens(prompt),
+                completion_tokens=estimate_tokens(content),
+            ),
+        )
+
+
+def get_client():
+    """Return a Groq client, or the offline stub when GROQ_STUB=1."""
+    if os.getenv("GROQ_STUB") == "1":
+        return StubClient()
+
+    if not GROQ_API_KEY:
+        raise EnvironmentError("❌ GROQ_API_KEY not found in .env file")
+
+    return Groq(api_key=GROQ_API_KEY)
+
+
+# --------------------------------------------------
+# LLM CALLS
+# --------------------------------------------------
+def analyse_chunk(client, chunk, model_name, limiter=None):
+    """Send one chunk to the LLM, retrying on 429/5xx and connection errors."""
+
+    def call():
+        start = time.perf_counter()
+        with instr.stage("llm_call"):
             response = client.chat.completions.create(
                 model=model_name,
                 messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "You are a legal compliance assistant. "
-                            "Extract key clauses, identify compliance risks, "
-                            "and summarize regulatory issues clearly."
-                        ),
-                    },
+                    {"role": "system", "content": SYSTEM_PROMPT},
                     {"role": "user", "content": chunk},
                 ],
-                temperature=0.3,
-                max_tokens=1000,
+                temperature=TEMPERATURE,
+                max_tokens=MAX_TOKENS,
             )
+        content = response.choices[0].message.content.strip()
+
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            instr.record_llm(model_name, usage.prompt_tokens, usage.completion_tokens,
+                             time.perf_counter() - start)
+        else:
+            instr.record_llm(model_name, estimate_tokens(SYSTEM_PROMPT + chunk),
+                             estimate_tokens(content), time.perf_counter() - start,
+                             estimated=True)
+        return content
+
+    return with_retries(call, model_name, limiter)
+
+
+# --------------------------------------------------
+# CONTRACT-AWARE CHUNKING
+# --------------------------------------------------
+def _split_clauses(lines):
+    """Group contract body lines into numbered clauses ("1. Scope ...")."""
+    clauses, current = [], []
+    for line in lines:
+        if CLAUSE_RE.match(line) and current:
+            clauses.append("".join(current))
+            current = []
+        current.append(line)
+    if current:
+        clauses.append("".join(current))
+    return clauses
+
+
+def _split_contract(contract_id, lines, max_tokens):
+    """
+    Break one oversized contract into clause-aligned pieces.
+    Every piece repeats the contract header so it can be analysed alone.
+    """
+    header_end = next(
+        (i + 1 for i, line in enumerate(lines[1:], 1) if line.startswith("=====")),
+        0,
+    )
+    header = "".join(lines[:header_end])
+    budget = max(1, max_tokens - estimate_tokens(header))
+
+    pieces, current = [], ""
+    for clause in _split_clauses(lines[header_end:]):
+        # Hard-split a single clause that cannot fit on its own
+        while estimate_tokens(clause) > budget:
+            cut = budget * CHARS_PER_TOKEN
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(clause[:cut])
+            clause = clause[cut:]
+
+        if current and estimate_tokens(current + clause) > budget:
+            pieces.append(current)
+            current = ""
+        current += clause
+
+    if current:
+        pieces.append(current)
+
+    for piece in pieces:
+        yield {"contract_ids": [contract_id], "text": (header + piece).strip()}
+
 
-            result_text = response.choices[0].message.content.strip()
-            results.append(result_text)
+def _iter_contracts(lines):
+    """Yield (contract_id, lines) blocks split on "=====" / "Contract #" headers."""
+    contract_id, block, prev = None, [], None
 
-            # Save to cache
-            cache[chunk_id] = result_text
-            with open(CACHE_FILE, "w", encoding="utf-8") as f:
-                json.dump(cache, f, indent=4, ensure_ascii=False)
+    for line in lines:
+        match = CONTRACT_RE.match(line)
+        if match:
+            # The "=====" rule above the title belongs to the new contract
+            carry = [block.pop()] if prev is not None and prev.startswith("=====") else []
+            if any(l.strip() for l in block):
+                yield contract_id, block
+            contract_id, block = match.group(1), carry
+        block.append(line)
+        prev = line
 
+    if any(l.strip() for l in block):
+        yield contract_id, block
+
+
+def iter_contract_chunks(lines, max_tokens=CHUNK_TOKENS):
+    """
+    Stream chunks aligned to contract boundaries from an iterable of lines.
+    Small contracts are packed together up to `max_tokens`; larger ones are
+    split on numbered clauses. Each chunk is a dict with `contract_ids` and
+    `text`, and only one contract is held in memory at a time.
+    """
+    batch_ids, batch_text, batch_tokens = [], [], 0
+
+    for contract_id, block in _iter_contracts(lines):
+        text = "".join(block).strip()
+        tokens = estimate_tokens(text)
+
+        if tokens > max_tokens:
+            if batch_text:
+                yield {"contract_ids": batch_ids, "text": "\n\n".join(batch_text)}
+                batch_ids, batch_text, batch_tokens = [], [], 0
+            yield from _split_contract(contract_id, block, max_tokens)
+            continue
+
+        if batch_text and batch_tokens + tokens > max_tokens:
+            yield {"contract_ids": batch_ids, "text": "\n\n".join(batch_text)}
+            batch_ids, batch_text, batch_tokens = [], [], 0
+
+        if contract_id is not None:
+            batch_ids.append(contract_id)
+        batch_text.append(text)
+        batch_tokens += tokens
+
+    if batch_text:
+        yield {"contract_ids": batch_ids, "text": "\n\n".join(batch_text)}
+
+
+def stream_dataset_chunks(path, max_tokens=CHUNK_TOKENS):
+    """Lazily read `path` line by line and yield contract-aligned chunks."""
+    with open(path, "r", encoding="utf-8") as f:
+        yield from iter_contract_chunks(f, max_tokens)
+
+
+# --------------------------------------------------
+# CHUNK PROCESSING FUNCTION
+# --------------------------------------------------
+def chunk_label(n, chunk):
+    ids = chunk["contract_ids"]
+    if not ids:
+        return f"chunk_{n}"
+    if len(ids) == 1:
+        return f"chunk_{n} (Contract #{ids[0]})"
+    return f"chunk_{n} (Contracts #{ids[0]}-#{ids[-1]})"
+
+
+def process_chunks(
+    chunks,
+    model_name=MODEL_NAME,
+    max_workers=MAX_WORKERS,
+    client=None,
+    limiter=None,
+):
+    """
+    Analyse an iterable of chunks with caching.
+    Uncached chunks are sent to the LLM from a bounded thread pool, with at
+    most 2 * max_workers chunks in flight; results are returned in order.
+    """
+    global cache
+    if cache is None:
+        cache = open_cache()
+
+    max_workers = max(1, max_workers)
+    client = client or get_client()
+    if limiter is None and REQUESTS_PER_MINUTE > 0:
+        limiter = TokenBucket(REQUESTS_PER_MINUTE, capacity=max_workers)
+
+    results = []
+    window = deque()
+    inflight = {}
+
+    def worker(key, chunk, label):
+        print(f"📝 Processing {label}...")
+
+        try:
+            result_text = analyse_chunk(client, chunk, model_name, limiter)
         except Exception as e:
-            error_msg = f"❌ Error processing {chunk_id}: {str(e)}"
+            error_msg = f"❌ Error processing {label}: {str(e)}"
             print(error_msg)
-            results.append(error_msg)
+            return error_msg
+
+        # Save to cache
+        cache.put(key, result_text)
+        return result_text
+
+    def resolve(item):
+        key, value = item
+        if isinstance(value, Future):
+            inflight.pop(key, None)
+            value = value.result()
+        results.append(value)
+
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        for n, chunk in enumerate(chunks, 1):
+            text = chunk["text"].strip()
+            if not text:
+                continue
+
+            label = chunk_label(n, chunk)
+            key = ResultCache.make_key(text, model_name)
+
+            # Use cached result if available
+            with instr.stage("cache_lookup"):
+                cached = cache.get(key)
+            if cached is not None:
+                instr.count("result_cache", result="hit")
+                print(f"⚡ Using cached result for {label}")
+                window.append((key, cached))
+            else:
+                instr.count("result_cache", result="miss")
+                # Identical chunks are only sent to the LLM once
+                if key not in inflight:
+                    inflight[key] = pool.submit(worker, key, text, label)
+                window.append((key, inflight[key]))
+
+            instr.gauge("inflight_chunks", len(inflight))
+            while len(window) > 2 * max_workers:
+                with instr.stage("wait_results"):
+                    resolve(window.popleft())
+
+        while window:
+            with instr.stage("wait_results"):
+                resolve(window.popleft())
+    finally:
+        pool.shutdown(wait=True)
+
+    print(f"📊 Cache stats: {cache.stats()}")
 
     return "\n\n" + "=" * 80 + "\n\n".join(results)
 
+
+def process_large_text(text, max_tokens=CHUNK_TOKENS, **kwargs):
+    """
+    Process large text using contract-aware chunking with caching.
+    """
+    chunks = iter_contract_chunks(text.splitlines(keepends=True), max_tokens)
+    return process_chunks(chunks, **kwargs)
+
+
 # --------------------------------------------------
 # RUN PROCESSING
 # --------------------------------------------------
-final_result = process_large_text(content)
+def main():
+    if not os.path.exists(DATASET_FILE):
+        raise FileNotFoundError(f"❌ Dataset file not found: {DATASET_FILE}")
+
+    size = os.path.getsize(DATASET_FILE)
+    if not size:
+        raise ValueError("❌ Dataset file is empty")
+
+    print(f"✅ Streaming dataset.txt ({size} bytes)")
+
+    instr.init("app")
+    with instr.stage("analyse_dataset"):
+        final_result = process_chunks(instr.timed_iter("chunking", stream_dataset_chunks(DATASET_FILE)))
+
+    # --------------------------------------------------
+    # SAVE FINAL OUTPUT
+    # --------------------------------------------------
+    with open(FINAL_RESULT_FILE, "w", encoding="utf-8") as f:
+        f.write(final_result)
+
+    print(f"\n✅ Final combined result saved to:\n{FINAL_RESULT_FILE}")
+    instr.report()
 
-# --------------------------------------------------
-# SAVE FINAL OUTPUT
-# --------------------------------------------------
-with open(FINAL_RESULT_FILE, "w", encoding="utf-8") as f:
-    f.write(final_result)
 
-print(f"\n✅ Final combined result saved to:\n{FINAL_RESULT_FILE}")
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,23 @@
+# Heavy dependencies (LangChain, the embedding model, FAISS, reportlab)
+# are imported lazily inside cached accessors, once per process.
+# Measure import cost with:  python -X importtime -c "import app_streamlit"
 import os
+import re
+import time
 import streamlit as st
 from dotenv import load_dotenv
 from pathlib import Path
 from datetime import datetime
+from types import SimpleNamespace
 import smtplib
 import socket
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
+
+import instrumentation as instr
+from rerank import RERANK, RERANK_FETCH_K, get_cross_encoder, select_context
 
 # ========================= LOAD ENV =========================
 load_dotenv()
@@ -20,16 +26,12 @@ EMAIL_SENDER = os.getenv("SENDER_EMAIL")
 EMAIL_PASSWORD = os.getenv("SENDER_PASSWORD")
 EMAIL_RECEIVER = os.getenv("DEFAULT_RECEIVER_EMAIL")
 
-# ========================= LANGCHAIN =========================
-from langchain_groq import ChatGroq
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
-
 # ========================= PAGE CONFIG =========================
 st.set_page_config(
     page_title="AI-Powered Regulatory Compliance Checker",
     layout="wide",
 )
+instr.init("streamlit")
 
 # ========================= PATHS =========================
 UPLOAD_DIR = "uploads"
@@ -47,33 +49,65 @@ if "amended_text" not in st.session_state:
 if "amended_file_path" not in st.session_state:
     st.session_state.amended_file_path = ""
 
+# ========================= STARTUP TIMINGS =========================
+@st.cache_resource
+def startup_timings() -> dict:
+    """Seconds spent creating each cached resource in this process"""
+    return {}
+
+
+def record_startup(name: str, start: float):
+    startup_timings()[name] = round(time.perf_counter() - start, 3)
+
+
 # ========================= EMBEDDINGS =========================
-embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
+EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+@st.cache_resource
+def get_embeddings():
+    """Embedding model wrapped in the disk cache, warmed up once per process"""
+    start = time.perf_counter()
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    from embedding_cache import CachedEmbeddings
+
+    embeddings = CachedEmbeddings(
+        HuggingFaceEmbeddings(model_name=EMBED_MODEL), EMBED_MODEL
+    )
+    # Load the model weights now rather than on the first user query
+    embeddings.embed_query("warm-up")
+    record_startup("embeddings", start)
+    return embeddings
 
 # ========================= LOAD VECTOR STORE =========================
 @st.cache_resource
 def load_or_build_vector_store():
     """Load existing FAISS index or build from Dataset files"""
+    start = time.perf_counter()
     try:
         from langchain_text_splitters import RecursiveCharacterTextSplitter
         from langchain_community.document_loaders import TextLoader
-        from pathlib import Path
+        from langchain_community.vectorstores import FAISS
+        from index_store import index_exists, load_index, save_index, migrate_pickle_index
+
+        embeddings = get_embeddings()
         
-        # Try loading existing index first
-        if os.path.exists(FAISS_INDEX_PATH) and os.listdir(FAISS_INDEX_PATH):
+        # Try loading existing index first (vectors are memory-mapped,
+        # chunk text is read from SQLite on demand)
+        if index_exists(FAISS_INDEX_PATH):
             try:
                 st.info("📦 Loading existing FAISS index...")
-                vector_store = FAISS.load_local(
-                    FAISS_INDEX_PATH,
-                    embeddings,
-                    allow_dangerous_deserialization=True
-                )
+                vector_store = load_index(FAISS_INDEX_PATH, embeddings)
                 st.success("✅ FAISS index loaded!")
+                record_startup("vector_store", start)
                 return vector_store
             except Exception as e:
                 st.warning(f"Could not load existing index: {e}. Building new one...")
+
+        # Legacy pickle index: only converted when explicitly trusted
+        vector_store = migrate_pickle_index(FAISS_INDEX_PATH, embeddings)
+        if vector_store is not None:
+            st.success("✅ Legacy FAISS index migrated!")
+            return vector_store
         
         # Build new index from Dataset
         st.info("🔄 Building FAISS index from Dataset...")
@@ -104,8 +138,9 @@ def load_or_build_vector_store():
         # Build FAISS index
         os.makedirs(FAISS_INDEX_PATH, exist_ok=True)
         vector_store = FAISS.from_documents(chunks, embeddings)
-        vector_store.save_local(FAISS_INDEX_PATH)
+        save_index(vector_store, FAISS_INDEX_PATH)
         st.success("✅ FAISS index built and saved!")
+        record_startup("vector_store", start)
         
         return vector_store
     except Exception as e:
@@ -114,31 +149,69 @@ def load_or_build_vector_store():
         st.error(traceback.format_exc())
         return None
 
-# Initialize vector store
-vector_store = load_or_build_vector_store()
-
 # ========================= LLM =========================
-llm = ChatGroq(
-    api_key=GROQ_API_KEY,
-    model="llama-3.1-8b-instant",
-    temperature=0.3
-)
+CHAT_MODEL = "llama-3.1-8b-instant"
+RAG_TOP_K = 4
+
+# "hybrid" fuses FAISS similarity with the BM25 index in faiss_index/
+# (reciprocal rank fusion); "dense" is similarity search only
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", "20"))
+HYBRID_DENSE_WEIGHT = float(os.getenv("HYBRID_DENSE_WEIGHT", "1.0"))
+HYBRID_SPARSE_WEIGHT = float(os.getenv("HYBRID_SPARSE_WEIGHT", "1.0"))
+
+# Contract-aware analysis: per-clause retrieval depth and prompt budgets
+CLAUSE_TOP_K = 3
+MAX_CLAUSES = 64
+CONTEXT_TOKEN_BUDGET = 2500
+CONTRACT_TOKEN_BUDGET = 3000
+
+@st.cache_resource
+def get_llm():
+    start = time.perf_counter()
+    from langchain_groq import ChatGroq
+
+    llm = ChatGroq(
+        api_key=GROQ_API_KEY,
+        model=CHAT_MODEL,
+        temperature=0.3
+    )
+    record_startup("llm", start)
+    return llm
+
+# ========================= PDF TOOLKIT =========================
+@st.cache_resource
+def get_pdf_toolkit():
+    """reportlab is only imported when a PDF is actually generated"""
+    start = time.perf_counter()
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+
+    toolkit = SimpleNamespace(
+        letter=letter,
+        getSampleStyleSheet=getSampleStyleSheet,
+        SimpleDocTemplate=SimpleDocTemplate,
+        Paragraph=Paragraph,
+        Spacer=Spacer,
+    )
+    record_startup("pdf_toolkit", start)
+    return toolkit
 
 # ========================= EMAIL FUNCTION =========================
 def convert_txt_to_pdf(txt_content: str, pdf_path: str) -> bool:
     """Convert text content to PDF file"""
     try:
-        from reportlab.lib import colors
-        from reportlab.platypus import Table, TableStyle
+        pdf = get_pdf_toolkit()
         
-        doc = SimpleDocTemplate(pdf_path, pagesize=letter, topMargin=0.5*72, bottomMargin=0.5*72)
+        doc = pdf.SimpleDocTemplate(pdf_path, pagesize=pdf.letter, topMargin=0.5*72, bottomMargin=0.5*72)
         story = []
-        styles = getSampleStyleSheet()
+        styles = pdf.getSampleStyleSheet()
         
         # Add title
         title_style = styles['Heading1']
-        story.append(Paragraph("AMENDED CONTRACT", title_style))
-        story.append(Spacer(1, 12))
+        story.append(pdf.Paragraph("AMENDED CONTRACT", title_style))
+        story.append(pdf.Spacer(1, 12))
         
         # Split content into paragraphs and create paragraphs with better styling
         paragraphs = txt_content.split("\n")
@@ -146,11 +219,11 @@ def convert_txt_to_pdf(txt_content: str, pdf_path: str) -> bool:
             clean_text = para_text.strip()
             if clean_text:
                 try:
-                    story.append(Paragraph(clean_text, styles['Normal']))
+                    story.append(pdf.Paragraph(clean_text, styles['Normal']))
                 except:
                     # Fallback for problematic text
-                    story.append(Paragraph(clean_text.replace('<', '&lt;').replace('>', '&gt;'), styles['Normal']))
-            story.append(Spacer(1, 6))
+                    story.append(pdf.Paragraph(clean_text.replace('<', '&lt;').replace('>', '&gt;'), styles['Normal']))
+            story.append(pdf.Spacer(1, 6))
         
         doc.build(story)
         st.info(f"📄 PDF created: {pdf_path}")
@@ -238,24 +311,142 @@ def send_email_with_attachment(recipient_email: str, subject: str, file_path: st
         st.error(traceback.format_exc())
         return False
 
+# ========================= RAG CACHE =========================
+@st.cache_resource
+def get_rag_cache():
+    from rag_cache import RagCache
+    return RagCache()
+
+
+@st.cache_resource
+def get_sparse_index():
+    """BM25 index next to the FAISS index (built from its docstore if missing)"""
+    start = time.perf_counter()
+    from sparse_index import open_sparse_index
+
+    sparse = open_sparse_index(FAISS_INDEX_PATH)
+    record_startup("sparse_index", start)
+    return sparse
+
+
+@st.cache_resource
+def get_reranker():
+    """Cross-encoder for RERANK=1 (None if sentence-transformers is unavailable)"""
+    start = time.perf_counter()
+    model = get_cross_encoder()
+    record_startup("reranker", start)
+    return model
+
+
+def retrieve_docs(vector_store, query: str, k: int = RAG_TOP_K):
+    """Hybrid or similarity search, reusing chunk IDs cached for this query and index"""
+    cache = get_rag_cache()
+    mode = RETRIEVAL_MODE
+
+    ids = cache.get_ids(query, k, mode)
+    if ids is not None:
+        docs = [vector_store.docstore.search(i) for i in ids]
+        if all(not isinstance(d, str) for d in docs):
+            instr.count("retrieval_cache", result="hit")
+            return docs
+
+    instr.count("retrieval_cache", result="miss")
+    with instr.stage("retrieve", mode=mode):
+        if mode == "hybrid":
+            from sparse_index import hybrid_search
+
+            # sync() re-indexes only if the FAISS index was rebuilt meanwhile
+            sparse = get_sparse_index().sync(FAISS_INDEX_PATH)
+            docs = hybrid_search(
+                vector_store, sparse, query, k=k,
+                fetch_k=HYBRID_FETCH_K,
+                dense_weight=HYBRID_DENSE_WEIGHT,
+                sparse_weight=HYBRID_SPARSE_WEIGHT,
+            )
+        else:
+            retriever = vector_store.as_retriever(
+                search_type="similarity",
+                search_kwargs={"k": k}
+            )
+            docs = retriever.invoke(query)
+
+    if docs and all(d.id for d in docs):
+        cache.put_ids(query, k, [d.id for d in docs], mode)
+    return docs
+
 # ========================= RAG FUNCTION =========================
-def run_rag(query: str) -> str:
+def stream_answer(prompt: str):
+    """Yield the LLM answer as it streams; cached answers are yielded whole"""
+    cache = get_rag_cache()
+    answer = cache.get_answer(prompt, CHAT_MODEL)
+    if answer is not None:
+        instr.count("answer_cache", result="hit")
+        st.session_state.answer_cached = True
+        yield answer
+        return
+
+    instr.count("answer_cache", result="miss")
+
+    from streaming import StreamStats, timed_stream
+
+    stats = StreamStats()
+    parts = []
+    handler = instr.callback_handler(CHAT_MODEL)
+    for piece in timed_stream(get_llm().stream(prompt, config={"callbacks": [handler]}), stats):
+        parts.append(piece)
+        yield piece
+
+    cache.put_answer(prompt, CHAT_MODEL, "".join(parts))
+    st.session_state.llm_stats = stats
+
+
+def reset_llm_stats():
+    """Forget the previous run's stats; only a streamed or cached answer sets them again"""
+    st.session_state.llm_stats = None
+    st.session_state.answer_cached = False
+
+
+def show_llm_stats():
+    stats = st.session_state.get("llm_stats")
+    if stats is not None:
+        st.caption(f"⏱ {stats.summary()}")
+    elif st.session_state.get("answer_cached"):
+        st.caption("⚡ Served from cache")
+
+
+def run_rag(query: str, stream: bool = False):
+    """Answer `query`; with stream=True returns a generator of text pieces"""
+    pieces = iter_rag(query)
+    return pieces if stream else "".join(pieces)
+
+
+def iter_rag(query: str):
+    from index_store import index_version
+
+    reset_llm_stats()
+
+    # A rebuilt index invalidates both the loaded store and cached retrievals
+    if get_rag_cache().check_index(index_version(FAISS_INDEX_PATH)):
+        load_or_build_vector_store.clear()
+
+    vector_store = load_or_build_vector_store()
     if vector_store is None:
-        return "Error: Vector store not loaded. Please check FAISS index."
-    
-    retriever = vector_store.as_retriever(
-        search_type="similarity",
-        search_kwargs={"k": 4}
-    )
+        yield "Error: Vector store not loaded. Please check FAISS index."
+        return
 
-    docs = retriever.invoke(query)
+    # With reranking on, over-fetch and let the cross-encoder pick RAG_TOP_K
+    docs = retrieve_docs(vector_store, query, k=RERANK_FETCH_K if RERANK else RAG_TOP_K)
 
     if not docs:
-        return "No relevant regulatory information found."
+        yield "No relevant regulatory information found."
+        return
 
-    context = "\n\n".join([doc.page_content for doc in docs])
+    if RERANK:
+        get_reranker()
+    with instr.stage("prompt_build"):
+        context, _ = select_context(query, docs, budget=CONTEXT_TOKEN_BUDGET, top_k=RAG_TOP_K)
 
-    prompt = f"""
+        prompt = f"""
 You are a regulatory compliance expert.
 
 Context:
@@ -267,8 +458,146 @@ Question:
 Provide a clear, professional answer.
 """
 
-    response = llm.invoke(prompt)
-    return response.content
+    yield from stream_answer(prompt)
+
+# ========================= CONTRACT-AWARE RAG =========================
+CLAUSE_RE = re.compile(r"^\s*(?:\d+(?:\.\d+)*[.)]|Clause\s+\d+|Section\s+\d+)", re.IGNORECASE)
+
+
+def split_clauses(text: str) -> list:
+    """Split a contract into numbered clauses, falling back to paragraphs"""
+    clauses, current = [], []
+    for line in text.splitlines():
+        if CLAUSE_RE.match(line) and current:
+            clauses.append("\n".join(current).strip())
+            current = []
+        current.append(line)
+    if current:
+        clauses.append("\n".join(current).strip())
+
+    if len(clauses) <= 1:
+        clauses = [p.strip() for p in text.split("\n\n")]
+
+    max_chars = 1000
+    pieces = []
+    for clause in clauses:
+        for start in range(0, len(clause), max_chars):
+            piece = clause[start:start + max_chars].strip()
+            if piece:
+                pieces.append(piece)
+    return pieces[:MAX_CLAUSES]
+
+
+def truncate_tokens(text: str, budget: int) -> str:
+    max_chars = budget * instr.CHARS_PER_TOKEN
+    return text if len(text) <= max_chars else text[:max_chars] + "\n[...truncated]"
+
+
+def retrieve_for_clauses(vector_store, clauses: list, k: int = CLAUSE_TOP_K):
+    """
+    Embed all clauses in one batch and run a single multi-query FAISS
+    search. Returns documents deduplicated by ID, best match first.
+    Chunk IDs are cached per clause list and index version, so revisiting
+    a page for the same contract skips both.
+    """
+    import numpy as np
+
+    cache = get_rag_cache()
+    ids = cache.get_clause_ids(clauses, k)
+    if ids is not None:
+        docs = [vector_store.docstore.search(i) for i in ids]
+        if all(not isinstance(d, str) for d in docs):
+            instr.count("retrieval_cache", result="hit")
+            return docs
+
+    instr.count("retrieval_cache", result="miss")
+
+    # Uploaded clauses go straight to the model: the disk cache is for
+    # corpus chunks, not one-off user text
+    vectors = np.asarray(get_embeddings().base.embed_documents(clauses), dtype=np.float32)
+    distances, positions = vector_store.index.search(vectors, k)
+
+    best = {}
+    for row_d, row_p in zip(distances, positions):
+        for dist, pos in zip(row_d, row_p):
+            if pos == -1:
+                continue
+            doc_id = vector_store.index_to_docstore_id[int(pos)]
+            if doc_id not in best or dist < best[doc_id]:
+                best[doc_id] = float(dist)
+
+    docs, ids = [], []
+    for doc_id in sorted(best, key=best.get):
+        doc = vector_store.docstore.search(doc_id)
+        if not isinstance(doc, str):
+            docs.append(doc)
+            ids.append(doc_id)
+    cache.put_clause_ids(clauses, k, ids)
+    return docs
+
+
+def pack_context(docs, budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """Join chunks in relevance order, minus overlapping spans, within the token budget"""
+    context, _ = select_context("", docs, budget=budget, use_rerank=False)
+    return context
+
+
+def analyze_contract(contract_text: str, task: str, stream: bool = False):
+    """
+    Answer `task` about the uploaded contract: one embedding batch and
+    one FAISS search for all of its clauses, then a single LLM call.
+    With stream=True returns a generator of text pieces.
+    """
+    pieces = iter_contract_analysis(contract_text, task)
+    return pieces if stream else "".join(pieces)
+
+
+def iter_contract_analysis(contract_text: str, task: str):
+    from index_store import index_version
+
+    reset_llm_stats()
+
+    if get_rag_cache().check_index(index_version(FAISS_INDEX_PATH)):
+        load_or_build_vector_store.clear()
+
+    vector_store = load_or_build_vector_store()
+    if vector_store is None:
+        yield "Error: Vector store not loaded. Please check FAISS index."
+        return
+
+    with instr.stage("split_clauses"):
+        clauses = split_clauses(contract_text)
+    if not clauses:
+        yield "The uploaded contract is empty."
+        return
+
+    with instr.stage("retrieve"):
+        docs = retrieve_for_clauses(vector_store, clauses)
+    if not docs:
+        yield "No relevant regulatory information found."
+        return
+
+    with instr.stage("prompt_build"):
+        context = pack_context(docs)
+        contract = truncate_tokens(contract_text.strip(), CONTRACT_TOKEN_BUDGET)
+
+        prompt = f"""
+You are a regulatory compliance expert.
+
+Regulatory context:
+{context}
+
+Contract:
+{contract}
+
+Task:
+{task}
+
+Base your answer on the contract and the regulatory context. Refer to
+contract clauses by number where possible. Provide a clear, professional answer.
+"""
+
+    yield from stream_answer(prompt)
 
 # ========================= SIDEBAR =========================
 st.sidebar.title("📌 Navigation")
@@ -305,6 +634,20 @@ if page == "Dashboard":
 ✔ AI chatbot support  
 """)
 
+    timings = startup_timings()
+    if timings:
+        with st.expander("⏱ Startup timings (this process)"):
+            for name, seconds in timings.items():
+                st.write(f"{name}: {seconds:.3f}s")
+
+    snapshot = instr.metrics.snapshot()
+    if snapshot["timings"]:
+        with st.expander("📈 Pipeline metrics (this process)"):
+            st.table([
+                {"stage": name, **values} for name, values in snapshot["timings"].items()
+            ])
+            st.json(snapshot["counters"])
+
 # ==========================================================
 # UPLOAD CONTRACT
 # ==========================================================
@@ -334,13 +677,14 @@ elif page == "RAG Compliance Analysis":
         st.warning("Upload a contract first")
         st.stop()
 
-    with st.spinner("Analyzing contract against regulations..."):
-        result = run_rag(
-            "Analyze this contract for compliance issues and missing regulatory clauses"
-        )
-
     st.subheader("Compliance Findings")
-    st.info(result)
+    with st.container(border=True):
+        st.write_stream(analyze_contract(
+            st.session_state.contract_text,
+            "Analyze this contract for compliance issues and missing regulatory clauses",
+            stream=True
+        ))
+    show_llm_stats()
 
 # ==========================================================
 # RISK ASSESSMENT (AI BASED – CORRECT)
@@ -352,13 +696,14 @@ elif page == "Risk Assessment":
         st.warning("Upload a contract first")
         st.stop()
 
-    with st.spinner("Assessing risks..."):
-        risk = run_rag(
-            "Assess legal, financial, and operational risks in this contract"
-        )
-
     st.subheader("Risk Report")
-    st.warning(risk)
+    with st.container(border=True):
+        st.write_stream(analyze_contract(
+            st.session_state.contract_text,
+            "Assess legal, financial, and operational risks in this contract",
+            stream=True
+        ))
+    show_llm_stats()
 
 # ==========================================================
 # AMENDMENT GENERATOR
@@ -371,10 +716,13 @@ elif page == "Amendment Generator":
         st.stop()
 
     if st.button("Generate Amendments"):
-        with st.spinner("Generating compliant clauses..."):
-            amendments = run_rag(
-                "Generate missing compliance clauses to amend this contract"
-            )
+        with st.container(border=True):
+            amendments = st.write_stream(analyze_contract(
+                st.session_state.contract_text,
+                "Generate missing compliance clauses to amend this contract",
+                stream=True
+            ))
+        show_llm_stats()
 
         amended_text = (
             st.session_state.contract_text
@@ -462,8 +810,6 @@ elif page == "AI Chatbot":
         if question.strip() == "":
             st.warning("Enter a question")
         else:
-            with st.spinner("Thinking..."):
-                answer = run_rag(question)
-
             st.success("AI Response")
-            st.write(answer)
+            st.write_stream(run_rag(question, stream=True))
+            show_llm_stats()
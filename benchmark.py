@@ -0,0 +1,453 @@
+# benchmark.py
+"""
+Offline benchmark for the RAG and regulatory pipelines.
+
+Times split_docs, embedding (cold and warm cache), build_faiss,
+similarity vs MMR vs hybrid retrieval, a stubbed LLM stream and
+regulatory.relevance on a synthetically scaled copy of Dataset.txt.
+Each metric is the median of --repeat full runs (5 by default), each in
+a fresh scratch directory. Results are written as JSON and compared
+against a stored baseline.
+
+    python benchmark.py --scale 4                 # run + compare
+    python benchmark.py --scale 4 --save-baseline # store as baseline
+
+bench_results/baseline.json is committed and was recorded with
+`--embeddings fake` at scale 1 (no model download needed). Timings are
+machine-specific: after a deliberate performance change, or on a new
+CI runner, refresh it with
+
+    python benchmark.py --embeddings fake --save-baseline
+
+and commit the file. Compare runs use the same flags; a config
+mismatch is reported before the metric table.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+from pathlib import Path
+from datetime import datetime
+from contextlib import contextmanager
+
+# Never reach the network for model files during a benchmark
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.language_models.chat_models import BaseChatModel
+
+import rag_system
+import regulatory
+from embedding_cache import CachedEmbeddings
+from mmr import VectorMMR
+from sparse_index import hybrid_search, open_sparse_index
+from streaming import StreamStats, timed_stream
+
+
+# ---------------- CONFIG ----------------
+
+CORPUS_FILE = Path(os.getenv("BENCH_CORPUS", "Dataset/Dataset.txt"))
+REG_FILE = Path("Dataset/regulations.json")
+BENCH_DIR = Path(os.getenv("BENCH_DIR", "bench_results"))
+BASELINE_FILE = BENCH_DIR / "baseline.json"
+RESULT_FILE = BENCH_DIR / "latest.json"
+TOLERANCE = float(os.getenv("BENCH_TOLERANCE", "0.20"))   # 20% slower (median) = regression
+REPEAT = int(os.getenv("BENCH_REPEAT", "5"))
+
+HEADER_RE = re.compile(r"^Contract #(\w+)\s*\|\s*([^|]+)\|\s*(.+?)\s*↔\s*(.+?)\s*\|", re.M)
+JURISDICTIONS = ["EU", "IN", "US", "GLOBAL"]
+
+
+# -------------- SYNTHETIC CORPUS --------------
+def load_contracts(path=CORPUS_FILE):
+    """Split Dataset.txt into contract texts on the "=====" title rules."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    parts = re.split(r"(?m)^=+\n(?=Contract #)", text)
+    return ["=" * 71 + "\n" + p.strip() for p in parts if HEADER_RE.search(p)]
+
+
+def scale_corpus(contracts, scale, seed=0):
+    """
+    Return `scale` copies of the corpus. Copies after the first get new
+    contract numbers and swapped party names, so chunk texts differ and
+    the embedding cache cannot short-circuit the work.
+    """
+    rng = random.Random(seed)
+    parties = sorted({
+        name.strip()
+        for c in contracts
+        for m in [HEADER_RE.search(c)]
+        for name in (m.group(3), m.group(4))
+    })
+
+    docs = []
+    for r in range(scale):
+        for c in contracts:
+            m = HEADER_RE.search(c)
+            text = c
+            if r:
+                for old in (m.group(3).strip(), m.group(4).strip()):
+                    text = text.replace(old, rng.choice(parties))
+                text = text.replace(f"Contract #{m.group(1)}", f"Contract #{m.group(1)}-{r}", 1)
+            docs.append(Document(
+                page_content=text,
+                metadata={"source": f"synthetic/{m.group(1)}-{r}.txt", "copy": r},
+            ))
+    return docs
+
+
+# -------------- STUB LLM --------------
+class StubChatModel(BaseChatModel):
+    """Deterministic chat model with a fixed time-to-first-token and per-token delay."""
+
+    reply: str = "Compliance summary: obligations met; review the data protection clause. " * 20
+    first_token_latency: float = 0.2
+    token_latency: float = 0.005
+
+    @property
+    def _llm_type(self):
+        return "stub"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = "".join(c.message.content for c in self._stream(messages))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.first_token_latency)
+        for i, word in enumerate(self.reply.split(" ")):
+            if i:
+                time.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+
+# -------------- HELPERS --------------
+def timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - t0
+
+
+def latency_stats(samples, prefix):
+    arr = np.asarray(samples)
+    return {
+        f"{prefix}.mean_s": float(arr.mean()),
+        f"{prefix}.p50_s": float(np.percentile(arr, 50)),
+        f"{prefix}.p95_s": float(np.percentile(arr, 95)),
+        f"{prefix}.queries_per_sec": float(len(arr) / arr.sum()),
+    }
+
+
+def sample_queries(chunks, n, seed=0):
+    rng = random.Random(seed)
+    picks = rng.sample(chunks, min(n - 1, len(chunks)))
+    # First sentence-ish slice of a chunk reads like a user question
+    return [rag_system.QUESTION] + [c.page_content[:200] for c in picks]
+
+
+def make_base_embeddings(kind):
+    if kind == "fake":
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        return DeterministicFakeEmbedding(size=384)
+    return rag_system.HuggingFaceEmbeddings(model_name=rag_system.EMBED_MODEL)
+
+
+# -------------- STAGES --------------
+def bench_split(docs):
+    chunks, secs = timed(rag_system.split_docs, docs)
+    return chunks, {
+        "split_docs.total_s": secs,
+        "split_docs.chunks": len(chunks),
+        "split_docs.chunks_per_sec": len(chunks) / secs,
+    }
+
+
+def bench_embeddings(embeddings, chunks):
+    texts = [c.page_content for c in chunks]
+    _, cold = timed(embeddings.embed_documents, texts)
+    _, warm = timed(embeddings.embed_documents, texts)
+    return {
+        "embed.cold_s": cold,
+        "embed.cold_chunks_per_sec": len(texts) / cold,
+        "embed.warm_s": warm,
+        "embed.warm_chunks_per_sec": len(texts) / warm,
+    }
+
+
+@contextmanager
+def scratch_index(workdir, embeddings=None):
+    """
+    Point rag_system at workdir/faiss_index, so nothing reads or writes
+    the user's ./faiss_index. Restored on exit.
+    """
+    saved = {k: getattr(rag_system, k) for k in
+             ("INDEX_PATH", "ANN_INDEX_FILE", "INDEX_CONFIG_FILE", "REBUILD_INDEX", "_embeddings")}
+    index_path = Path(workdir) / "faiss_index"
+    rag_system.INDEX_PATH = index_path
+    rag_system.ANN_INDEX_FILE = index_path / "index.ann.faiss"
+    rag_system.INDEX_CONFIG_FILE = index_path / "index_config.json"
+    rag_system.REBUILD_INDEX = True
+    if embeddings is not None:
+        rag_system._embeddings = embeddings
+    try:
+        index_path.mkdir(parents=True, exist_ok=True)
+        yield index_path
+    finally:
+        for k, v in saved.items():
+            setattr(rag_system, k, v)
+
+
+def bench_build(embeddings, chunks, workdir):
+    """build_faiss into a scratch index directory (embeddings already cached)."""
+    with scratch_index(workdir, embeddings):
+        vs, secs = timed(rag_system.build_faiss, chunks)
+    return vs, {
+        "build_faiss.total_s": secs,
+        "build_faiss.vectors": vs.index.ntotal,
+    }
+
+
+def bench_retrieval(vs, queries, index_path):
+    metrics = {}
+    for search_type in ("similarity", "mmr"):
+        retriever = vs.as_retriever(search_type=search_type, search_kwargs={"k": rag_system.TOP_K})
+        retriever.invoke(queries[0])  # warm-up
+        samples = [timed(retriever.invoke, q)[1] for q in queries]
+        metrics.update(latency_stats(samples, f"retrieve.{search_type}"))
+
+    mmr = VectorMMR(vs)
+    mmr.search(queries[0])
+    samples = [timed(mmr.search, q)[1] for q in queries]
+    metrics.update(latency_stats(samples, "retrieve.mmr_numpy"))
+    mmr = VectorMMR(vs)
+    _, secs = timed(mmr.search_batch, queries)
+    metrics["retrieve.mmr_numpy_batch.per_query_s"] = secs / len(queries)
+
+    sparse = open_sparse_index(index_path)
+    search = lambda q: hybrid_search(vs, sparse, q, k=rag_system.TOP_K,
+                                     fetch_k=rag_system.HYBRID_FETCH_K)
+    search(queries[0])
+    samples = [timed(search, q)[1] for q in queries]
+    metrics.update(latency_stats(samples, "retrieve.hybrid"))
+    return metrics
+
+
+def bench_llm(vs, runs, workdir):
+    # The retriever opens the BM25 index next to INDEX_PATH: use the scratch one
+    with scratch_index(workdir):
+        chain = rag_system.make_chain(rag_system.get_retriever(vs), llm=StubChatModel())
+    ttft, total, rate = [], [], []
+    for _ in range(runs):
+        stats = StreamStats()
+        for _ in timed_stream(chain.stream(rag_system.QUESTION), stats):
+            pass
+        ttft.append(stats.ttft)
+        total.append(stats.elapsed)
+        rate.append(stats.tokens_per_sec)
+    return {
+        "llm_stub.ttft_s": float(np.mean(ttft)),
+        "llm_stub.total_s": float(np.mean(total)),
+        "llm_stub.tokens_per_sec": float(np.mean(rate)),
+    }
+
+
+def bench_relevance(docs, n_mock, seed=0):
+    """relevance() over every contract x regulation pair vs the keyword index."""
+    rng = random.Random(seed)
+    with open(REG_FILE, "r") as f:
+        regs = json.load(f)
+    random.seed(seed)  # mock_regulation() draws from the global RNG
+    regs += [regulatory.mock_regulation() for _ in range(n_mock)]
+
+    contracts = [
+        ({"jurisdiction": rng.choice(JURISDICTIONS)}, d.page_content.lower()) for d in docs
+    ]
+    pairs = len(contracts) * len(regs)
+
+    def naive():
+        for meta, text in contracts:
+            for reg in regs:
+                regulatory.relevance(reg, meta, text)
+
+    def indexed():
+        index = regulatory.RegulationIndex(regs)
+        for meta, text in contracts:
+            index.analyse(meta, text)
+
+    _, naive_s = timed(naive)
+    _, indexed_s = timed(indexed)
+    return {
+        "relevance.naive_s": naive_s,
+        "relevance.naive_pairs_per_sec": pairs / naive_s,
+        "relevance.indexed_s": indexed_s,
+        "relevance.indexed_pairs_per_sec": pairs / indexed_s,
+    }
+
+
+# -------------- BASELINE --------------
+def lower_is_better(name):
+    return name.endswith("_s")
+
+
+def compare(current, baseline, tolerance=TOLERANCE):
+    """Print per-metric change vs baseline; return the names that regressed."""
+    regressions = []
+    print(f"\n{'metric':40} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, value in current["metrics"].items():
+        base = baseline["metrics"].get(name)
+        if not base or not (name.endswith("_s") or name.endswith("_per_sec")):
+            continue
+        change = (value - base) / base
+        worse = change > tolerance if lower_is_better(name) else change < -tolerance
+        flag = "  ❌" if worse else ""
+        print(f"{name:40} {base:12.4f} {value:12.4f} {change:+8.1%}{flag}")
+        if worse:
+            regressions.append(name)
+
+    if current["config"] != baseline.get("config"):
+        print("⚠ Config differs from baseline:", json.dumps(baseline.get("config")))
+    return regressions
+
+
+def write_json(path, data):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+# -------------- MAIN --------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmark")
+    parser.add_argument("--scale", type=int, default=1, help="copies of the 500-contract corpus")
+    parser.add_argument("--embeddings", choices=["hf", "fake"], default="hf",
+                        help="hf: locally cached sentence-transformers model; fake: hash vectors")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--llm-runs", type=int, default=3)
+    parser.add_argument("--mock-regs", type=int, default=500,
+                        help="extra synthetic regulations (the keyword index pays off from ~200)")
+    parser.add_argument("--repeat", type=int, default=REPEAT,
+                        help="full runs; each metric is the median across them")
+    parser.add_argument("--stages", nargs="*",
+                        default=["split", "embed", "build", "retrieve", "llm", "relevance"])
+    parser.add_argument("--output", default=str(RESULT_FILE))
+    parser.add_argument("--baseline", default=str(BASELINE_FILE))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--fail-on-regression", action="store_true")
+    return parser.parse_args(argv)
+
+
+def run_stages(args, docs, workdir):
+    """One pass over the selected stages in a fresh `workdir` (cold caches)."""
+    stages = set(args.stages)
+    metrics = {}
+
+    print("✂ split_docs...")
+    chunks, m = bench_split(docs)
+    metrics.update(m)
+
+    embeddings = CachedEmbeddings(
+        make_base_embeddings(args.embeddings), rag_system.EMBED_MODEL, workdir / "embed_cache"
+    )
+    if "embed" in stages or {"build", "retrieve", "llm"} & stages:
+        print(f"🧮 embedding {len(chunks)} chunks...")
+        metrics.update(bench_embeddings(embeddings, chunks))
+
+    vs = None
+    if {"build", "retrieve", "llm"} & stages:
+        print("🏗 build_faiss...")
+        vs, m = bench_build(embeddings, chunks, workdir)
+        metrics.update(m)
+
+    if "retrieve" in stages:
+        print(f"🔍 retrieval ({args.queries} queries, similarity vs mmr vs hybrid)...")
+        metrics.update(bench_retrieval(
+            vs, sample_queries(chunks, args.queries), workdir / "faiss_index"
+        ))
+
+    if "llm" in stages:
+        print("💬 stub LLM chain...")
+        metrics.update(bench_llm(vs, args.llm_runs, workdir))
+
+    if "relevance" in stages:
+        print(f"⚖ regulatory relevance ({args.mock_regs} mock regulations)...")
+        metrics.update(bench_relevance(docs, args.mock_regs))
+    return metrics
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    docs = scale_corpus(load_contracts(), args.scale)
+    print(f"📄 {len(docs)} synthetic contracts (scale {args.scale})")
+
+    result = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "host": {"python": platform.python_version(), "platform": platform.platform(),
+                 "cpus": os.cpu_count()},
+        "config": {
+            "scale": args.scale,
+            "embeddings": args.embeddings,
+            "chunk_size": rag_system.CHUNK_SIZE,
+            "chunk_overlap": rag_system.CHUNK_OVERLAP,
+            "top_k": rag_system.TOP_K,
+            "index_type": rag_system.INDEX_TYPE,
+            "mock_regs": args.mock_regs,
+            "repeat": args.repeat,
+        },
+        "metrics": {},
+    }
+
+    # Single runs of sub-millisecond stages vary by more than the
+    # tolerance; the median of several runs does not
+    runs = []
+    for i in range(max(1, args.repeat)):
+        print(f"\n▶ run {i + 1}/{max(1, args.repeat)}")
+        workdir = Path(tempfile.mkdtemp(prefix="bench_"))
+        try:
+            runs.append(run_stages(args, docs, workdir))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    result["metrics"] = {
+        name: float(np.median([run[name] for run in runs])) for name in runs[0]
+    }
+
+    write_json(args.output, result)
+    print(f"\n✅ Results written to {args.output}")
+
+    if args.save_baseline:
+        write_json(args.baseline, result)
+        print(f"📌 Baseline saved to {args.baseline}")
+        return
+
+    if not Path(args.baseline).exists():
+        print(f"ℹ No baseline at {args.baseline}; run with --save-baseline to create one")
+        return
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(result, baseline, args.tolerance)
+    if regressions:
+        print(f"\n❌ {len(regressions)} metrics regressed beyond {args.tolerance:.0%}")
+        if args.fail_on_regression:
+            sys.exit(1)
+    else:
+        print("\n✅ No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
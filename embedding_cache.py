@@ -0,0 +1,222 @@
+# embedding_cache.py
+"""
+Disk-backed embedding cache shared by rag_system.py and app_streamlit.py.
+
+Vectors are stored in one float32 matrix file that is memory-mapped for
+reads, plus an append-only list of chunk hashes giving each row.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+# ---------------- CONFIG ----------------
+
+EMBED_CACHE_DIR = Path(os.getenv("EMBED_CACHE_DIR", ".embedding_cache"))
+
+
+def text_hash(text: str):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# -------------- FILE LOCK --------------
+@contextmanager
+def file_lock(path: Path):
+    """Exclusive lock on `path` across processes (fcntl, or msvcrt on Windows)."""
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# -------------- STORAGE --------------
+class EmbeddingCache:
+    """
+    hash -> row index over a memory-mapped float32 matrix.
+
+    Each line of keys.txt is "<hash> <row>". Writers hold a file lock,
+    append the vectors, take their row numbers from the size of
+    vectors.f32 and only then append the keys, so a crash or another
+    process appending to the same files can never shift a key onto the
+    wrong vector. Rows no key points to (a crash between the two writes)
+    are cut off on load.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.vectors_file = self.directory / "vectors.f32"
+        self.keys_file = self.directory / "keys.txt"
+        self.meta_file = self.directory / "meta.json"
+        self.lock_file = self.directory / "lock"
+
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._keys_offset = 0   # bytes of keys.txt already read
+        self._key_lines = 0     # lines read, for the legacy one-hash-per-line format
+        self.rows = {}
+        self.dim = None
+
+        with file_lock(self.lock_file):
+            self._load_dim()
+            self._refresh()
+            self._trim_orphans()
+
+    def _load_dim(self):
+        if self.dim is None and self.meta_file.exists():
+            with open(self.meta_file, "r", encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+
+    def _row_bytes(self):
+        return 4 * self.dim
+
+    def _n_vectors(self):
+        try:
+            return self.vectors_file.stat().st_size // self._row_bytes()
+        except FileNotFoundError:
+            return 0
+
+    def _refresh(self):
+        """Pick up keys appended since the last read (by us or another process)."""
+        if not self.keys_file.exists():
+            return
+        with open(self.keys_file, "rb") as f:
+            f.seek(self._keys_offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1  # ignore a line still being written
+        for line in data[:end].decode("utf-8").splitlines():
+            parts = line.split()
+            if len(parts) == 2:
+                self.rows[parts[0]] = int(parts[1])
+            elif len(parts) == 1:
+                self.rows[parts[0]] = self._key_lines
+            self._key_lines += 1
+        self._keys_offset += end
+
+    def _trim_orphans(self):
+        """Cut vectors.f32 back to the last row a key points to (call under the file lock)."""
+        if self.dim is None or not self.vectors_file.exists():
+            return
+        n_vectors = self._n_vectors()
+        self.rows = {h: r for h, r in self.rows.items() if r < n_vectors}
+        keep = (max(self.rows.values()) + 1 if self.rows else 0) * self._row_bytes()
+        if self.vectors_file.stat().st_size > keep:
+            os.truncate(self.vectors_file, keep)
+            self._matrix = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _view(self, max_row):
+        if self._matrix is None or self._matrix.shape[0] <= max_row:
+            self._matrix = np.memmap(
+                self.vectors_file, dtype=np.float32, mode="r",
+                shape=(self._n_vectors(), self.dim),
+            )
+        return self._matrix
+
+    def get_many(self, hashes):
+        """Return {hash: vector} for the hashes present in the cache."""
+        with self._lock:
+            if any(h not in self.rows for h in hashes):
+                self._refresh()
+            found = {h: self.rows[h] for h in hashes if h in self.rows}
+            if not found:
+                return {}
+            matrix = self._view(max(found.values()))
+            return {h: np.array(matrix[row]) for h, row in found.items()}
+
+    def add_many(self, hashes, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not len(hashes):
+            return
+
+        with self._lock, file_lock(self.lock_file):
+            self._load_dim()
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                with open(self.meta_file, "w", encoding="utf-8") as f:
+                    json.dump({"dim": self.dim}, f)
+
+            self._refresh()
+            fresh = list({h: i for i, h in enumerate(hashes) if h not in self.rows}.values())
+            if not fresh:
+                return
+
+            # Drop a partial row left by a crash, then append after the real end
+            first = self._n_vectors()
+            if self.vectors_file.exists() and self.vectors_file.stat().st_size != first * self._row_bytes():
+                os.truncate(self.vectors_file, first * self._row_bytes())
+
+            with open(self.vectors_file, "ab") as f:
+                f.write(vectors[fresh].tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            lines = "".join(f"{hashes[i]} {first + n}\n" for n, i in enumerate(fresh))
+            with open(self.keys_file, "a", encoding="utf-8") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            self._refresh()
+
+
+# -------------- EMBEDDINGS WRAPPER --------------
+class CachedEmbeddings(Embeddings):
+    """
+    Wrap an Embeddings object so document vectors are computed once per
+    unique chunk text and model, then reused across runs and entry points.
+    """
+
+    def __init__(self, base: Embeddings, model_name: str, cache_dir: Path = EMBED_CACHE_DIR):
+        self.base = base
+        self.model_name = model_name
+        slug = model_name.replace("/", "__")
+        self.cache = EmbeddingCache(Path(cache_dir) / slug)
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts):
+        hashes = [text_hash(t) for t in texts]
+        found = self.cache.get_many(hashes)
+
+        missing = {}
+        for h, t in zip(hashes, texts):
+            if h not in found and h not in missing:
+                missing[h] = t
+
+        self.hits += len(texts) - sum(1 for h in hashes if h not in found)
+        self.misses += len(missing)
+
+        if missing:
+            vectors = self.base.embed_documents(list(missing.values()))
+            self.cache.add_many(list(missing.keys()), vectors)
+            found.update(zip(missing.keys(), np.asarray(vectors, dtype=np.float32)))
+
+        return [found[h].tolist() for h in hashes]
+
+    def embed_query(self, text):
+        return self.base.embed_query(text)
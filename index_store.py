@@ -0,0 +1,248 @@
+# index_store.py
+"""
+Pickle-free persistence for the LangChain FAISS vector store.
+
+Layout of an index directory:
+    index.faiss      FAISS vectors (memory-mapped on read-only loads)
+    docstore.sqlite  chunk text + metadata by ID, and position -> ID map
+
+Documents are read from SQLite lazily by ID, so loading an index costs
+the same whatever the corpus size, and nothing is ever unpickled.
+"""
+
+import os
+import json
+import sqlite3
+from pathlib import Path
+from collections.abc import MutableMapping
+
+import faiss
+from langchain_core.documents import Document
+from langchain_community.docstore.base import Docstore, AddableMixin
+from langchain_community.vectorstores import FAISS
+
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.sqlite"
+LEGACY_PICKLE = "index.pkl"
+
+
+def connect(path: Path):
+    conn = sqlite3.connect(str(path), check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS docs ("
+        "id TEXT PRIMARY KEY, text TEXT NOT NULL, metadata TEXT NOT NULL)"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS positions (pos INTEGER PRIMARY KEY, id TEXT NOT NULL)"
+    )
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.commit()
+    return conn
+
+
+# -------------- LAZY DOCSTORE --------------
+class SqliteDocstore(Docstore, AddableMixin):
+    """
+    Docstore reading documents from SQLite on demand.
+    Adds and deletes are buffered in memory until `save_index` commits
+    them together with the vectors.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.added = {}
+        self.deleted = set()
+
+    def search(self, search: str):
+        if search in self.added:
+            return self.added[search]
+        if search in self.deleted:
+            return f"ID {search} not found."
+
+        row = self.conn.execute(
+            "SELECT text, metadata FROM docs WHERE id = ?", (search,)
+        ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def add(self, texts):
+        for id_, doc in texts.items():
+            self.deleted.discard(id_)
+            self.added[id_] = doc
+
+    def delete(self, ids):
+        for id_ in ids:
+            self.added.pop(id_, None)
+            self.deleted.add(id_)
+
+
+class PositionMap(MutableMapping):
+    """
+    FAISS position -> docstore ID, backed by SQLite plus an in-memory
+    overlay. Assignments and deletions are written by `save_index`.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.base_len = conn.execute("SELECT COUNT(*) FROM positions").fetchone()[0]
+        self.overlay = {}
+        self.removed = set()
+
+    def __getitem__(self, pos):
+        pos = int(pos)
+        if pos in self.removed:
+            raise KeyError(pos)
+        if pos in self.overlay:
+            return self.overlay[pos]
+        row = self.conn.execute("SELECT id FROM positions WHERE pos = ?", (pos,)).fetchone()
+        if row is None:
+            raise KeyError(pos)
+        return row[0]
+
+    def __setitem__(self, pos, id_):
+        pos = int(pos)
+        self.removed.discard(pos)
+        self.overlay[pos] = id_
+
+    def __delitem__(self, pos):
+        pos = int(pos)
+        self[pos]  # KeyError if absent
+        self.overlay.pop(pos, None)
+        if pos < self.base_len:
+            self.removed.add(pos)
+
+    def __len__(self):
+        return (self.base_len - len(self.removed)
+                + sum(1 for p in self.overlay if p >= self.base_len))
+
+    def __iter__(self):
+        for (pos,) in self.conn.execute("SELECT pos FROM positions ORDER BY pos"):
+            if pos not in self.removed:
+                yield pos
+        for pos in sorted(self.overlay):
+            if pos >= self.base_len:
+                yield pos
+
+
+# -------------- SAVE / LOAD --------------
+def index_exists(path: Path):
+    path = Path(path)
+    return (path / INDEX_FILE).exists() and (path / DOCSTORE_FILE).exists()
+
+
+def index_version(path: Path):
+    """Cheap fingerprint of the saved vectors; changes on every save."""
+    try:
+        st = (Path(path) / INDEX_FILE).stat()
+    except FileNotFoundError:
+        return None
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+
+def save_index(vs, path: Path):
+    """
+    Persist `vs` without pickle. The FAISS file is written to a temp
+    name and swapped in after the SQLite transaction commits.
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+    tmp_index = path / (INDEX_FILE + ".tmp")
+    faiss.write_index(vs.index, str(tmp_index))
+
+    store, positions = vs.docstore, vs.index_to_docstore_id
+    own_store = isinstance(store, SqliteDocstore)
+    conn = store.conn if own_store else connect(path / DOCSTORE_FILE)
+
+    with conn:
+        if own_store:
+            conn.executemany("DELETE FROM docs WHERE id = ?", ((i,) for i in store.deleted))
+            new_docs = store.added.items()
+        else:
+            conn.execute("DELETE FROM docs")
+            new_docs = ((i, store.search(i)) for i in positions.values())
+
+        conn.executemany(
+            "INSERT OR REPLACE INTO docs (id, text, metadata) VALUES (?, ?, ?)",
+            (
+                (i, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False))
+                for i, doc in new_docs
+            ),
+        )
+
+        if isinstance(positions, PositionMap):
+            conn.executemany("DELETE FROM positions WHERE pos = ?", ((p,) for p in positions.removed))
+            rows = ((p, i) for p, i in positions.overlay.items())
+        else:
+            conn.execute("DELETE FROM positions")
+            rows = positions.items()
+        conn.executemany("INSERT OR REPLACE INTO positions (pos, id) VALUES (?, ?)", rows)
+
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('ntotal', ?)",
+            (str(vs.index.ntotal),),
+        )
+
+    os.replace(tmp_index, path / INDEX_FILE)
+
+    # Point the live store at what was just committed
+    if own_store:
+        store.added.clear()
+        store.deleted.clear()
+    else:
+        vs.docstore = SqliteDocstore(conn)
+    vs.index_to_docstore_id = PositionMap(conn)
+
+
+def read_faiss(path: Path, mmap=True):
+    if mmap:
+        try:
+            return faiss.read_index(str(path), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            pass  # index type without mmap support
+    return faiss.read_index(str(path))
+
+
+def load_index(path: Path, embeddings, mmap=True):
+    """
+    Open a saved index. With `mmap=True` the vectors are memory-mapped
+    read-only; pass `mmap=False` when the index will be updated.
+    """
+    path = Path(path)
+    index = read_faiss(path / INDEX_FILE, mmap=mmap)
+    conn = connect(path / DOCSTORE_FILE)
+
+    row = conn.execute("SELECT value FROM meta WHERE key = 'ntotal'").fetchone()
+    if row is not None and int(row[0]) != index.ntotal:
+        raise ValueError(
+            f"❌ {path / INDEX_FILE} has {index.ntotal} vectors but the docstore "
+            f"expects {row[0]}; rebuild the index"
+        )
+
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=SqliteDocstore(conn),
+        index_to_docstore_id=PositionMap(conn),
+    )
+
+
+def migrate_pickle_index(path: Path, embeddings):
+    """
+    One-time conversion of a legacy index.pkl. Unpickling can run
+    arbitrary code, so this only happens when ALLOW_PICKLE_MIGRATION=1;
+    otherwise callers should rebuild the index from source documents.
+    """
+    path = Path(path)
+    legacy = path / LEGACY_PICKLE
+    if not legacy.exists() or os.getenv("ALLOW_PICKLE_MIGRATION") != "1":
+        return None
+
+    print(f"⚠ Migrating trusted legacy pickle index {legacy}")
+    vs = FAISS.load_local(str(path), embeddings, allow_dangerous_deserialization=True)
+    save_index(vs, path)
+    os.replace(legacy, path / (LEGACY_PICKLE + ".migrated"))
+    return load_index(path, embeddings)
@@ -0,0 +1,382 @@
+# instrumentation.py
+"""
+Shared stage timers, counters and LLM token/cost accounting for
+app.py, rag_system.py, regulatory.py and app_streamlit.py.
+
+    from instrumentation import stage, record_llm
+    with stage("retrieve"):
+        docs = retriever.invoke(q)
+
+Everything is kept in one in-process registry. Optional exports:
+    METRICS_FILE=metrics.prom   Prometheus text format, written on exit
+                                (node_exporter textfile collector)
+    METRICS_PORT=9108           serve /metrics over HTTP
+    TRACE_FILE=trace.jsonl      one JSON line per stage / LLM call
+"""
+
+import os
+import json
+import time
+import atexit
+import threading
+from uuid import uuid4
+from datetime import datetime
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# ---------------- CONFIG ----------------
+
+METRICS_FILE = os.getenv("METRICS_FILE")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+TRACE_FILE = os.getenv("TRACE_FILE")
+METRIC_PREFIX = "compliance_"
+CHARS_PER_TOKEN = 4   # the one chars->tokens ratio for every budget and estimate
+
+# USD per million (input, output) tokens; override with LLM_PRICE_IN / LLM_PRICE_OUT
+MODEL_PRICES = {
+    "llama-3.1-8b-instant": (0.05, 0.08),
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+}
+
+RUN_ID = uuid4().hex[:12]
+
+
+def estimate_tokens(text):
+    """Rough token count when the API reports none; also sizes prompt budgets."""
+    return len(text) // CHARS_PER_TOKEN + 1 if text else 0
+
+
+def llm_cost(model, prompt_tokens, completion_tokens):
+    price_in, price_out = MODEL_PRICES.get(model, (0.0, 0.0))
+    price_in = float(os.getenv("LLM_PRICE_IN", price_in))
+    price_out = float(os.getenv("LLM_PRICE_OUT", price_out))
+    return (prompt_tokens * price_in + completion_tokens * price_out) / 1_000_000
+
+
+# -------------- REGISTRY --------------
+class Metrics:
+    """Thread-safe counters, gauges and per-stage timing summaries."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.timings = {}   # (name, labels) -> [count, sum, max]
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            entry = self.timings.setdefault(key, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.timings.clear()
+
+    def snapshot(self):
+        def fmt(key):
+            name, labels = key
+            return name + ("{" + ",".join(f"{k}={v}" for k, v in labels) + "}" if labels else "")
+
+        with self._lock:
+            return {
+                "counters": {fmt(k): v for k, v in self.counters.items()},
+                "gauges": {fmt(k): v for k, v in self.gauges.items()},
+                "timings": {
+                    fmt(k): {"count": c, "total_s": round(s, 4), "mean_s": round(s / c, 4),
+                             "max_s": round(m, 4)}
+                    for k, (c, s, m) in self.timings.items()
+                },
+            }
+
+    def to_prometheus(self):
+        def labels(pairs, extra=()):
+            pairs = tuple(pairs) + tuple(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            for (name, lbl), value in sorted(self.counters.items()):
+                lines.append(f"{METRIC_PREFIX}{name}_total{labels(lbl)} {value}")
+            for (name, lbl), value in sorted(self.gauges.items()):
+                lines.append(f"{METRIC_PREFIX}{name}{labels(lbl)} {value}")
+            for (name, lbl), (count, total, peak) in sorted(self.timings.items()):
+                metric = f"{METRIC_PREFIX}{name}_seconds"
+                lines.append(f"{metric}_count{labels(lbl)} {count}")
+                lines.append(f"{metric}_sum{labels(lbl)} {total:.6f}")
+                lines.append(f"{metric}_max{labels(lbl)} {peak:.6f}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+_entry = {"name": "unknown"}
+_trace_lock = threading.Lock()
+_local = threading.local()
+
+
+# -------------- TRACE --------------
+def trace(event, **fields):
+    """Append one event to TRACE_FILE (no-op when unset)."""
+    if not TRACE_FILE:
+        return
+    record = {
+        "ts": datetime.now().isoformat(timespec="milliseconds"),
+        "run": RUN_ID,
+        "entry": _entry["name"],
+        "event": event,
+        **fields,
+    }
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    with _trace_lock:
+        with open(TRACE_FILE, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+# -------------- STAGES --------------
+@contextmanager
+def stage(name, **labels):
+    """Time a pipeline stage; nested stages record their parent in the trace."""
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    parent = stack[-1] if stack else None
+    stack.append(name)
+
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        stack.pop()
+        metrics.observe("stage", seconds, stage=name, **labels)
+        if error:
+            metrics.inc("stage_errors", stage=name, error=error)
+        trace("stage", stage=name, parent=parent, seconds=round(seconds, 6), error=error, **labels)
+
+
+def timed_iter(name, iterable, **labels):
+    """Yield from `iterable`, timing each step as stage `name` (for lazy pipelines)."""
+    it = iter(iterable)
+    while True:
+        with stage(name, **labels):
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+        yield item
+
+
+def count(name, value=1, **labels):
+    metrics.inc(name, value, **labels)
+
+
+def gauge(name, value, **labels):
+    metrics.set(name, value, **labels)
+
+
+# -------------- LLM ACCOUNTING --------------
+def record_llm(model, prompt_tokens, completion_tokens, seconds, ttft=None,
+               estimated=False, **labels):
+    """Count one LLM call with its token usage, latency and cost."""
+    cost = llm_cost(model, prompt_tokens, completion_tokens)
+    metrics.inc("llm_calls", model=model, **labels)
+    metrics.inc("llm_tokens", prompt_tokens, model=model, kind="prompt")
+    metrics.inc("llm_tokens", completion_tokens, model=model, kind="completion")
+    metrics.inc("llm_cost_usd", cost, model=model)
+    metrics.observe("llm_call", seconds, model=model)
+    if ttft is not None:
+        metrics.observe("llm_ttft", ttft, model=model)
+    trace(
+        "llm", model=model, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+        seconds=round(seconds, 6), ttft=None if ttft is None else round(ttft, 6),
+        cost_usd=round(cost, 8), estimated=estimated, **labels,
+    )
+
+
+def usage_from_message(message):
+    """(prompt, completion) tokens from a LangChain message's usage_metadata, if any."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    if usage.get("input_tokens") is None:
+        return None
+    return usage["input_tokens"], usage.get("output_tokens", 0)
+
+
+_handler_class = None
+
+
+def callback_handler(model):
+    """
+    LangChain callback handler timing the retriever, prompt and chat
+    model runs of a chain and recording token usage (estimated when the
+    provider does not report it). Pass as config={"callbacks": [...]}.
+    LangChain is imported on first use only.
+    """
+    global _handler_class
+    if _handler_class is None:
+        from langchain_core.callbacks import BaseCallbackHandler
+
+        class StageCallbackHandler(BaseCallbackHandler):
+            def __init__(self, model):
+                self.model = model
+                self.runs = {}
+
+            def _start(self, run_id, name, **extra):
+                self.runs[run_id] = {"name": name, "start": time.perf_counter(), **extra}
+
+            def _end(self, run_id, **labels):
+                run = self.runs.pop(run_id, None)
+                if run is None:
+                    return None
+                seconds = time.perf_counter() - run["start"]
+                metrics.observe("stage", seconds, stage=run["name"], **labels)
+                trace("stage", stage=run["name"], seconds=round(seconds, 6), **labels)
+                return run, seconds
+
+            # ---- retriever ----
+            def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+                self._start(run_id, "retrieve")
+
+            def on_retriever_end(self, documents, *, run_id, **kwargs):
+                metrics.inc("retrieved_docs", len(documents))
+                self._end(run_id)
+
+            # ---- prompt templates ----
+            def on_chain_start(self, serialized, inputs, *, run_id, **kwargs):
+                if kwargs.get("run_type") == "prompt":
+                    self._start(run_id, "prompt_build")
+
+            def on_chain_end(self, outputs, *, run_id, **kwargs):
+                if run_id in self.runs and self.runs[run_id]["name"] == "prompt_build":
+                    self._end(run_id)
+
+            # ---- chat model ----
+            def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+                prompt = "".join(str(m.content) for batch in messages for m in batch)
+                self._start(run_id, "llm", prompt_tokens=estimate_tokens(prompt), tokens=0, first=None)
+
+            def on_llm_new_token(self, token, *, run_id, **kwargs):
+                run = self.runs.get(run_id)
+                if run is not None:
+                    if run["first"] is None:
+                        run["first"] = time.perf_counter()
+                    run["tokens"] += 1
+
+            def on_llm_end(self, response, *, run_id, **kwargs):
+                run = self.runs.get(run_id)
+                if run is None:
+                    return
+                generation = response.generations[0][0] if response.generations else None
+                text = getattr(generation, "text", "") or ""
+
+                usage = usage_from_message(getattr(generation, "message", None))
+                if usage is None:
+                    reported = (response.llm_output or {}).get("token_usage") or {}
+                    if reported.get("prompt_tokens") is not None:
+                        usage = reported["prompt_tokens"], reported.get("completion_tokens", 0)
+
+                estimated = usage is None
+                if estimated:
+                    usage = run["prompt_tokens"], run["tokens"] or estimate_tokens(text)
+
+                ttft = run["first"] - run["start"] if run["first"] else None
+                _, seconds = self._end(run_id)
+                record_llm(self.model, usage[0], usage[1], seconds, ttft=ttft, estimated=estimated)
+
+            def on_llm_error(self, error, *, run_id, **kwargs):
+                self.runs.pop(run_id, None)
+                metrics.inc("llm_errors", model=self.model, error=type(error).__name__)
+
+        _handler_class = StageCallbackHandler
+    return _handler_class(model)
+
+
+# -------------- EXPORT --------------
+def export(path=None):
+    """Write the Prometheus text file (METRICS_FILE) atomically."""
+    path = path or METRICS_FILE
+    if not path:
+        return
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(metrics.to_prometheus())
+    os.replace(tmp, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.to_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server = None
+
+
+def init(entry):
+    """Label metrics with the entry point and start the configured exporters (idempotent)."""
+    global _server
+    _entry["name"] = entry
+    metrics.set("run_info", 1, entry=entry, run=RUN_ID)
+
+    if METRICS_PORT and _server is None:
+        try:
+            _server = ThreadingHTTPServer(("0.0.0.0", METRICS_PORT), _MetricsHandler)
+        except OSError as e:
+            print(f"⚠ Metrics endpoint not started on :{METRICS_PORT}: {e}")
+        else:
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+            print(f"📈 Metrics at http://localhost:{METRICS_PORT}/metrics")
+
+
+def report():
+    """Print a per-stage timing table plus LLM token and cost totals."""
+    snap = metrics.snapshot()
+    if snap["timings"]:
+        print(f"\n{'stage':42} {'count':>7} {'total s':>10} {'mean s':>9} {'max s':>9}")
+        for name, t in sorted(snap["timings"].items(), key=lambda kv: -kv[1]["total_s"]):
+            if name.startswith("stage{stage=") and name.endswith("}"):
+                name = name[len("stage{stage="):-1]
+            print(f"{name:42} {t['count']:7d} {t['total_s']:10.3f} "
+                  f"{t['mean_s']:9.4f} {t['max_s']:9.4f}")
+
+    tokens = {k: v for k, v in snap["counters"].items() if k.startswith("llm_tokens")}
+    cost = sum(v for k, v in snap["counters"].items() if k.startswith("llm_cost_usd"))
+    if tokens:
+        print("🔢 " + " · ".join(f"{k}={v}" for k, v in sorted(tokens.items())))
+        print(f"💲 Estimated LLM cost: ${cost:.6f}")
+
+
+atexit.register(export)
@@ -0,0 +1,106 @@
+# llm_retry.py
+"""
+Rate limiting and retries for LLM calls, shared by app.py and
+rag_system.py.
+
+    limiter = TokenBucket(REQUESTS_PER_MINUTE, capacity=workers)
+    reply = with_retries(lambda: client.chat(...), model, limiter)
+
+Each attempt takes a token from the bucket; 429/5xx responses and
+connection errors are retried with Retry-After or exponential backoff.
+"""
+
+import os
+import time
+import random
+import threading
+
+from groq import APIConnectionError, APITimeoutError
+
+import instrumentation as instr
+
+
+# ---------------- CONFIG ----------------
+
+MAX_RETRIES = int(os.getenv("APP_MAX_RETRIES", "5"))
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+# -------------- RATE LIMITING --------------
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate_per_minute` requests on average,
+    with bursts of up to `capacity` requests.
+    """
+
+    def __init__(self, rate_per_minute, capacity=1):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, float(capacity))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+# -------------- RETRIES --------------
+def _status_code(exc):
+    code = getattr(exc, "status_code", None)
+    if code is None:
+        code = getattr(getattr(exc, "response", None), "status_code", None)
+    return code
+
+
+def is_retryable(exc):
+    if isinstance(exc, (APIConnectionError, APITimeoutError, ConnectionError, TimeoutError)):
+        return True
+    return _status_code(exc) in RETRYABLE_STATUS
+
+
+def retry_delay(exc, attempt):
+    """Honour Retry-After when the server sends it, else exponential backoff with jitter."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return min(float(retry_after), RETRY_MAX_DELAY)
+        except ValueError:
+            pass
+
+    delay = min(RETRY_BASE_DELAY * (2 ** attempt), RETRY_MAX_DELAY)
+    return delay * (0.5 + random.random() / 2)
+
+
+def with_retries(call, model, limiter=None, max_retries=MAX_RETRIES):
+    """Run `call()` under `limiter`, retrying on 429/5xx and connection errors."""
+    for attempt in range(max_retries + 1):
+        if limiter:
+            limiter.acquire()
+
+        try:
+            return call()
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+
+            delay = retry_delay(e, attempt)
+            instr.count("llm_retries", model=model)
+            print(f"🔁 Retrying in {delay:.1f}s ({attempt + 1}/{max_retries}): {e}")
+            time.sleep(delay)
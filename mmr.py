@@ -0,0 +1,204 @@
+# mmr.py
+"""
+Maximal marginal relevance over a FAISS vector store, vectorised with
+NumPy.
+
+LangChain's search_type="mmr" reconstructs candidate vectors from FAISS
+one by one (lossily for PQ indexes) and picks results in a Python loop
+per query. Here the exact flat index vectors are
+normalised once, candidates for a whole batch of queries come from one
+FAISS search, and each MMR step is a single array operation over the
+batch:
+
+    score = lambda * sim(query, cand) - (1 - lambda) * max sim(cand, selected)
+
+Candidate sets (query vector + FAISS positions) are cached per query, so
+repeated questions skip both the embedding model and the index search.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import faiss
+
+
+# ---------------- CONFIG ----------------
+
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.5"))   # 1 = pure relevance, 0 = pure diversity
+MMR_FETCH_K = int(os.getenv("MMR_FETCH_K", "20"))
+MMR_CACHE_SIZE = int(os.getenv("MMR_CACHE_SIZE", "1024"))
+
+
+def normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def flat_vectors(index):
+    """
+    Unit-length (n, d) float32 matrix of a flat FAISS index. Returns a
+    zero-copy view when the stored vectors are already normalised.
+    """
+    n, d = index.ntotal, index.d
+    if n == 0:
+        return np.zeros((0, d), dtype=np.float32)
+    if isinstance(index, faiss.IndexFlat):
+        matrix = faiss.rev_swig_ptr(index.get_xb(), n * d).reshape(n, d)
+    else:
+        matrix = index.reconstruct_n(0, n)
+
+    norms = np.linalg.norm(matrix, axis=1)
+    if np.allclose(norms, 1.0, atol=1e-3):
+        return matrix
+    return (matrix / np.maximum(norms, 1e-12)[:, None]).astype(np.float32)
+
+
+def mmr_select(query_vecs, cand_vecs, valid, k, lambda_mult=MMR_LAMBDA):
+    """
+    Batched greedy MMR.
+
+    query_vecs (B, d) and cand_vecs (B, F, d) are unit length; `valid`
+    (B, F) masks missing candidates. Returns (B, k) candidate indices,
+    -1 where a query has fewer than k valid candidates.
+    """
+    B, F = valid.shape
+    k = min(k, F)
+    neg_inf = np.float32(-np.inf)
+
+    # Invalid slots stay finite here (0 * -inf would be NaN when lambda is 0);
+    # `available` keeps them from being picked
+    query_sim = np.einsum("bfd,bd->bf", cand_vecs, query_vecs)
+
+    rows = np.arange(B)
+    picked = np.full((B, k), -1, dtype=np.int64)
+    max_sim = np.full((B, F), neg_inf, dtype=np.float32)
+    available = valid.copy()
+
+    for step in range(k):
+        if step == 0:
+            score = query_sim
+        else:
+            score = lambda_mult * query_sim - (1 - lambda_mult) * max_sim
+        score = np.where(available, score, neg_inf)
+
+        best = score.argmax(axis=1)
+        ok = available[rows, best]
+        picked[:, step] = np.where(ok, best, -1)
+        available[rows[ok], best[ok]] = False
+        # Only similarities to the newly picked vectors: O(k * F * d), not O(F^2 * d)
+        sim_new = np.einsum("bfd,bd->bf", cand_vecs, cand_vecs[rows, best])
+        max_sim = np.maximum(max_sim, np.where(ok[:, None], sim_new, neg_inf))
+    return picked
+
+
+# -------------- SEARCHER --------------
+class VectorMMR:
+    """
+    MMR search over `vs`. Candidates come from `vs.index`, which may be
+    an ANN index; their vectors are read from `flat`, the exact index
+    over the same positions (defaults to `vs.index`).
+    """
+
+    def __init__(self, vs, flat=None, cache_size=MMR_CACHE_SIZE):
+        self.vs = vs
+        self.flat = vs.index if flat is None else flat  # keeps the vector view alive
+        self.vectors = flat_vectors(self.flat)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # ---------- candidate sets ----------
+    def _cached(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+            return entry
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._cache[key] = entry
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _embed(self, queries):
+        embeddings = self.vs.embedding_function
+        if len(queries) == 1:
+            return [embeddings.embed_query(queries[0])]
+        # One model call for the batch; MiniLM embeds queries and documents alike
+        return embeddings.embed_documents(queries)
+
+    def candidates(self, queries, fetch_k):
+        """Return (query_vecs (B, d), positions (B, fetch_k)), cached per query."""
+        found = [self._cached((q, fetch_k)) for q in queries]
+        missing = [q for q, e in zip(queries, found) if e is None]
+
+        if missing:
+            unique = list(dict.fromkeys(missing))
+            self.misses += len(unique)
+            raw = np.asarray(self._embed(unique), dtype=np.float32)
+            # Candidates ranked by the index's own metric, as vs.similarity_search does
+            _, positions = self.vs.index.search(raw, fetch_k)
+            qvecs = normalize(raw)
+            fresh = {}
+            for q, v, p in zip(unique, qvecs, positions):
+                fresh[q] = (v, p)
+                self._store((q, fetch_k), (v, p))
+            found = [e if e is not None else fresh[q] for q, e in zip(queries, found)]
+
+        return np.stack([e[0] for e in found]), np.stack([e[1] for e in found])
+
+    # ---------- search ----------
+    def search_batch(self, queries, k=4, fetch_k=MMR_FETCH_K, lambda_mult=MMR_LAMBDA):
+        """MMR results for each query in `queries`, as lists of Documents."""
+        if not queries:
+            return []
+        fetch_k = max(fetch_k, k)
+        if self.flat.ntotal != len(self.vectors):
+            # Vectors were added since; FAISS may have reallocated them
+            self.vectors = flat_vectors(self.flat)
+            with self._lock:
+                self._cache.clear()
+        qvecs, positions = self.candidates(list(queries), fetch_k)
+
+        valid = positions >= 0
+        cand = self.vectors[np.where(valid, positions, 0)]
+        picked = mmr_select(qvecs, cand, valid, k, lambda_mult)
+
+        results = []
+        for row_pos, row_pick in zip(positions, picked):
+            docs = []
+            for i in row_pick:
+                if i < 0:
+                    break
+                doc_id = self.vs.index_to_docstore_id[int(row_pos[i])]
+                doc = self.vs.docstore.search(doc_id)
+                if not isinstance(doc, str):
+                    docs.append(doc)
+            results.append(docs)
+        return results
+
+    def search(self, query, k=4, fetch_k=MMR_FETCH_K, lambda_mult=MMR_LAMBDA):
+        return self.search_batch([query], k, fetch_k, lambda_mult)[0]
+
+
+def mmr_retriever(mmr, **kwargs):
+    """LangChain retriever wrapping `VectorMMR.search` (LangChain imported lazily)."""
+    from langchain_core.retrievers import BaseRetriever
+
+    class MMRRetriever(BaseRetriever):
+        mmr: object
+        search_kwargs: dict
+
+        def _get_relevant_documents(self, query, *, run_manager=None):
+            return self.mmr.search(query, **self.search_kwargs)
+
+        def batch_search(self, queries):
+            return self.mmr.search_batch(queries, **self.search_kwargs)
+
+    return MMRRetriever(mmr=mmr, search_kwargs=kwargs)
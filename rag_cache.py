@@ -0,0 +1,108 @@
+# rag_cache.py
+"""
+Two-level cache for RAG queries:
+  1. normalized query + k + index version -> retrieved chunk IDs
+     (clause list + k + index version for uploaded contracts)
+  2. prompt hash + model                  -> LLM answer
+Both levels are LRU-bounded with a TTL. Retrieval entries are dropped
+whenever the FAISS index version changes.
+"""
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+# ---------------- CONFIG ----------------
+
+RAG_CACHE_TTL = float(os.getenv("RAG_CACHE_TTL", "3600"))
+RAG_CACHE_MAX_ENTRIES = int(os.getenv("RAG_CACHE_MAX_ENTRIES", "256"))
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire `ttl` seconds after insertion."""
+
+    def __init__(self, ttl=RAG_CACHE_TTL, max_entries=RAG_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self.entries.get(key)
+            if item is None or time.monotonic() - item[0] > self.ttl:
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def stats(self):
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+def normalize_query(query: str):
+    return " ".join(query.lower().split())
+
+
+def digest(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(str(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class RagCache:
+    def __init__(self, ttl=RAG_CACHE_TTL, max_entries=RAG_CACHE_MAX_ENTRIES):
+        self.retrievals = TTLCache(ttl, max_entries)
+        self.answers = TTLCache(ttl, max_entries)
+        self.index_version = None
+
+    def check_index(self, version):
+        """Drop retrieval entries if the index changed; returns True when it did."""
+        if version == self.index_version:
+            return False
+        changed = self.index_version is not None
+        self.retrievals.clear()
+        self.index_version = version
+        return changed
+
+    def get_ids(self, query, k, mode="dense"):
+        return self.retrievals.get(digest(normalize_query(query), k, mode, self.index_version))
+
+    def put_ids(self, query, k, ids, mode="dense"):
+        self.retrievals.put(digest(normalize_query(query), k, mode, self.index_version), list(ids))
+
+    def get_clause_ids(self, clauses, k):
+        """Chunk IDs retrieved for a contract's clauses, keyed by their content."""
+        return self.retrievals.get(digest("clauses", digest(*clauses), k, self.index_version))
+
+    def put_clause_ids(self, clauses, k, ids):
+        self.retrievals.put(digest("clauses", digest(*clauses), k, self.index_version), list(ids))
+
+    def get_answer(self, prompt, model):
+        return self.answers.get(digest(prompt, model))
+
+    def put_answer(self, prompt, model, answer):
+        self.answers.put(digest(prompt, model), answer)
+
+    def stats(self):
+        return {"retrieval": self.retrievals.stats(), "answer": self.answers.stats()}
@@ -5,14 +5,28 @@ Output matches screenshot exactly.
 """
 
 import os
+import re
+import json
+import time
+import hashlib
+import argparse
+import threading
 from pathlib import Path
+from datetime import datetime
+from collections import deque
+from multiprocessing import Pool
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import faiss
 from dotenv import load_dotenv
 
 # LangChain imports
 # ---------------- LangChain (Modern 1.2+) ----------------
 
 # Document loading
-from langchain_community.document_loaders import TextLoader, PyPDFLoader
+from langchain_community.document_loaders import TextLoader
+from langchain_core.documents import Document
+from pypdf import PdfReader
 
 # Text splitting
 from langchain_text_splitters import RecursiveCharacterTextSplitter
@@ -22,11 +36,19 @@ from langchain_community.vectorstores import FAISS
 
 # Embeddings
 from langchain_community.embeddings import HuggingFaceEmbeddings
+from embedding_cache import CachedEmbeddings, text_hash
+from streaming import StreamStats, timed_stream
+from index_store import INDEX_FILE, index_exists, index_version, load_index, read_faiss, save_index
+from sparse_index import SPARSE_FILE, SparseIndex, hybrid_retriever, open_sparse_index
+from mmr import MMR_FETCH_K, VectorMMR, mmr_retriever
+from rerank import RERANK, RERANK_FETCH_K, CONTEXT_TOKEN_BUDGET, select_context
+import instrumentation as instr
+from llm_retry import TokenBucket, with_retries
 
 
 # Prompt & runnable pipeline
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
 
 # LLM (Groq)
@@ -41,7 +63,10 @@ from langchain_groq import ChatGroq
 
 DATASET_PATH = Path(r"D:\AI-Powered-RegulatoryCompliance-Checker-for-Contracts\Dataset")
 INDEX_PATH = Path("./faiss_index")
-REBUILD_INDEX = True
+MANIFEST_FILE = INDEX_PATH / "manifest.json"
+# Set REBUILD_INDEX=1 to force a full re-embed; otherwise the index is
+# updated incrementally from the manifest.
+REBUILD_INDEX = os.getenv("REBUILD_INDEX") == "1"
 
 EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 CHAT_MODEL = "llama-3.1-8b-instant"
@@ -50,6 +75,52 @@ CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
 TOP_K = 4
 
+# Ingestion: chunks are embedded in batches of EMBED_BATCH_SIZE by
+# EMBED_WORKERS processes (1 = in-process). The embedding cache always
+# keeps the model's float32 output; EMBED_DTYPE=float16 rounds only the
+# vectors added to the index (which FAISS still stores as float32).
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "1"))
+EMBED_DTYPE = os.getenv("EMBED_DTYPE", "float32")
+EMBED_NORMALIZE = os.getenv("EMBED_NORMALIZE", "1") == "1"
+
+# Search index type: flat (exact), ivf_flat, ivf_pq, hnsw or sq_fp16.
+# Non-flat indexes are built from the flat vectors and saved as
+# index.ann.faiss, with their settings in index_config.json.
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat")
+ANN_INDEX_FILE = INDEX_PATH / "index.ann.faiss"
+INDEX_CONFIG_FILE = INDEX_PATH / "index_config.json"
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))       # 0 = 4 * sqrt(n)
+PQ_M = int(os.getenv("PQ_M", "48"))                # sub-quantizers, must divide dim
+PQ_NBITS = int(os.getenv("PQ_NBITS", "8"))
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+NPROBE = int(os.getenv("NPROBE", "16"))
+EF_SEARCH = int(os.getenv("EF_SEARCH", "64"))
+TRAIN_SAMPLE = int(os.getenv("TRAIN_SAMPLE", "50000"))
+
+# Retrieval: "hybrid" fuses dense (MMR) and BM25 rankings with reciprocal
+# rank fusion; "dense" is MMR only. Weights scale each ranking's vote.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", "20"))
+HYBRID_DENSE_WEIGHT = float(os.getenv("HYBRID_DENSE_WEIGHT", "1.0"))
+HYBRID_SPARSE_WEIGHT = float(os.getenv("HYBRID_SPARSE_WEIGHT", "1.0"))
+
+# Document loading: PDFs are parsed page range by page range in a
+# process pool; at most 2 * LOAD_WORKERS ranges are held in memory.
+LOAD_WORKERS = int(os.getenv("LOAD_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+
+# Batch analysis (--batch): each contract's chunks are retrieved against
+# the shared index in the main thread, then its LLM call runs on one of
+# BATCH_WORKERS threads under a BATCH_REQUESTS_PER_MINUTE token bucket.
+# Results are appended to BATCH_OUTPUT, which is also the resume checkpoint.
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+BATCH_REQUESTS_PER_MINUTE = float(os.getenv("BATCH_REQUESTS_PER_MINUTE", "30"))
+BATCH_OUTPUT = Path(os.getenv("BATCH_OUTPUT", "batch_results.jsonl"))
+BATCH_QUERY_CHUNKS = int(os.getenv("BATCH_QUERY_CHUNKS", "16"))  # contract chunks used as queries
+BATCH_CLAUSE_K = 3
+CONTRACT_TOKEN_BUDGET = int(os.getenv("CONTRACT_TOKEN_BUDGET", "3000"))
+
 QUESTION = """
 Analyze the contract against compliance standards and provide output in this strict format:
 
@@ -80,17 +151,99 @@ def find_files(path: Path):
     return [p for p in path.rglob("*") if p.suffix.lower() in allowed]
 
 
-def load_documents(paths):
-    docs = []
+def _load_part(path, start, end):
+    """
+    Worker: load pages [start, end) of a PDF (end=None: to the last page),
+    or the whole text file. Returns (docs, seconds, error).
+    """
+    t0 = time.perf_counter()
+    try:
+        if path.suffix.lower() == ".txt":
+            docs = TextLoader(str(path)).load()
+        else:
+            reader = PdfReader(str(path))
+            docs = [
+                Document(
+                    page_content=reader.pages[i].extract_text(),
+                    metadata={"source": str(path), "page": i},
+                )
+                for i in range(start, len(reader.pages) if end is None else end)
+            ]
+        return docs, time.perf_counter() - t0, None
+    except Exception as e:
+        return [], time.perf_counter() - t0, str(e)
+
+
+def _file_parts(paths):
+    """Split each file into (path, start, end, last) load tasks."""
     for p in paths:
-        try:
-            if p.suffix.lower() == ".txt":
-                docs.extend(TextLoader(str(p)).load())
-            elif p.suffix.lower() == ".pdf":
-                docs.extend(PyPDFLoader(str(p)).load())
-        except Exception as e:
-            print(f"[WARN] Cannot load {p}: {e}")
-    return docs
+        if p.suffix.lower() == ".pdf":
+            try:
+                n_pages = len(PdfReader(str(p)).pages)
+            except Exception:
+                # One whole-file task, so the load error is reported like any other
+                yield p, 0, None, True
+                continue
+            starts = range(0, n_pages, PDF_PAGES_PER_TASK) or [0]
+            for start in starts:
+                end = min(start + PDF_PAGES_PER_TASK, n_pages)
+                yield p, start, end, end >= n_pages
+        elif p.suffix.lower() == ".txt":
+            yield p, 0, None, True
+
+
+def iter_documents(paths, timings=None, workers=LOAD_WORKERS):
+    """
+    Yield (path, pages, last) in file and page order, a page range at a
+    time; `last` marks a file's final range.
+    With more than one worker the ranges are parsed in a process pool
+    with a bounded number in flight. Per-file parse time, wall time,
+    page counts and load errors are recorded in `timings` if given; a
+    file with errors may be missing pages.
+    """
+    timings = {} if timings is None else timings
+    pool = Pool(workers) if workers > 1 else None
+    pending = deque()
+    started = {}
+
+    def finish(entry):
+        p, last, job = entry
+        docs, seconds, error = job.get() if pool is not None else job
+        stats = timings.setdefault(
+            str(p), {"pages": 0, "parse_s": 0.0, "wall_s": 0.0, "errors": []}
+        )
+        if error:
+            print(f"[WARN] Cannot load {p}: {error}")
+            stats["errors"].append(error)
+        stats["pages"] += len(docs)
+        stats["parse_s"] += seconds
+        if last:
+            stats["wall_s"] = time.perf_counter() - started[p]
+        return p, docs, last
+
+    try:
+        for p, start, end, last in _file_parts(paths):
+            started.setdefault(p, time.perf_counter())
+            if pool is None:
+                job = _load_part(p, start, end)
+            else:
+                job = pool.apply_async(_load_part, (p, start, end))
+            pending.append((p, last, job))
+
+            while len(pending) > 2 * max(workers, 1) - 1:
+                yield finish(pending.popleft())
+
+        while pending:
+            yield finish(pending.popleft())
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+
+def load_documents(paths):
+    """Load every page of `paths` into memory (small corpora and tools)."""
+    return [d for _, docs, _ in iter_documents(paths) for d in docs]
 
 
 # -------------- SPLIT DOCS --------------
@@ -102,59 +255,578 @@ def split_docs(docs):
 
 
 # -------------- FAISS --------------
-def build_faiss(chunks):
-    embeddings = HuggingFaceEmbeddings(model_name=EMBED_MODEL)
+_embeddings = None
+
+
+def get_embeddings():
+    global _embeddings
+    if _embeddings is None:
+        _embeddings = CachedEmbeddings(
+            HuggingFaceEmbeddings(model_name=EMBED_MODEL), EMBED_MODEL
+        )
+    return _embeddings
+
 
-    if REBUILD_INDEX or not INDEX_PATH.exists():
+def build_faiss(chunks, ids=None):
+    embeddings = get_embeddings()
+
+    if REBUILD_INDEX or not index_exists(INDEX_PATH):
         print("🔁 Building FAISS index...")
-        vs = FAISS.from_documents(chunks, embeddings)
+        vs = FAISS.from_documents(chunks, embeddings, ids=ids)
         INDEX_PATH.mkdir(exist_ok=True)
-        vs.save_local(str(INDEX_PATH))
+        save_index(vs, INDEX_PATH)
+        with instr.stage("sparse_index"):
+            open_sparse_index(INDEX_PATH)
         print("✅ Index saved.")
-        return vs
+        return apply_index_type(vs, changed=True)
 
     print("📦 Loading FAISS index...")
-    return FAISS.load_local(
-        str(INDEX_PATH),
-        embeddings,
-        allow_dangerous_deserialization=True
-    )
+    vs = load_index(INDEX_PATH, embeddings)
+    return apply_index_type(vs, changed=False)
+
+
+# -------------- ANN INDEX TYPES --------------
+def index_settings(index_type=INDEX_TYPE):
+    return {
+        "type": index_type,
+        "nlist": IVF_NLIST,
+        "pq_m": PQ_M,
+        "pq_nbits": PQ_NBITS,
+        "hnsw_m": HNSW_M,
+        "nprobe": NPROBE,
+        "ef_search": EF_SEARCH,
+    }
+
+
+def index_factory_string(settings, ntotal, dim):
+    """FAISS factory string for `settings`, or None if `ntotal` is too small to train."""
+    kind = settings["type"]
+    nlist = settings["nlist"] or int(4 * np.sqrt(ntotal))
+    nlist = max(1, min(nlist, ntotal // 39))
+
+    if kind == "hnsw":
+        return f"HNSW{settings['hnsw_m']}"
+    if kind == "sq_fp16":
+        return "SQfp16"
+    if kind == "ivf_flat":
+        return f"IVF{nlist},Flat" if ntotal >= 39 else None
+    if kind == "ivf_pq":
+        if dim % settings["pq_m"] or ntotal < 39 * (1 << settings["pq_nbits"]):
+            return None
+        return f"IVF{nlist},PQ{settings['pq_m']}x{settings['pq_nbits']}"
+    raise ValueError(f"❌ Unknown INDEX_TYPE: {kind}")
+
+
+def set_search_params(index, settings):
+    if settings["type"].startswith("ivf"):
+        ivf = faiss.extract_index_ivf(index)
+        ivf.nprobe = settings["nprobe"]
+    elif settings["type"] == "hnsw":
+        index.hnsw.efSearch = settings["ef_search"]
+
+
+def build_ann_index(flat, settings, batch_size=65536):
+    """Train on a random sample of the flat vectors, then add them all in order."""
+    ntotal, dim = flat.ntotal, flat.d
+    factory = index_factory_string(settings, ntotal, dim)
+    if factory is None:
+        return None
+
+    index = faiss.index_factory(dim, factory, flat.metric_type)
+
+    if not index.is_trained:
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(ntotal, min(TRAIN_SAMPLE, ntotal), replace=False))
+        index.train(flat.reconstruct_batch(sample))
+
+    # Positions must match the flat index so docstore IDs stay aligned
+    for start in range(0, ntotal, batch_size):
+        index.add(flat.reconstruct_n(start, min(batch_size, ntotal - start)))
+
+    if settings["type"].startswith("ivf"):
+        faiss.extract_index_ivf(index).make_direct_map()  # needed by MMR reconstruct()
+
+    set_search_params(index, settings)
+    return index
+
+
+def load_index_config():
+    if INDEX_CONFIG_FILE.exists():
+        with open(INDEX_CONFIG_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def apply_index_type(vs, changed=True):
+    """
+    Swap the exact flat index of `vs` for the configured ANN index.
+    The flat index on disk stays the source of truth for incremental
+    updates; the ANN index is rebuilt only when vectors or build
+    settings change, and search-time settings are applied on load.
+    """
+    settings = index_settings(INDEX_TYPE)
+    build_keys = ("type", "nlist", "pq_m", "pq_nbits", "hnsw_m")
+
+    if settings["type"] == "flat":
+        if ANN_INDEX_FILE.exists():
+            ANN_INDEX_FILE.unlink()
+    else:
+        saved = load_index_config()
+        reusable = (
+            not changed
+            and ANN_INDEX_FILE.exists()
+            and saved.get("ntotal") == vs.index.ntotal
+            and all(saved.get(k) == settings[k] for k in build_keys)
+        )
+
+        if reusable:
+            index = faiss.read_index(str(ANN_INDEX_FILE))
+            set_search_params(index, settings)
+        else:
+            print(f"🏗 Building {settings['type']} index over {vs.index.ntotal} vectors...")
+            index = build_ann_index(vs.index, settings)
+            if index is None:
+                print(f"[WARN] Too few vectors to train {settings['type']}; using flat index")
+                settings["type"] = "flat"
+            else:
+                faiss.write_index(index, str(ANN_INDEX_FILE))
+
+        if index is not None:
+            vs.index = index
+
+    settings["ntotal"] = vs.index.ntotal
+    tmp = INDEX_CONFIG_FILE.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(settings, f, indent=2)
+    os.replace(tmp, INDEX_CONFIG_FILE)
+    return vs
+
+
+# -------------- INDEX REPORT --------------
+REPORT_GRID = [
+    ("ivf_flat", "nprobe", [1, 4, 16, 64]),
+    ("ivf_pq", "nprobe", [4, 16, 64]),
+    ("hnsw", "ef_search", [16, 32, 64, 128]),
+    ("sq_fp16", None, [None]),
+]
+
+
+def _timed_search(index, queries, k):
+    start = time.perf_counter()
+    _, ids = index.search(queries, k)
+    return ids, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def index_report(flat, n_queries=200, k=10):
+    """
+    Recall@k and per-query latency of each ANN setting against the exact
+    flat index. Queries are a random sample of the indexed vectors.
+    """
+    rng = np.random.default_rng(1)
+    sample = np.sort(rng.choice(flat.ntotal, min(n_queries, flat.ntotal), replace=False))
+    queries = flat.reconstruct_batch(sample)
+    k = min(k, flat.ntotal)
+
+    truth, flat_ms = _timed_search(flat, queries, k)
+    rows = [{"type": "flat", "param": None, "value": None,
+             "recall": 1.0, "latency_ms": round(flat_ms, 4), "build_s": 0.0}]
+
+    for kind, param, values in REPORT_GRID:
+        settings = index_settings(kind)
+        start = time.perf_counter()
+        index = build_ann_index(flat, settings)
+        build_s = time.perf_counter() - start
+        if index is None:
+            print(f"[WARN] Skipping {kind}: not enough vectors to train")
+            continue
+
+        for value in values:
+            if param:
+                settings[param] = value
+                set_search_params(index, settings)
+            ids, ms = _timed_search(index, queries, k)
+            hits = sum(len(set(a) & set(b)) for a, b in zip(ids, truth))
+            rows.append({
+                "type": kind, "param": param, "value": value,
+                "recall": round(hits / truth.size, 4),
+                "latency_ms": round(ms, 4), "build_s": round(build_s, 2),
+            })
+
+    print(f"\n📊 Recall@{k} vs latency ({len(queries)} queries, {flat.ntotal} vectors)")
+    for r in rows:
+        label = r["type"] + (f" {r['param']}={r['value']}" if r["param"] else "")
+        print(f"  {label:<24} recall={r['recall']:.3f}  {r['latency_ms']:.3f} ms/query  build={r['build_s']}s")
+
+    INDEX_PATH.mkdir(exist_ok=True)
+    with open(INDEX_PATH / "index_report.json", "w", encoding="utf-8") as f:
+        json.dump(rows, f, indent=2)
+    return rows
+
+
+# -------------- INGESTION PIPELINE --------------
+_worker_embeddings = None
+
+
+def _init_embed_worker(model_name):
+    global _worker_embeddings
+    try:
+        import torch
+        torch.set_num_threads(1)  # one core per worker process
+    except ImportError:
+        pass
+    _worker_embeddings = HuggingFaceEmbeddings(model_name=model_name)
+
+
+def _embed_batch(texts):
+    return np.asarray(_worker_embeddings.embed_documents(texts), dtype=np.float32)
+
+
+def iter_batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def prepare_vectors(vectors):
+    matrix = np.asarray(vectors, dtype=EMBED_DTYPE).astype(np.float32)
+    if EMBED_NORMALIZE:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.maximum(norms, 1e-12)
+    return matrix
+
+
+def add_chunks(vs, items):
+    """
+    Stream (Document, id) pairs into `vs` batch by batch.
+    Cache misses are embedded by a process pool with a bounded number of
+    batches in flight, so the full chunk list is never held in memory.
+    Returns the (possibly new) vector store and the number of chunks added.
+    """
+    embeddings = get_embeddings()
+    pool = None
+    if EMBED_WORKERS > 1:
+        pool = Pool(EMBED_WORKERS, initializer=_init_embed_worker, initargs=(EMBED_MODEL,))
+
+    pending = deque()
+    added = 0
+
+    def flush(entry):
+        nonlocal vs, added
+        batch, hashes, vectors, missing, job = entry
+
+        if job is not None:
+            with instr.stage("embed_wait"):
+                computed = job.get()
+            embeddings.cache.add_many([hashes[i] for i in missing], computed)
+            for i, v in zip(missing, computed):
+                vectors[i] = v
+
+        matrix = prepare_vectors(vectors)
+        text_embeddings = [(d.page_content, v) for (d, _), v in zip(batch, matrix)]
+        metadatas = [d.metadata for d, _ in batch]
+        ids = [cid for _, cid in batch]
+
+        with instr.stage("index_add"):
+            if vs is None:
+                vs = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=ids)
+            else:
+                vs.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        added += len(batch)
+        instr.count("chunks_indexed", len(batch))
+
+    try:
+        for batch in iter_batches(items, EMBED_BATCH_SIZE):
+            texts = [d.page_content for d, _ in batch]
+
+            if pool is None:
+                with instr.stage("embed"):
+                    vectors = embeddings.embed_documents(texts)
+                pending.append((batch, None, vectors, [], None))
+            else:
+                hashes = [text_hash(t) for t in texts]
+                found = embeddings.cache.get_many(hashes)
+                vectors = [found.get(h) for h in hashes]
+                missing = [i for i, v in enumerate(vectors) if v is None]
+                job = None
+                if missing:
+                    job = pool.apply_async(_embed_batch, ([texts[i] for i in missing],))
+                pending.append((batch, hashes, vectors, missing, job))
+
+            while len(pending) > 2 * max(EMBED_WORKERS - 1, 0):
+                flush(pending.popleft())
+
+        while pending:
+            flush(pending.popleft())
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return vs, added
+
+
+# -------------- INCREMENTAL INDEX --------------
+def file_digest(path: Path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_ids(path: Path, chunks, seen=None):
+    """
+    Stable per-chunk vector IDs derived from file path, page and text.
+    Pass the same `seen` dict for successive page batches of one file.
+    """
+    ids = []
+    seen = {} if seen is None else seen
+    for c in chunks:
+        h = hashlib.sha256()
+        h.update(str(path).encode("utf-8"))
+        h.update(str(c.metadata.get("page", "")).encode("utf-8"))
+        h.update(c.page_content.encode("utf-8"))
+        digest = h.hexdigest()[:32]
+        # Identical chunks in one file still need distinct IDs
+        seen[digest] = seen.get(digest, 0) + 1
+        ids.append(f"{digest}-{seen[digest]}")
+    return ids
+
+
+def load_manifest():
+    if MANIFEST_FILE.exists():
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def save_manifest(manifest):
+    tmp = MANIFEST_FILE.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, MANIFEST_FILE)
+
+
+def update_faiss(files):
+    """
+    Bring the saved index in line with `files`, embedding only chunks that
+    are new or changed and deleting vectors of changed or removed chunks.
+    The manifest maps each file to its mtime, size, hash and chunk IDs.
+    """
+    manifest = {} if REBUILD_INDEX else load_manifest()
+    if manifest and not index_exists(INDEX_PATH):
+        # Index files gone but the manifest survived: its entries describe
+        # vectors that no longer exist, so every file is re-indexed
+        print("⚠️ Index files missing, ignoring manifest and re-indexing everything")
+        manifest = {}
+    has_index = bool(manifest)
+
+    current = {str(p): p for p in files}
+    changed = []
+
+    for key, p in current.items():
+        st = p.stat()
+        entry = manifest.get(key)
+        if entry and entry["mtime"] == st.st_mtime and entry["size"] == st.st_size:
+            continue
+
+        digest = file_digest(p)
+        if entry and entry["sha256"] == digest:
+            entry["mtime"], entry["size"] = st.st_mtime, st.st_size
+            continue
+
+        changed.append((key, p, st, digest))
+
+    removed = [key for key in manifest if key not in current]
+
+    if has_index and not changed and not removed:
+        print("📦 Index up to date, loading FAISS index...")
+        save_manifest(manifest)
+        open_sparse_index(INDEX_PATH)
+        vs = load_index(INDEX_PATH, get_embeddings())
+        return apply_index_type(vs, changed=False)
+
+    skipped = len(current) - len(changed)
+    print(f"🔁 Updating index: {len(changed)} changed, {len(removed)} removed, "
+          f"{skipped} unchanged files skipped")
+
+    removed_ids = []
+    for key in removed:
+        removed_ids.extend(manifest.pop(key)["chunk_ids"])
+
+    stale_ids = set()
+    failed = []
+    timings = {}
+    by_path = {p: (key, st, digest) for key, p, st, digest in changed}
+
+    def new_chunks():
+        """
+        Stream changed files page range by page range, yielding only
+        unseen chunks; the manifest entry is written once a file's last
+        range has been split.
+        """
+        files = {}
+        loaded = iter_documents([p for _, p, _, _ in changed], timings)
+        for p, pages, last in instr.timed_iter("load", loaded):
+            key, st, digest = by_path[p]
+            state = files.setdefault(p, {"ids": [], "seen": {}, "chunks": 0})
+            old_ids = set(manifest.get(key, {}).get("chunk_ids", []))
+
+            with instr.stage("split"):
+                chunks = split_docs(pages)
+                ids = chunk_ids(p, chunks, state["seen"])
+            state["ids"].extend(ids)
+            state["chunks"] += len(chunks)
+
+            for c, cid in zip(chunks, ids):
+                if cid not in old_ids or not has_index:
+                    if sparse is not None:
+                        sparse.add([(cid, c.page_content)])
+                    yield c, cid
+
+            if last and timings[str(p)]["errors"]:
+                # Keep the old entry and vectors and drop this run's partial
+                # chunks, so the next run loads the file again
+                failed.append(p)
+                stale_ids.update(set(state["ids"]) - old_ids)
+                print(f"  ⚠ {p.name}: not indexed, will retry on the next run")
+                del files[p]
+            elif last:
+                stale_ids.update(old_ids - set(state["ids"]))
+                manifest[key] = {
+                    "mtime": st.st_mtime,
+                    "size": st.st_size,
+                    "sha256": digest,
+                    "chunk_ids": state["ids"],
+                }
+                t = timings[str(p)]
+                print(f"  ⏱ {p.name}: {t['pages']} pages, {state['chunks']} chunks, "
+                      f"parse {t['parse_s']:.2f}s, wall {t['wall_s']:.2f}s")
+                del files[p]
+
+    # The BM25 index follows the same adds/deletes in one transaction,
+    # committed after the FAISS save; if it is out of step it is rebuilt
+    # from the docstore instead.
+    sparse = None
+    if has_index:
+        sparse = SparseIndex(INDEX_PATH / SPARSE_FILE)
+        if sparse.version() == index_version(INDEX_PATH):
+            sparse.begin()
+        else:
+            sparse = None
+
+    try:
+        vs = None
+        if has_index:
+            vs = load_index(INDEX_PATH, get_embeddings(), mmap=False)
+            if removed_ids:
+                vs.delete(removed_ids)
+
+        vs, added = add_chunks(vs, new_chunks())
+        if vs is None:
+            raise SystemExit("❌ No chunks to index!")
+
+        if stale_ids:
+            vs.delete(list(stale_ids))
+        if sparse is not None:
+            sparse.delete(removed_ids + list(stale_ids))
+
+        print(f"🧮 Embedded {added} chunks, removed {len(removed_ids) + len(stale_ids)} vectors")
+        if failed:
+            print(f"⚠ {len(failed)} files failed to load and keep their previous vectors")
+
+        INDEX_PATH.mkdir(exist_ok=True)
+        with instr.stage("save_index"):
+            save_index(vs, INDEX_PATH)
+            save_manifest(manifest)
+    except BaseException:
+        if sparse is not None:
+            sparse.rollback()
+        raise
+
+    with instr.stage("sparse_index"):
+        if sparse is not None:
+            sparse.commit(index_version(INDEX_PATH))
+        else:
+            open_sparse_index(INDEX_PATH)
+    print("✅ Index saved.")
+    return apply_index_type(vs, changed=True)
 
 
 # -------------- RETRIEVER --------------
-def get_retriever(vs):
-    return vs.as_retriever(
-        search_type="mmr",
-        search_kwargs={"k": TOP_K}
-    )
+def get_mmr(vs):
+    """NumPy MMR over `vs`; candidate vectors come from the exact flat index."""
+    if isinstance(vs.index, faiss.IndexFlat):
+        return VectorMMR(vs)
+    return VectorMMR(vs, flat=read_faiss(INDEX_PATH / INDEX_FILE))
+
+
+def get_retriever(vs, k=None):
+    # With reranking on, over-fetch and let the cross-encoder pick TOP_K
+    k = k or (RERANK_FETCH_K if RERANK else TOP_K)
+    mmr = get_mmr(vs)
+    if RETRIEVAL_MODE == "hybrid" and (INDEX_PATH / SPARSE_FILE).exists():
+        return hybrid_retriever(
+            vs,
+            open_sparse_index(INDEX_PATH),
+            k=k,
+            fetch_k=max(HYBRID_FETCH_K, k),
+            dense_weight=HYBRID_DENSE_WEIGHT,
+            sparse_weight=HYBRID_SPARSE_WEIGHT,
+            dense_search="mmr",
+            mmr=mmr,
+        )
+
+    return mmr_retriever(mmr, k=k, fetch_k=max(MMR_FETCH_K, 2 * k))
 
 
 # -------------- RAG CHAIN --------------
-def make_chain(retriever):
+def build_context(inputs):
+    """Rerank, de-overlap and pack retrieved chunks into the prompt context."""
+    context, _ = select_context(
+        inputs["input"], inputs["docs"], budget=CONTEXT_TOKEN_BUDGET, top_k=TOP_K
+    )
+    return {"context": context, "input": inputs["input"]}
+
+
+SYSTEM_PROMPT = (
+    "You are a senior legal compliance AI. "
+    "Provide structured contract compliance analysis "
+    "using ONLY the given context."
+)
+
+
+def get_llm():
+    return ChatGroq(
+        api_key=GROQ_API_KEY,
+        model=CHAT_MODEL,
+        temperature=0.1
+    )
+
+
+def make_chain(retriever, llm=None):
     prompt = ChatPromptTemplate.from_messages([
-        (
-            "system",
-            "You are a senior legal compliance AI. "
-            "Provide structured contract compliance analysis "
-            "using ONLY the given context."
-        ),
+        ("system", SYSTEM_PROMPT),
         (
             "human",
             "Question:\n{input}\n\nContext:\n{context}"
         )
     ])
 
-    llm = ChatGroq(
-        api_key=GROQ_API_KEY,
-        model=CHAT_MODEL,
-        temperature=0.1
-    )
+    if llm is None:
+        llm = get_llm()
 
     chain = (
         {
-            "context": retriever,
+            "docs": retriever,
             "input": RunnablePassthrough()
         }
+        | RunnableLambda(build_context)
         | prompt
         | llm
         | StrOutputParser()
@@ -164,8 +836,270 @@ def make_chain(retriever):
 
 
 
+# -------------- BATCH ANALYSIS --------------
+ISSUE_RE = re.compile(r"^\s*[-*•]\s*(.+?)\s*\(Risk Level:\s*(Low|Medium|High)\)", re.IGNORECASE)
+RISK_ORDER = {"Low": 1, "Medium": 2, "High": 3}
+
+
+def contract_files(targets):
+    """Expand --batch arguments; directories are searched like the dataset."""
+    files = []
+    for t in targets:
+        p = Path(t)
+        if p.is_dir():
+            files.extend(sorted(find_files(p)))
+        elif p.is_file():
+            files.append(p)
+        else:
+            print(f"[WARN] Skipping {p}: not found")
+    return list(dict.fromkeys(files))
+
+
+def load_checkpoint(path: Path):
+    """{contract: digest} of contracts already analysed successfully in `path`."""
+    done = {}
+    if not path.exists():
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # last line cut short by a crash
+            if record.get("status") == "ok":
+                done[record["contract"]] = record["digest"]
+    return done
+
+
+class ResultWriter:
+    """Append one JSON line per contract, flushed to disk before returning."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        partial = False
+        if self.path.exists() and self.path.stat().st_size:
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                partial = f.read(1) != b"\n"
+        self.f = open(self.path, "a", encoding="utf-8")
+        if partial:
+            self.f.write("\n")
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self.f.write(line + "\n")
+            self.f.flush()
+            os.fsync(self.f.fileno())
+
+    def close(self):
+        self.f.close()
+
+
+def parse_analysis(text):
+    """Key clauses and issues from an answer in the QUESTION format."""
+    clauses, issues, section = [], [], None
+    for line in text.splitlines():
+        stripped = line.strip()
+        upper = stripped.upper()
+        if upper.startswith("KEY CLAUSES"):
+            section = "clauses"
+        elif upper.startswith("POTENTIAL COMPLIANCE ISSUES"):
+            section = "issues"
+        elif section == "clauses" and stripped.startswith(("-", "*", "•")):
+            clauses.append(stripped.lstrip("-*• ").strip())
+        elif section == "issues" and ISSUE_RE.match(line):
+            m = ISSUE_RE.match(line)
+            issues.append({"issue": m.group(1), "risk": m.group(2).capitalize(), "reason": ""})
+        elif section == "issues" and issues and upper.startswith("REASON:"):
+            issues[-1]["reason"] = stripped[len("reason:"):].strip()
+
+    risks = [i["risk"] for i in issues]
+    overall = max(risks, key=RISK_ORDER.get) if risks else None
+    return {"overall_risk": overall, "key_clauses": clauses, "issues": issues}
+
+
+def prepare_contract(path: Path, mmr):
+    """
+    Load a contract and pack the regulatory context for it: every chunk
+    is a query in one batched MMR search, hits are merged best rank
+    first, and the contract's own chunks are skipped if it is indexed.
+    """
+    docs = [d for _, pages, _ in iter_documents([path], workers=1) for d in pages]
+    text = "\n".join(d.page_content for d in docs).strip()
+    if not text:
+        raise ValueError("no extractable text")
+
+    queries = [c.page_content for c in split_docs(docs)[:BATCH_QUERY_CHUNKS]]
+    with instr.stage("batch_retrieve"):
+        hits = mmr.search_batch(queries, k=BATCH_CLAUSE_K)
+
+    own = path.resolve()
+    ranked, seen = [], set()
+    for rank in range(BATCH_CLAUSE_K):
+        for row in hits:
+            if rank >= len(row) or row[rank].id in seen:
+                continue
+            doc = row[rank]
+            seen.add(doc.id)
+            if Path(doc.metadata.get("source", "")).resolve() != own:
+                ranked.append(doc)
+
+    context, used = select_context(QUESTION, ranked, budget=CONTEXT_TOKEN_BUDGET, use_rerank=False)
+    max_chars = CONTRACT_TOKEN_BUDGET * instr.CHARS_PER_TOKEN
+    if len(text) > max_chars:
+        text = text[:max_chars] + "\n[...truncated]"
+    return text, context, used
+
+
+def call_llm(llm, messages, limiter):
+    """One rate-limited chat call, retrying on 429/5xx and connection errors."""
+
+    def call():
+        start = time.perf_counter()
+        with instr.stage("llm_call"):
+            message = llm.invoke(messages)
+        seconds = time.perf_counter() - start
+
+        usage = instr.usage_from_message(message)
+        if usage is not None:
+            instr.record_llm(CHAT_MODEL, *usage, seconds)
+        else:
+            prompt = "".join(m[1] for m in messages)
+            usage = (instr.estimate_tokens(prompt), instr.estimate_tokens(message.content))
+            instr.record_llm(CHAT_MODEL, *usage, seconds, estimated=True)
+        return message.content, usage
+
+    return with_retries(call, CHAT_MODEL, limiter)
+
+
+def analyse_contract(llm, limiter, path, digest, contract, context, used):
+    record = {
+        "contract": str(path),
+        "digest": digest,
+        "model": CHAT_MODEL,
+        "context_chunks": used,
+    }
+    start = time.perf_counter()
+    messages = [
+        ("system", SYSTEM_PROMPT),
+        ("human", f"Question:\n{QUESTION}\n\nContract:\n{contract}\n\nContext:\n{context}"),
+    ]
+    try:
+        answer, (prompt_tokens, completion_tokens) = call_llm(llm, messages, limiter)
+        record.update(
+            status="ok",
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            **parse_analysis(answer),
+            analysis=answer,
+        )
+    except Exception as e:
+        record.update(status="error", error=f"{type(e).__name__}: {e}")
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    record["analysed_at"] = datetime.now().isoformat(timespec="seconds")
+    return record
+
+
+def run_batch(vs, targets, output=BATCH_OUTPUT, workers=BATCH_WORKERS,
+              requests_per_minute=BATCH_REQUESTS_PER_MINUTE, llm=None):
+    """
+    Analyse every contract in `targets` against the index of `vs`.
+    Contracts whose digest already has an "ok" line in `output` are
+    skipped, so an interrupted sweep resumes where it stopped; failed
+    ones are retried on the next run.
+    """
+    output = Path(output)
+    files = contract_files(targets)
+    done = load_checkpoint(output)
+    todo = [(p, d) for p, d in ((p, file_digest(p)) for p in files) if done.get(str(p)) != d]
+
+    print(f"📑 {len(files)} contracts: {len(files) - len(todo)} already analysed, {len(todo)} to go")
+    if not todo:
+        return {"ok": 0, "error": 0}
+
+    mmr = get_mmr(vs)
+    llm = llm or get_llm()
+    limiter = TokenBucket(requests_per_minute, capacity=workers) if requests_per_minute > 0 else None
+    writer = ResultWriter(output)
+    totals = {"ok": 0, "error": 0}
+    pending = deque()
+
+    def finish(record):
+        writer.write(record)
+        totals[record["status"]] += 1
+        n = totals["ok"] + totals["error"]
+        if record["status"] == "ok":
+            print(f"✅ [{n}/{len(todo)}] {record['contract']} "
+                  f"(risk: {record['overall_risk'] or 'n/a'}, {record['seconds']:.1f}s)")
+        else:
+            print(f"❌ [{n}/{len(todo)}] {record['contract']}: {record['error']}")
+        instr.count("batch_contracts", status=record["status"])
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for path, digest in todo:
+                try:
+                    with instr.stage("batch_prepare"):
+                        contract, context, used = prepare_contract(path, mmr)
+                except Exception as e:
+                    finish({
+                        "contract": str(path), "digest": digest, "model": CHAT_MODEL,
+                        "status": "error", "error": f"{type(e).__name__}: {e}",
+                        "seconds": 0.0, "analysed_at": datetime.now().isoformat(timespec="seconds"),
+                    })
+                    continue
+
+                pending.append(pool.submit(
+                    analyse_contract, llm, limiter, path, digest, contract, context, used
+                ))
+                # Keep retrieval at most a couple of contracts ahead of the LLM calls
+                while len(pending) >= 2 * workers:
+                    finish(pending.popleft().result())
+
+            while pending:
+                finish(pending.popleft().result())
+    finally:
+        writer.close()
+
+    print(f"\n📦 Batch done: {totals['ok']} ok, {totals['error']} failed → {output}")
+    return totals
+
+
+
 # -------------- MAIN --------------
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Contract Compliance RAG Analyzer")
+    parser.add_argument(
+        "--index-report",
+        action="store_true",
+        help="compare recall and latency of ANN index types against the flat index",
+    )
+    parser.add_argument(
+        "--batch",
+        nargs="+",
+        metavar="PATH",
+        help="analyse each contract file (or every .txt/.pdf under each directory)",
+    )
+    parser.add_argument("--output", type=Path, default=BATCH_OUTPUT,
+                        help="JSONL results file, also used to resume (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS,
+                        help="concurrent LLM calls in batch mode")
+    parser.add_argument("--rpm", type=float, default=BATCH_REQUESTS_PER_MINUTE,
+                        help="LLM requests per minute in batch mode (0 = no limit)")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.rpm < 0:
+        parser.error("--rpm must be 0 (no limit) or positive")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    instr.init("rag_system")
     print("🚀 Starting Contract Compliance RAG Analyzer...\n")
 
     files = find_files(DATASET_PATH)
@@ -174,21 +1108,34 @@ def main():
 
     print(f"📄 Found {len(files)} contract files")
 
-    docs = load_documents(files)
-    chunks = split_docs(docs)
+    with instr.stage("update_index"):
+        vs = update_faiss(files)
+
+    if args.index_report:
+        flat = faiss.read_index(str(INDEX_PATH / "index.faiss"))
+        index_report(flat)
+        return
 
-    print(f"✂️ Created {len(chunks)} chunks")
+    if args.batch:
+        run_batch(vs, args.batch, args.output, args.workers, args.rpm)
+        instr.report()
+        return
 
-    vs = build_faiss(chunks)
     retriever = get_retriever(vs)
     chain = make_chain(retriever)
 
     print("🔍 Analyzing contract against compliance standards...\n")
+    print("📝 Analysis Result:\n")
 
-    resp = chain.invoke(QUESTION)
+    # Print tokens as they arrive instead of waiting for the full answer
+    stats = StreamStats()
+    handler = instr.callback_handler(CHAT_MODEL)
+    with instr.stage("analysis"):
+        for piece in timed_stream(chain.stream(QUESTION, config={"callbacks": [handler]}), stats):
+            print(piece, end="", flush=True)
 
-    print("📝 Analysis Result:\n")
-    print(resp)
+    print(f"\n\n⏱ {stats.summary()}")
+    instr.report()
 
 
 
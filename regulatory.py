@@ -1,10 +1,24 @@
 import os
+import csv
 import json
+import argparse
+import hashlib
+import sqlite3
+import zlib
 import threading
 import time
+import random
+import queue
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import get_context
+from collections import deque, OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
 from uuid import uuid4
 
+import instrumentation as instr
+
 # ===============================================================
 # CONFIGURATION (uses your dataset folder)
 # ===============================================================
@@ -12,10 +26,20 @@ DATASET = r"D:\AI-Powered-RegulatoryCompliance-Checker-for-Contracts\Dataset"
 REG_FILE = os.path.join(DATASET, "regulations.json")
 CONTRACT_FILE = os.path.join(DATASET, "contracts_index.json")
 CONTRACT_DIR = os.path.join(DATASET, "contracts")
+DB_FILE = os.path.join(DATASET, "regulatory.db")
 SCHEDULER_INTERVAL = 30
+FEED_DIR = os.path.join(DATASET, "feed")
+FEED_SYNTHETIC = os.getenv("FEED_SYNTHETIC", "1") == "1"   # emit a mock regulation when the feed is idle
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "2"))
+SCHEDULER_QUEUE_MAX = int(os.getenv("SCHEDULER_QUEUE_MAX", "100"))
+COALESCE_WINDOW = float(os.getenv("COALESCE_WINDOW", "1.0"))   # seconds to gather a burst
+COALESCE_MAX = int(os.getenv("COALESCE_MAX", "50"))
+BATCH_SIZE = 256
+VERSION_CACHE_SIZE = 128
 
-stop_event = threading.Event()
-scheduler_thread = None
+scheduler = None
+reg_index = None
+store = None
 
 
 # ===============================================================
@@ -23,12 +47,9 @@ scheduler_thread = None
 # ===============================================================
 def ensure_dirs():
     os.makedirs(CONTRACT_DIR, exist_ok=True)
-    if not os.path.exists(REG_FILE):
-        with open(REG_FILE, "w") as f:
-            json.dump([], f, indent=2)
-    if not os.path.exists(CONTRACT_FILE):
-        with open(CONTRACT_FILE, "w") as f:
-            json.dump({}, f, indent=2)
+    s = get_store()
+    if s.is_empty() and (os.path.exists(REG_FILE) or os.path.exists(CONTRACT_FILE)):
+        s.import_json(REG_FILE, CONTRACT_FILE)
 
 
 def load_json(path):
@@ -36,9 +57,339 @@ def load_json(path):
         return json.load(f)
 
 
-def save_json(path, data):
-    with open(path, "w") as f:
-        json.dump(data, f, indent=2)
+# ===============================================================
+# TRANSACTIONAL STORE (SQLite, WAL mode)
+# ===============================================================
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS regulations (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    jurisdiction TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    keywords TEXT NOT NULL,
+    seq INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS contracts (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    jurisdiction TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    file TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS applied (
+    contract_id TEXT NOT NULL REFERENCES contracts(id),
+    regulation_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    PRIMARY KEY (contract_id, regulation_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS versions (
+    contract_id TEXT NOT NULL REFERENCES contracts(id),
+    version INTEGER NOT NULL,
+    parent INTEGER,
+    blob TEXT REFERENCES blobs(hash),
+    file TEXT,
+    PRIMARY KEY (contract_id, version)
+);
+CREATE TABLE IF NOT EXISTS scores (
+    regulation_id TEXT NOT NULL,
+    contract_id TEXT NOT NULL,
+    contract_version INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    matches TEXT NOT NULL,
+    scored_at TEXT NOT NULL,
+    PRIMARY KEY (regulation_id, contract_id)
+);
+CREATE INDEX IF NOT EXISTS idx_regulations_jurisdiction ON regulations(jurisdiction);
+CREATE INDEX IF NOT EXISTS idx_contracts_jurisdiction ON contracts(jurisdiction);
+CREATE INDEX IF NOT EXISTS idx_applied_regulation ON applied(regulation_id);
+"""
+
+
+class RegulatoryStore:
+    """
+    Regulations, contracts and applied regulations in SQLite.
+    Every thread gets its own connection; writes use BEGIN IMMEDIATE so
+    the CLI and scheduler threads never lose each other's updates.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._versions = OrderedDict()
+        self._versions_lock = threading.Lock()
+        self.conn().executescript(SCHEMA)
+
+    def conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        conn = self.conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    # ---------- regulations ----------
+    @staticmethod
+    def _reg(row):
+        return {
+            "id": row["id"],
+            "title": row["title"],
+            "jurisdiction": row["jurisdiction"],
+            "summary": row["summary"],
+            "keywords": json.loads(row["keywords"]),
+        }
+
+    def load_regulations(self, jurisdictions=None):
+        sql = "SELECT * FROM regulations"
+        params = ()
+        if jurisdictions:
+            sql += f" WHERE jurisdiction IN ({','.join('?' * len(jurisdictions))})"
+            params = tuple(jurisdictions)
+        rows = self.conn().execute(sql + " ORDER BY seq", params).fetchall()
+        return [self._reg(r) for r in rows]
+
+    def get_regulation(self, rid):
+        row = self.conn().execute("SELECT * FROM regulations WHERE id = ?", (rid,)).fetchone()
+        return self._reg(row) if row else None
+
+    def add_regulation(self, reg, conn=None):
+        def insert(c):
+            c.execute(
+                "INSERT OR IGNORE INTO regulations (id, title, jurisdiction, summary, keywords, seq) "
+                "VALUES (?, ?, ?, ?, ?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM regulations))",
+                (reg["id"], reg["title"], reg["jurisdiction"], reg["summary"],
+                 json.dumps(reg["keywords"])),
+            )
+
+        if conn is not None:
+            insert(conn)
+        else:
+            with self.transaction() as c:
+                insert(c)
+
+    # ---------- contracts ----------
+    def _applied(self, conn, cids=None):
+        sql = "SELECT contract_id, regulation_id FROM applied"
+        params = ()
+        if cids is not None:
+            sql += f" WHERE contract_id IN ({','.join('?' * len(cids))})"
+            params = tuple(cids)
+        applied = {}
+        for row in conn.execute(sql + " ORDER BY seq", params):
+            applied.setdefault(row["contract_id"], []).append(row["regulation_id"])
+        return applied
+
+    def load_contracts(self, jurisdictions=None):
+        conn = self.conn()
+        sql = "SELECT * FROM contracts"
+        params = ()
+        if jurisdictions:
+            sql += f" WHERE jurisdiction IN ({','.join('?' * len(jurisdictions))})"
+            params = tuple(jurisdictions)
+        rows = conn.execute(sql + " ORDER BY id", params).fetchall()
+        applied = self._applied(conn)
+        return {
+            r["id"]: {
+                "id": r["id"],
+                "name": r["name"],
+                "jurisdiction": r["jurisdiction"],
+                "version": r["version"],
+                "file": r["file"],
+                "applied": applied.get(r["id"], []),
+            }
+            for r in rows
+        }
+
+    def get_contract(self, cid, conn=None):
+        conn = conn or self.conn()
+        row = conn.execute("SELECT * FROM contracts WHERE id = ?", (cid,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": cid,
+            "name": row["name"],
+            "jurisdiction": row["jurisdiction"],
+            "version": row["version"],
+            "file": row["file"],
+            "applied": self._applied(conn, [cid]).get(cid, []),
+        }
+
+    def put_contract(self, cid, meta, conn):
+        conn.execute(
+            "INSERT OR REPLACE INTO contracts (id, name, jurisdiction, version, file) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (cid, meta["name"], meta["jurisdiction"], meta["version"], meta["file"]),
+        )
+        for rid in meta.get("applied", []):
+            self.mark_applied(cid, rid, conn)
+
+    def mark_applied(self, cid, rid, conn):
+        conn.execute(
+            "INSERT OR IGNORE INTO applied (contract_id, regulation_id, seq) "
+            "VALUES (?, ?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM applied))",
+            (cid, rid),
+        )
+
+    def set_version(self, cid, version, file, conn):
+        conn.execute(
+            "UPDATE contracts SET version = ?, file = ? WHERE id = ?", (version, file, cid)
+        )
+
+    # ---------- relevance scores ----------
+    def save_scores(self, rows):
+        """rows: (reg_id, contract_id, contract_version, score, matches)"""
+        now = datetime.utcnow().isoformat()
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO scores "
+                "(regulation_id, contract_id, contract_version, score, matches, scored_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                ((rid, cid, ver, score, json.dumps(matches), now)
+                 for rid, cid, ver, score, matches in rows),
+            )
+
+    def load_scores(self, reg_id):
+        rows = self.conn().execute(
+            "SELECT contract_id, score, matches FROM scores "
+            "WHERE regulation_id = ? ORDER BY score DESC, contract_id",
+            (reg_id,),
+        ).fetchall()
+        return [(r["contract_id"], r["score"], json.loads(r["matches"])) for r in rows]
+
+    # ---------- versions (content-addressed deltas) ----------
+    def put_blob(self, text, conn):
+        """Store `text` once, keyed by its SHA-256; returns the hash."""
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        conn.execute(
+            "INSERT OR IGNORE INTO blobs (hash, data) VALUES (?, ?)",
+            (digest, zlib.compress(text.encode("utf-8"))),
+        )
+        return digest
+
+    def add_delta_version(self, cid, meta, delta_hash, conn):
+        """
+        Record version N+1 of `cid` as version N plus an appended delta.
+        A version that only exists as a file becomes the chain's base.
+        """
+        version = meta["version"]
+        exists = conn.execute(
+            "SELECT 1 FROM versions WHERE contract_id = ? AND version = ?", (cid, version)
+        ).fetchone()
+        if not exists:
+            conn.execute(
+                "INSERT INTO versions (contract_id, version, parent, blob, file) "
+                "VALUES (?, ?, NULL, NULL, ?)",
+                (cid, version, meta["file"]),
+            )
+        conn.execute(
+            "INSERT INTO versions (contract_id, version, parent, blob, file) "
+            "VALUES (?, ?, ?, ?, NULL)",
+            (cid, version + 1, version, delta_hash),
+        )
+        self.set_version(cid, version + 1, meta["file"], conn)
+        return version + 1
+
+    def version_text(self, cid, version):
+        """
+        Rebuild `version` of `cid` by replaying deltas from the nearest
+        cached or file-backed ancestor. Returns None for contracts whose
+        versions are plain files only.
+        """
+        conn = self.conn()
+        chain = []
+        current = version
+        base = None
+
+        while current is not None:
+            with self._versions_lock:
+                cached = self._versions.get((cid, current))
+                if cached is not None:
+                    self._versions.move_to_end((cid, current))
+            if cached is not None:
+                base = cached
+                break
+
+            row = conn.execute(
+                "SELECT parent, blob, file FROM versions WHERE contract_id = ? AND version = ?",
+                (cid, current),
+            ).fetchone()
+            if row is None:
+                if not chain:
+                    return None
+                raise ValueError(f"Missing version {current} of contract {cid}")
+
+            if row["file"]:
+                with open(os.path.join(DATASET, row["file"]), "r") as f:
+                    base = f.read()
+                self._cache_version(cid, current, base)
+                break
+
+            data = conn.execute("SELECT data FROM blobs WHERE hash = ?", (row["blob"],)).fetchone()
+            chain.append((current, zlib.decompress(data[0]).decode("utf-8")))
+            current = row["parent"]
+
+        text = base or ""
+        for ver, delta in reversed(chain):
+            # Each amendment was appended to the lowercased previous version
+            text = text.lower() + delta
+            self._cache_version(cid, ver, text)
+        return text
+
+    def _cache_version(self, cid, version, text):
+        with self._versions_lock:
+            self._versions[(cid, version)] = text
+            self._versions.move_to_end((cid, version))
+            while len(self._versions) > VERSION_CACHE_SIZE:
+                self._versions.popitem(last=False)
+
+    # ---------- maintenance ----------
+    def is_empty(self):
+        conn = self.conn()
+        regs = conn.execute("SELECT COUNT(*) FROM regulations").fetchone()[0]
+        contracts = conn.execute("SELECT COUNT(*) FROM contracts").fetchone()[0]
+        return regs == 0 and contracts == 0
+
+    def reset(self, conn):
+        conn.execute("DELETE FROM scores")
+        conn.execute("DELETE FROM versions")
+        conn.execute("DELETE FROM blobs")
+        conn.execute("DELETE FROM applied")
+        conn.execute("DELETE FROM contracts")
+        conn.execute("DELETE FROM regulations")
+
+    def import_json(self, reg_file=REG_FILE, contract_file=CONTRACT_FILE):
+        """Import the legacy regulations.json / contracts_index.json files."""
+        regs = load_json(reg_file) if os.path.exists(reg_file) else []
+        contracts = load_json(contract_file) if os.path.exists(contract_file) else {}
+        with self.transaction() as conn:
+            for reg in regs:
+                self.add_regulation(reg, conn)
+            for cid, meta in contracts.items():
+                self.put_contract(cid, meta, conn)
+        print(f"[IMPORT] {len(regs)} regulations, {len(contracts)} contracts → {self.path}")
+
+
+def get_store():
+    global store
+    if store is None:
+        store = RegulatoryStore(DB_FILE)
+    return store
 
 
 # ===============================================================
@@ -61,7 +412,6 @@ def init_sample_data():
             "keywords": ["localisation", "cross-border", "personal data"]
         },
     ]
-    save_json(REG_FILE, regs)
 
     contracts = {
         "CT001": {
@@ -79,7 +429,13 @@ def init_sample_data():
             "applied": []
         }
     }
-    save_json(CONTRACT_FILE, contracts)
+    s = get_store()
+    with s.transaction() as conn:
+        s.reset(conn)
+        for reg in regs:
+            s.add_regulation(reg, conn)
+        for cid, meta in contracts.items():
+            s.put_contract(cid, meta, conn)
 
     with open(os.path.join(DATASET, contracts["CT001"]["file"]), "w") as f:
         f.write("Processing of personal data is allowed. Consent handled by customer.")
@@ -94,6 +450,10 @@ def init_sample_data():
 # CONTRACT / REGULATION FUNCTIONS
 # ===============================================================
 def read_contract(meta):
+    if meta.get("id"):
+        text = get_store().version_text(meta["id"], meta["version"])
+        if text is not None:
+            return text.lower()
     with open(os.path.join(DATASET, meta["file"]), "r") as f:
         return f.read().lower()
 
@@ -114,87 +474,890 @@ def relevance(reg, meta, text):
     return score, matches
 
 
-def apply_regulation(reg, cid):
-    index = load_json(CONTRACT_FILE)
-    meta = index[cid]
+# ===============================================================
+# KEYWORD INDEX (Aho-Corasick over all regulation keywords)
+# ===============================================================
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton: finds every added keyword occurring as a
+    substring of a text in a single pass. Keywords can be added at any
+    time; failure links are rebuilt lazily before the next search.
+    """
 
-    if reg["id"] in meta["applied"]:
-        print("⚠ Regulation already applied to this contract.")
-        return
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [set()]
+        self.words = set()
+        self._dirty = False
+
+    def add(self, word):
+        if word in self.words:
+            return
+        node = 0
+        for ch in word:
+            nxt = self.goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append(set())
+                self.goto[node][ch] = nxt
+            node = nxt
+        self.out[node].add(word)
+        self.words.add(word)
+        self._dirty = True
+
+    def _build(self):
+        # Terminal outputs are recomputed from the trie, then merged via fail links
+        matches = [set() for _ in self.goto]
+        for word in self.words:
+            node = 0
+            for ch in word:
+                node = self.goto[node][ch]
+            matches[node].add(word)
 
-    text = read_contract(meta)
-    new_version = meta["version"] + 1
-    new_file = f"contracts/{cid}-v{new_version}.txt"
+        queue = deque()
+        for child in self.goto[0].values():
+            self.fail[child] = 0
+            queue.append(child)
 
-    amendment = f"\n\n--- Amendment on {datetime.utcnow().isoformat()} ---\nApplied Regulation: {reg['title']}\nSummary: {reg['summary']}\n"
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.goto[node].items():
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[child] = self.goto[f].get(ch, 0)
+                matches[child] |= matches[self.fail[child]]
+                queue.append(child)
 
-    with open(os.path.join(DATASET, new_file), "w") as f:
-        f.write(text + amendment)
+        self.out = matches
+        self._dirty = False
 
-    meta["version"] = new_version
-    meta["file"] = new_file
-    meta["applied"].append(reg["id"])
-    index[cid] = meta
-    save_json(CONTRACT_FILE, index)
+    def find(self, text):
+        if self._dirty:
+            self._build()
+        found = set()
+        node = 0
+        for ch in text:
+            while node and ch not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(ch, 0)
+            if self.out[node]:
+                found |= self.out[node]
+        return found
 
+
+class RegulationIndex:
+    """
+    Precomputed relevance index: one automaton over every regulation
+    keyword plus a jurisdiction -> regulations map. Each contract is
+    scanned once and scored against all regulations; scores match
+    `relevance()`.
+    """
+
+    def __init__(self, regs=()):
+        self.regs = {}
+        self.automaton = KeywordAutomaton()
+        self.by_jurisdiction = {}
+        self._lock = threading.Lock()
+        for reg in regs:
+            self.add(reg)
+
+    def add(self, reg):
+        with self._lock:
+            if reg["id"] in self.regs:
+                return
+            self.regs[reg["id"]] = reg
+            for kw in reg["keywords"]:
+                self.automaton.add(kw)
+            self.by_jurisdiction.setdefault(reg["jurisdiction"].lower(), []).append(reg["id"])
+
+    def analyse(self, meta, text):
+        """Return [(reg, score, matches)] for every indexed regulation, in order."""
+        with self._lock:
+            found = self.automaton.find(text)
+            juris = meta["jurisdiction"].lower()
+            in_scope = set(self.by_jurisdiction.get("global", []))
+            in_scope.update(self.by_jurisdiction.get(juris, []))
+
+            results = []
+            for rid, reg in self.regs.items():
+                matches = [kw for kw in reg["keywords"] if kw in found]
+                score = 2 * len(matches)
+                if rid in in_scope:
+                    score += 3
+                    matches.append(f"jurisdiction:{reg['jurisdiction']}")
+                results.append((reg, score, matches))
+            return results
+
+
+def get_reg_index():
+    global reg_index
+    if reg_index is None:
+        reg_index = RegulationIndex(get_store().load_regulations())
+    return reg_index
+
+
+def amendment_text(reg):
+    return f"\n\n--- Amendment on {datetime.utcnow().isoformat()} ---\nApplied Regulation: {reg['title']}\nSummary: {reg['summary']}\n"
+
+
+def apply_regulation(reg, cid):
+    s = get_store()
+    # The write lock is held from the "already applied" check to the
+    # version bump, so concurrent applies cannot both create vN+1.
+    with s.transaction() as conn:
+        meta = s.get_contract(cid, conn)
+
+        if reg["id"] in meta["applied"]:
+            print("⚠ Regulation already applied to this contract.")
+            return
+
+        delta = s.put_blob(amendment_text(reg), conn)
+        new_version = s.add_delta_version(cid, meta, delta, conn)
+        s.mark_applied(cid, reg["id"], conn)
+
+    instr.count("contract_versions_created")
     print(f"✔ Regulation applied → new version created: v{new_version}")
 
 
+def bulk_apply_regulation(reg, min_score=1, jurisdictions=None):
+    """
+    Apply `reg` to every contract scoring at least `min_score` against it,
+    in a single transaction. All new versions share one amendment blob.
+    Returns the IDs of the contracts that were amended.
+    """
+    s = get_store()
+    index = RegulationIndex([reg])
+
+    candidates = []
+    with instr.stage("bulk_apply_scan"):
+        for cid, meta in s.load_contracts(jurisdictions=jurisdictions).items():
+            if reg["id"] in meta["applied"]:
+                continue
+            (_, score, _), = index.analyse(meta, read_contract(meta))
+            if score >= min_score:
+                candidates.append(cid)
+
+    amended = []
+    with instr.stage("bulk_apply_write"), s.transaction() as conn:
+        delta = s.put_blob(amendment_text(reg), conn)
+        for cid in candidates:
+            meta = s.get_contract(cid, conn)
+            if reg["id"] in meta["applied"]:
+                continue  # applied concurrently since the scan
+            s.add_delta_version(cid, meta, delta, conn)
+            s.mark_applied(cid, reg["id"], conn)
+            amended.append(cid)
+
+    instr.count("contract_versions_created", len(amended))
+    print(f"✔ {reg['id']} applied to {len(amended)} contracts in one transaction")
+    return amended
+
+
+def export_version(cid, version=None, output=None):
+    """Rebuild any stored version of a contract and optionally write it out."""
+    s = get_store()
+    meta = s.get_contract(cid)
+    if meta is None:
+        raise SystemExit(f"❌ Unknown contract {cid}")
+    if version is None:
+        version = meta["version"]
+    if not 1 <= version <= meta["version"]:
+        raise SystemExit(f"❌ {cid} has no version {version} (latest is v{meta['version']})")
+
+    text = s.version_text(cid, version)
+    if text is None:
+        # Only the current version can live solely in the contract file
+        if version != meta["version"]:
+            raise SystemExit(f"❌ Version {version} of {cid} is not stored")
+        with open(os.path.join(DATASET, meta["file"]), "r") as f:
+            text = f.read()
+
+    if output:
+        with open(output, "w") as f:
+            f.write(text)
+        print(f"✔ {cid} v{version} written to {output}")
+    return text
+
+
+# ===============================================================
+# BATCH RELEVANCE ANALYSIS
+# ===============================================================
+BATCH_FIELDS = ["contract_id", "regulation_id", "score", "matches", "error"]
+_worker_index = None
+
+
+def _init_batch_worker(regs, dataset=None, db_file=None):
+    """
+    Pool initializer. Workers are spawned, never forked, so none of them
+    shares the parent's SQLite connection; each opens its own store (and
+    version cache) on `db_file` on first use.
+    """
+    global _worker_index, DATASET, DB_FILE, store
+    if db_file is not None:
+        DATASET, DB_FILE, store = dataset, db_file, None
+    _worker_index = RegulationIndex(regs)
+
+
+def _analyse_batch(items):
+    rows = []
+    for cid, meta in items:
+        # One bad contract (unreadable file, missing version, bad metadata)
+        # becomes an error row instead of aborting the whole sweep
+        try:
+            text = read_contract(meta)
+            rows.extend({
+                "contract_id": cid,
+                "regulation_id": reg["id"],
+                "score": score,
+                "matches": matches,
+            } for reg, score, matches in _worker_index.analyse(meta, text))
+        except Exception as e:
+            rows.append({"contract_id": cid, "error": f"{type(e).__name__}: {e}"})
+    return len(items), rows
+
+
+def run_batch(output, fmt="jsonl", reg_ids=None, contract_ids=None,
+              jurisdictions=None, workers=None, batch_size=BATCH_SIZE, min_score=0):
+    """
+    Score every selected contract against every selected regulation and
+    write a long-format relevance matrix (one row per pair) as JSONL or
+    CSV. Contracts are read and scored in a process pool; returns a
+    throughput summary.
+    """
+    s = get_store()
+    regs = s.load_regulations()
+    if reg_ids:
+        regs = [r for r in regs if r["id"] in reg_ids]
+
+    index = s.load_contracts(jurisdictions=jurisdictions)
+    items = [
+        (cid, meta) for cid, meta in index.items()
+        if not contract_ids or cid in contract_ids
+    ]
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    workers = workers or os.cpu_count() or 1
+
+    start = time.perf_counter()
+    contracts = pairs = errors = 0
+
+    with open(output, "w", newline="", encoding="utf-8", buffering=1 << 20) as f:
+        writer = None
+        if fmt == "csv":
+            writer = csv.DictWriter(f, fieldnames=BATCH_FIELDS)
+            writer.writeheader()
+
+        if workers > 1 and len(batches) > 1:
+            pool = get_context("spawn").Pool(
+                workers, initializer=_init_batch_worker, initargs=(regs, DATASET, DB_FILE)
+            )
+            results = pool.imap(_analyse_batch, batches)
+        else:
+            pool = None
+            _init_batch_worker(regs)
+            results = map(_analyse_batch, batches)
+
+        try:
+            for n, rows in instr.timed_iter("relevance_batch", results):
+                contracts += n
+                for row in rows:
+                    if "error" in row:
+                        errors += 1
+                    elif row["score"] < min_score:
+                        continue
+                    else:
+                        pairs += 1
+
+                    if writer:
+                        writer.writerow({**row, "matches": ";".join(row.get("matches", []))})
+                    else:
+                        f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    elapsed = time.perf_counter() - start
+    instr.count("contracts_scored", contracts)
+    instr.count("relevance_pairs_written", pairs)
+    summary = {
+        "contracts": contracts,
+        "regulations": len(regs),
+        "pairs_written": pairs,
+        "errors": errors,
+        "workers": workers if pool is not None else 1,
+        "elapsed_s": round(elapsed, 3),
+        "contracts_per_sec": round(contracts / elapsed, 1) if elapsed else 0.0,
+        "output": output,
+    }
+    print(f"📊 Batch relevance: {contracts} contracts × {len(regs)} regulations "
+          f"in {elapsed:.2f}s ({summary['contracts_per_sec']} contracts/s) → {output}")
+    return summary
+
+
 # ===============================================================
 # MOCK API - AUTO REGULATION CREATION
 # ===============================================================
-def fetch_mock_regulation():
-    regs = load_json(REG_FILE)
-    new = {
+MOCK_TOPICS = [
+    ("Global Privacy Profiling Disclosure", "GLOBAL",
+     "Requires organisations to notify users of automated profiling.",
+     ["profiling", "notice", "transparency"]),
+    ("EU Processor Breach Notification", "EU",
+     "Processors must report personal data breaches within 72 hours.",
+     ["breach", "processor", "personal data"]),
+    ("India Cross-Border Transfer Rules", "IN",
+     "Cross-border transfers need an adequacy decision or safeguards.",
+     ["cross-border", "transfer", "safeguards"]),
+]
+
+
+def mock_regulation():
+    title, juris, summary, keywords = random.choice(MOCK_TOPICS)
+    return {
         "id": f"REG-MOCK-{uuid4().hex[:6]}",
-        "title": "Global Privacy Profiling Disclosure",
-        "jurisdiction": "GLOBAL",
-        "summary": "Requires organisations to notify users of automated profiling.",
-        "keywords": ["profiling", "notice", "transparency"],
+        "title": title,
+        "jurisdiction": juris,
+        "summary": summary,
+        "keywords": keywords,
     }
-    regs.append(new)
-    save_json(REG_FILE, regs)
+
+
+def fetch_mock_regulation():
+    new = mock_regulation()
+    get_store().add_regulation(new)
+    if reg_index is not None:
+        reg_index.add(new)
     print(f"🌍 New mock regulation fetched → {new['id']}")
 
 
 # ===============================================================
-# SCHEDULER
+# FEED SOURCE (local stand-in for a regulator API)
 # ===============================================================
-def scheduler_job():
-    print("[Scheduler running]")
-    while not stop_event.is_set():
-        fetch_mock_regulation()
-        time.sleep(SCHEDULER_INTERVAL)
-    print("[Scheduler stopped]")
+REG_FIELDS = {"id": str, "title": str, "jurisdiction": str, "summary": str, "keywords": list}
+
+
+def validate_regulation(reg):
+    """Return why `reg` cannot be ingested, or None if it is well formed."""
+    if not isinstance(reg, dict):
+        return "not an object"
+    missing = [f for f in REG_FIELDS if f not in reg]
+    if missing:
+        return f"missing {', '.join(missing)}"
+    wrong = [f for f, t in REG_FIELDS.items() if not isinstance(reg[f], t)]
+    if wrong:
+        return f"wrong type for {', '.join(wrong)}"
+    if not all(isinstance(k, str) for k in reg["keywords"]):
+        return "keywords must be strings"
+    return None
+
+
+class LocalFeedSource:
+    """
+    Reads regulations dropped into `directory` as *.json files (one
+    regulation or a list). Files are moved to processed/ once acked, so
+    nothing is lost if the scheduler stops mid-burst. With `synthetic`
+    an idle poll yields one mock regulation instead.
+    """
+
+    def __init__(self, directory=FEED_DIR, synthetic=FEED_SYNTHETIC):
+        self.directory = directory
+        self.processed = os.path.join(directory, "processed")
+        self.synthetic = synthetic
+        self.rejected = 0
+        os.makedirs(self.processed, exist_ok=True)
+
+    def poll(self):
+        """Yield (regulation, ack) pairs; call ack() after the item is queued."""
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith(".json"))
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                data = load_json(path)
+            except (OSError, json.JSONDecodeError) as e:
+                self.reject(name, f"unreadable: {e}")
+                continue
+
+            regs = data if isinstance(data, list) else [data]
+            errors = [f"item {i}: {err}" for i, err in
+                      ((i, validate_regulation(reg)) for i, reg in enumerate(regs)) if err]
+            if errors or not regs:
+                self.reject(name, "; ".join(errors) or "no regulations")
+                continue
+
+            done = lambda p=path, n=name: os.replace(p, os.path.join(self.processed, n))
+            for i, reg in enumerate(regs):
+                # The file is archived once its last regulation is queued
+                yield reg, done if i == len(regs) - 1 else (lambda: None)
+
+        if not names and self.synthetic:
+            yield mock_regulation(), (lambda: None)
+
+    def reject(self, name, reason):
+        """Move a feed file that cannot be ingested to processed/<name>.bad."""
+        print(f"⚠ Rejected feed file {name}: {reason}")
+        instr.count("feed_files_rejected")
+        self.rejected += 1
+        os.replace(os.path.join(self.directory, name), os.path.join(self.processed, name + ".bad"))
+
+
+# ===============================================================
+# INCREMENTAL RE-SCORING
+# ===============================================================
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class KeywordPostings:
+    """
+    keyword -> IDs of the contracts whose text contains it.
+
+    Each contract is read once per version: the scan fills the postings
+    of every known keyword and a trigram index of its text. A keyword
+    seen for the first time is then checked only against the contracts
+    holding all of its trigrams, so new regulations read a handful of
+    contracts instead of the whole portfolio.
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.versions = {}
+        self.grams = {}        # trigram -> contract IDs
+        self.doc_grams = {}    # contract ID -> its trigrams
+        self.automaton = KeywordAutomaton()
+        self.reads = 0
+        self._lock = threading.Lock()
+
+    def _index(self, cid, text):
+        for g in self.doc_grams.pop(cid, ()):
+            self.grams[g].discard(cid)
+        grams = trigrams(text)
+        for g in grams:
+            self.grams.setdefault(g, set()).add(cid)
+        self.doc_grams[cid] = grams
+
+    def _candidates(self, kw, contracts):
+        if len(kw) < 3:
+            return set(contracts)
+        ids = None
+        for g in sorted(trigrams(kw), key=lambda g: len(self.grams.get(g, ()))):
+            ids = self.grams.get(g, set()) if ids is None else ids & self.grams.get(g, set())
+            if not ids:
+                break
+        return ids & contracts.keys()
+
+    def _read(self, meta):
+        self.reads += 1
+        return read_contract(meta)
+
+    def lookup(self, contracts, keywords):
+        with self._lock:
+            fresh = [kw for kw in dict.fromkeys(keywords) if kw not in self.postings]
+            for kw in fresh:
+                self.automaton.add(kw)
+                self.postings[kw] = set()
+
+            # Changed or unseen contracts: one read covers every keyword
+            stale = {cid for cid, meta in contracts.items()
+                     if self.versions.get(cid) != meta["version"]}
+            for cid in stale:
+                text = self._read(contracts[cid])
+                found = self.automaton.find(text)
+                for kw, ids in self.postings.items():
+                    if kw in found:
+                        ids.add(cid)
+                    else:
+                        ids.discard(cid)
+                self._index(cid, text)
+                self.versions[cid] = contracts[cid]["version"]
+
+            # New keywords: verify only the trigram candidates not read above
+            if fresh:
+                scan = KeywordAutomaton()
+                candidates = set()
+                for kw in fresh:
+                    scan.add(kw)
+                    candidates |= self._candidates(kw, contracts)
+                for cid in candidates - stale:
+                    for kw in scan.find(self._read(contracts[cid])):
+                        self.postings[kw].add(cid)
+
+            return {kw: self.postings[kw] & contracts.keys() for kw in keywords}
+
+
+def rescore(regs, postings):
+    """
+    Score only the contracts a batch of new regulations can affect:
+    those in jurisdiction scope plus those containing a keyword.
+    Scores match `relevance()`. Returns the number of contracts touched.
+    """
+    s = get_store()
+    contracts = s.load_contracts()
+    with instr.stage("keyword_postings"):
+        hits = postings.lookup(contracts, [kw for r in regs for kw in r["keywords"]])
+
+    rows = []
+    affected = set()
+    for reg in regs:
+        juris = reg["jurisdiction"].lower()
+        if juris == "global":
+            in_scope = set(contracts)
+        else:
+            in_scope = {cid for cid, m in contracts.items() if m["jurisdiction"].lower() == juris}
+
+        candidates = set(in_scope)
+        for kw in reg["keywords"]:
+            candidates |= hits[kw]
+
+        for cid in candidates:
+            matches = [kw for kw in reg["keywords"] if cid in hits[kw]]
+            score = 2 * len(matches)
+            if cid in in_scope:
+                score += 3
+                matches.append(f"jurisdiction:{reg['jurisdiction']}")
+            rows.append((reg["id"], cid, contracts[cid]["version"], score, matches))
+        affected |= candidates
+
+    with instr.stage("save_scores"):
+        s.save_scores(rows)
+    instr.count("contracts_rescored", len(affected))
+    return len(affected)
+
+
+# ===============================================================
+# SCHEDULER (feed -> bounded queue -> coalescing dispatcher -> workers)
+# ===============================================================
+class SchedulerMetrics:
+    def __init__(self, queue_ref):
+        self.queue = queue_ref
+        self.lock = threading.Lock()
+        self.enqueued = 0
+        self.processed = 0
+        self.duplicates = 0
+        self.batches = 0
+        self.contracts_rescored = 0
+        self.backpressure_waits = 0
+        self.max_depth = 0
+        self.lags = deque(maxlen=500)
+        self.last_batch_seconds = 0.0
+        self.poll_errors = 0
+        self.last_poll_error = None
+        self.rescore_errors = 0
+        self.poller_alive = False
+        self.dispatcher_alive = False
+
+    def inc(self, name, n=1):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def observe_depth(self):
+        depth = self.queue.qsize()
+        instr.gauge("scheduler_queue_depth", depth)
+        with self.lock:
+            self.max_depth = max(self.max_depth, depth)
+
+    def set_alive(self, name, alive):
+        instr.gauge(f"scheduler_{name}_alive", int(alive))
+        with self.lock:
+            setattr(self, f"{name}_alive", alive)
+
+    def record_poll_error(self, error):
+        instr.count("scheduler_poll_errors")
+        with self.lock:
+            self.poll_errors += 1
+            self.last_poll_error = error
+
+    def record_batch(self, lags, contracts, seconds):
+        instr.count("regulations_processed", len(lags))
+        instr.gauge("scheduler_queue_depth", self.queue.qsize())
+        for lag in lags:
+            instr.metrics.observe("scheduler_lag", lag)
+        with self.lock:
+            self.batches += 1
+            self.processed += len(lags)
+            self.contracts_rescored += contracts
+            self.lags.extend(lags)
+            self.last_batch_seconds = seconds
+
+    def snapshot(self):
+        with self.lock:
+            lags = sorted(self.lags)
+            return {
+                "queue_depth": self.queue.qsize(),
+                "max_queue_depth": self.max_depth,
+                "enqueued": self.enqueued,
+                "processed": self.processed,
+                "duplicates_coalesced": self.duplicates,
+                "batches": self.batches,
+                "contracts_rescored": self.contracts_rescored,
+                "backpressure_waits": self.backpressure_waits,
+                "lag_avg_s": round(sum(lags) / len(lags), 3) if lags else 0.0,
+                "lag_p95_s": round(lags[int(0.95 * (len(lags) - 1))], 3) if lags else 0.0,
+                "last_batch_s": round(self.last_batch_seconds, 3),
+                "poller_alive": self.poller_alive,
+                "dispatcher_alive": self.dispatcher_alive,
+                "poll_errors": self.poll_errors,
+                "last_poll_error": self.last_poll_error,
+                "rescore_errors": self.rescore_errors,
+            }
+
+
+class RegulationScheduler:
+    """
+    The feed poller stores each new regulation and pushes it onto a
+    bounded queue; when the queue is full the poller blocks (and counts
+    a backpressure wait) instead of reading more of the feed. A
+    dispatcher drains bursts for up to COALESCE_WINDOW seconds, drops
+    duplicate IDs and hands each batch to the worker pool, which
+    re-scores only the affected contracts.
+    """
+
+    def __init__(self, source=None, interval=SCHEDULER_INTERVAL, workers=SCHEDULER_WORKERS,
+                 max_queue=SCHEDULER_QUEUE_MAX, window=COALESCE_WINDOW, max_batch=COALESCE_MAX):
+        self.source = source or LocalFeedSource()
+        self.interval = interval
+        self.window = window
+        self.max_batch = max_batch
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.metrics = SchedulerMetrics(self.queue)
+        self.postings = KeywordPostings()
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.slots = threading.Semaphore(workers)   # batches in flight
+        self.stop = threading.Event()
+        self.threads = []
+
+    # ---------- producer ----------
+    def enqueue(self, reg):
+        item = (reg, time.time())
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.5)
+                self.metrics.inc("enqueued")
+                self.metrics.observe_depth()
+                return True
+            except queue.Full:
+                self.metrics.inc("backpressure_waits")
+                instr.count("scheduler_backpressure_waits")
+        return False
+
+    def poll_once(self):
+        for reg, ack in self.source.poll():
+            get_store().add_regulation(reg)
+            if reg_index is not None:
+                reg_index.add(reg)
+            if not self.enqueue(reg):
+                return
+            ack()
+            print(f"🌍 Regulation received → {reg['id']}")
+
+    def poll_feed(self):
+        print("[Scheduler running]")
+        self.metrics.set_alive("poller", True)
+        try:
+            while not self.stop.is_set():
+                try:
+                    self.poll_once()
+                except Exception as e:
+                    # One bad pass (feed I/O, store error) must not end polling
+                    self.metrics.record_poll_error(f"{type(e).__name__}: {e}")
+                    print(f"❌ Feed poll failed: {e}")
+                    traceback.print_exc()
+                self.stop.wait(self.interval)
+        finally:
+            self.metrics.set_alive("poller", False)
+            if not self.stop.is_set():
+                print("❌ Feed poller died; scheduler is unhealthy")
+        print("[Scheduler stopped]")
+
+    # ---------- consumer ----------
+    def next_batch(self):
+        try:
+            first = self.queue.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        batch = {first[0]["id"]: first}
+        deadline = time.time() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                reg, ts = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if reg["id"] in batch:
+                self.metrics.inc("duplicates")
+            else:
+                batch[reg["id"]] = (reg, ts)
+        return list(batch.values())
+
+    def dispatch(self):
+        self.metrics.set_alive("dispatcher", True)
+        try:
+            while not self.stop.is_set() or not self.queue.empty():
+                batch = self.next_batch()
+                if not batch:
+                    continue
+                self.slots.acquire()
+                future = self.pool.submit(self.process, batch)
+                future.add_done_callback(lambda _: self.slots.release())
+        finally:
+            self.metrics.set_alive("dispatcher", False)
+
+    def process(self, batch):
+        start = time.time()
+        try:
+            with instr.stage("rescore"):
+                touched = rescore([reg for reg, _ in batch], self.postings)
+        except Exception as e:
+            print(f"❌ Re-scoring failed for {[reg['id'] for reg, _ in batch]}: {e}")
+            self.metrics.inc("rescore_errors")
+            return
+        done = time.time()
+        self.metrics.record_batch([done - ts for _, ts in batch], touched, done - start)
+
+    # ---------- lifecycle ----------
+    def start(self):
+        self.stop.clear()
+        self.threads = [
+            threading.Thread(target=self.poll_feed, daemon=True),
+            threading.Thread(target=self.dispatch, daemon=True),
+        ]
+        for t in self.threads:
+            t.start()
+
+    def shutdown(self, timeout=10):
+        """Stop polling, drain what is already queued, then wait for the workers."""
+        self.stop.set()
+        for t in self.threads:
+            t.join(timeout)
+        self.pool.shutdown(wait=True)
+
+    def is_running(self):
+        """True while any scheduler thread is still running (needs shutdown)."""
+        return any(t.is_alive() for t in self.threads)
+
+    def is_alive(self):
+        """Health check: both the poller and the dispatcher are running."""
+        return bool(self.threads) and all(t.is_alive() for t in self.threads)
+
+
+def print_metrics(metrics):
+    print("\n--- Scheduler metrics ---")
+    for key, value in metrics.snapshot().items():
+        print(f"  {key}: {value}")
 
 
 def toggle_scheduler():
-    global scheduler_thread
-    if scheduler_thread and scheduler_thread.is_alive():
-        stop_event.set()
-        print("⏹ Scheduler stop requested.")
+    global scheduler
+    if scheduler and scheduler.is_running():
+        if not scheduler.is_alive():
+            print("⚠ Scheduler was unhealthy (a thread had died).")
+        scheduler.shutdown()
+        print("⏹ Scheduler stopped.")
+        print_metrics(scheduler.metrics)
+        scheduler = None
     else:
-        stop_event.clear()
-        scheduler_thread = threading.Thread(target=scheduler_job, daemon=True)
-        scheduler_thread.start()
+        scheduler = RegulationScheduler()
+        scheduler.start()
         print("▶ Scheduler started.")
 
 
 # ===============================================================
 # CLI MENU
 # ===============================================================
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Regulatory Compliance Tracker")
+    sub = parser.add_subparsers(dest="command")
+
+    sub.add_parser("import-json", help="import regulations.json / contracts_index.json into the store")
+
+    apply = sub.add_parser("apply", help="apply one regulation to every relevant contract")
+    apply.add_argument("--reg", required=True, help="regulation ID")
+    apply.add_argument("--min-score", type=int, default=1)
+    apply.add_argument("--jurisdiction", nargs="*", help="only contracts in these jurisdictions")
+
+    version = sub.add_parser("version", help="rebuild a stored contract version")
+    version.add_argument("contract")
+    version.add_argument("--version", type=int, default=None, help="default: latest")
+    version.add_argument("--output", default=None, help="write to file instead of stdout")
+
+    sched = sub.add_parser("scheduler", help="run the feed scheduler headless")
+    sched.add_argument("--duration", type=float, default=60, help="seconds to run before draining")
+    sched.add_argument("--feed", default=FEED_DIR, help="directory polled for regulation *.json files")
+    sched.add_argument("--interval", type=float, default=SCHEDULER_INTERVAL)
+    sched.add_argument("--no-synthetic", action="store_true", help="do not emit mock regulations when idle")
+
+    batch = sub.add_parser("batch", help="non-interactive relevance matrix for all contracts")
+    batch.add_argument("--output", default="relevance.jsonl")
+    batch.add_argument("--format", choices=["jsonl", "csv"], default="jsonl")
+    batch.add_argument("--regs", nargs="*", help="only these regulation IDs")
+    batch.add_argument("--contracts", nargs="*", help="only these contract IDs")
+    batch.add_argument("--jurisdiction", nargs="*", help="only contracts in these jurisdictions")
+    batch.add_argument("--workers", type=int, default=None, help="process pool size (default: CPU count)")
+    batch.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    batch.add_argument("--min-score", type=int, default=0, help="drop pairs scoring below this")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    instr.init("regulatory")
     ensure_dirs()
 
+    if args.command == "import-json":
+        get_store().import_json(REG_FILE, CONTRACT_FILE)
+        return
+
+    if args.command == "apply":
+        reg = get_store().get_regulation(args.reg)
+        if not reg:
+            raise SystemExit("❌ Invalid regulation")
+        bulk_apply_regulation(reg, args.min_score, set(args.jurisdiction or []))
+        instr.report()
+        return
+
+    if args.command == "version":
+        text = export_version(args.contract, args.version, args.output)
+        if not args.output:
+            print(text)
+        return
+
+    if args.command == "scheduler":
+        sched = RegulationScheduler(
+            LocalFeedSource(args.feed, synthetic=not args.no_synthetic), interval=args.interval
+        )
+        sched.start()
+        try:
+            time.sleep(args.duration)
+        except KeyboardInterrupt:
+            pass
+        sched.shutdown()
+        print(json.dumps(sched.metrics.snapshot(), indent=2))
+        instr.report()
+        return
+
+    if args.command == "batch":
+        summary = run_batch(
+            args.output,
+            fmt=args.format,
+            reg_ids=set(args.regs or []),
+            contract_ids=set(args.contracts or []),
+            jurisdictions=set(args.jurisdiction or []),
+            workers=args.workers,
+            batch_size=args.batch_size,
+            min_score=args.min_score,
+        )
+        print(json.dumps(summary, indent=2))
+        instr.report()
+        return
+
     # Always initialize dataset if regulations OR contracts are empty
-    try:
-        regs = load_json(REG_FILE)
-    except Exception:
-        regs = []
-    try:
-        contracts = load_json(CONTRACT_FILE)
-    except Exception:
-        contracts = {}
+    s = get_store()
+    regs = s.load_regulations()
+    contracts = s.load_contracts()
 
     if len(regs) == 0 or len(contracts) == 0:
         init_sample_data()
@@ -208,35 +1371,36 @@ def main():
         print("4) Apply regulation to contract")
         print("5) Fetch mock regulation")
         print("6) Start/Stop scheduler")
+        print("7) Bulk apply regulation to all relevant contracts")
+        print("8) Scheduler metrics")
         print("0) Exit")
 
         c = input("Choose: ").strip()
 
         if c == "1":
-            regs = load_json(REG_FILE)
+            regs = s.load_regulations()
             print("\n--- Regulations ---")
             for r in regs:
                 print("•", r["id"], "→", r["title"])
         elif c == "2":
-            idx = load_json(CONTRACT_FILE)
+            idx = s.load_contracts()
             print("\n--- Contracts ---")
             for cid, meta in idx.items():
                 print(f"• {cid} → {meta['name']} (v{meta['version']})")
         elif c == "3":
-            regs = load_json(REG_FILE)
-            idx = load_json(CONTRACT_FILE)
+            index = get_reg_index()
+            idx = s.load_contracts()
             for cid, meta in idx.items():
                 text = read_contract(meta)
                 print(f"\nContract {cid}:")
-                for r in regs:
-                    score, hits = relevance(r, meta, text)
+                for r, score, hits in index.analyse(meta, text):
                     if score > 0:
                         print(f"  → {r['id']} | score={score} | matches={hits}")
                     else:
                         print(f"  → {r['id']} | no influence")
         elif c == "4":
-            regs = load_json(REG_FILE)
-            idx = load_json(CONTRACT_FILE)
+            regs = s.load_regulations()
+            idx = s.load_contracts()
 
             print("\nAvailable regulations:")
             for r in regs:
@@ -260,8 +1424,22 @@ def main():
             fetch_mock_regulation()
         elif c == "6":
             toggle_scheduler()
+        elif c == "7":
+            rid = input("Enter regulation ID: ").strip()
+            reg = s.get_regulation(rid)
+            if not reg:
+                print("❌ Invalid regulation")
+                continue
+            bulk_apply_regulation(reg)
+        elif c == "8":
+            if scheduler is None:
+                print("⚠ Scheduler is not running.")
+            else:
+                print_metrics(scheduler.metrics)
         elif c == "0":
-            stop_event.set()
+            if scheduler is not None:
+                scheduler.shutdown()
+            instr.report()
             print("👋 Goodbye!")
             break
         else:
@@ -0,0 +1,129 @@
+# rerank.py
+"""
+Context selection for the RAG prompts: optional cross-encoder
+reranking, removal of text repeated across overlapping chunks, and
+packing into a token budget.
+
+    docs = retriever.invoke(q)                  # over-fetch RERANK_FETCH_K
+    context, used = select_context(q, docs)     # rerank -> dedupe -> pack
+
+Reranking runs a small cross-encoder on CPU and is off unless RERANK=1;
+without it the retrieval order is kept.
+"""
+
+import os
+import threading
+
+import instrumentation as instr
+from instrumentation import estimate_tokens
+
+
+# ---------------- CONFIG ----------------
+
+RERANK = os.getenv("RERANK", "0") == "1"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_FETCH_K = int(os.getenv("RERANK_FETCH_K", "20"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+MIN_OVERLAP = 40   # shorter shared prefixes/suffixes are left alone
+
+
+# -------------- CROSS-ENCODER --------------
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_cross_encoder():
+    """Load the cross-encoder once per process; None if unavailable."""
+    global _model
+    with _model_lock:
+        if _model is None:
+            try:
+                from sentence_transformers import CrossEncoder
+                _model = CrossEncoder(RERANK_MODEL, device="cpu", max_length=512)
+            except Exception as e:
+                print(f"[WARN] Reranker unavailable ({e}); keeping retrieval order")
+                _model = False
+    return _model or None
+
+
+def rerank(query, docs, model=None):
+    """Return `docs` sorted by cross-encoder relevance to `query`."""
+    model = model or get_cross_encoder()
+    if model is None or len(docs) < 2:
+        return list(docs)
+
+    with instr.stage("rerank"):
+        scores = model.predict(
+            [(query, d.page_content) for d in docs], batch_size=RERANK_BATCH_SIZE
+        )
+    order = sorted(range(len(docs)), key=lambda i: -float(scores[i]))
+    return [docs[i] for i in order]
+
+
+# -------------- OVERLAP REMOVAL --------------
+def overlap(a, b):
+    """Length of the longest suffix of `a` that is a prefix of `b` (>= MIN_OVERLAP)."""
+    if len(a) < MIN_OVERLAP or len(b) < MIN_OVERLAP:
+        return 0
+    head = b[:MIN_OVERLAP]
+    start = a.find(head, max(0, len(a) - len(b)))
+    while start != -1:
+        if b.startswith(a[start:]):
+            return len(a) - start
+        start = a.find(head, start + 1)
+    return 0
+
+
+def drop_overlaps(texts):
+    """
+    Remove text already present in higher-ranked chunks: duplicates and
+    contained chunks are dropped, and the splitter's overlapping
+    head/tail spans are trimmed.
+    """
+    kept = []
+    for text in texts:
+        text = text.strip()
+        if not text or any(text in k for k in kept):
+            continue
+        for k in kept:
+            cut = overlap(k, text)
+            if cut:
+                text = text[cut:].lstrip()
+            cut = overlap(text, k)
+            if cut:
+                text = text[:-cut].rstrip()
+        if len(text) >= MIN_OVERLAP:
+            kept.append(text)
+    return kept
+
+
+# -------------- PACKING --------------
+def pack(texts, budget=CONTEXT_TOKEN_BUDGET):
+    """Keep texts in rank order while they fit in `budget` tokens."""
+    parts, used = [], 0
+    for text in texts:
+        cost = estimate_tokens(text)
+        if used + cost > budget:
+            continue  # a later, shorter chunk may still fit
+        parts.append(text)
+        used += cost
+    return parts, used
+
+
+def select_context(query, docs, budget=CONTEXT_TOKEN_BUDGET, top_k=None, use_rerank=RERANK):
+    """
+    Rerank (optional), keep the best `top_k`, de-overlap and pack `docs`
+    for one prompt. Returns (context_text, number_of_chunks_used).
+    """
+    docs = list(docs)
+    if use_rerank:
+        docs = rerank(query, docs)
+    if top_k:
+        docs = docs[:top_k]
+
+    with instr.stage("pack_context"):
+        parts, used = pack(drop_overlaps(d.page_content for d in docs), budget)
+    instr.count("context_tokens", used)
+    instr.count("context_chunks_dropped", len(docs) - len(parts))
+    return "\n\n".join(parts), len(parts)
@@ -0,0 +1,280 @@
+# sparse_index.py
+"""
+Persistent BM25 index stored next to the FAISS index, plus hybrid
+retrieval fusing dense and sparse rankings with reciprocal rank fusion.
+
+    faiss_index/bm25.sqlite   postings (term, chunk, tf) + chunk lengths
+
+Chunk IDs are the docstore IDs of the FAISS index, so fused results map
+straight back to stored chunks. Terms are lowercase words (keeping
+"4.2", "pci-dss") plus adjacent word pairs, so exact legal phrases such
+as "pci dss" or "ai act" score as a unit.
+"""
+
+import os
+import re
+import math
+import heapq
+import sqlite3
+import threading
+from pathlib import Path
+from collections import Counter
+
+from index_store import DOCSTORE_FILE, index_version
+
+
+# ---------------- CONFIG ----------------
+
+SPARSE_FILE = "bm25.sqlite"
+BM25_K1 = float(os.getenv("BM25_K1", "1.5"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or shall "
+    "such that the their this to under which will with".split()
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    doc INTEGER PRIMARY KEY,
+    id TEXT UNIQUE NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS terms (tid INTEGER PRIMARY KEY, term TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS postings (
+    tid INTEGER NOT NULL,
+    doc INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (tid, doc)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_postings_doc ON postings(doc);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def tokenize(text):
+    raw = TOKEN_RE.findall(text.lower())
+    words = [w for w in raw if w not in STOPWORDS]
+    pairs = [
+        f"{a} {b}" for a, b in zip(raw, raw[1:])
+        if a not in STOPWORDS and b not in STOPWORDS
+    ]
+    return words + pairs
+
+
+# -------------- BM25 INDEX --------------
+class SparseIndex:
+    """
+    BM25 over an SQLite inverted index. Writes between begin() and
+    commit() form one transaction, so the index is only ever seen in
+    step with a saved FAISS index (tracked by its index_version).
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._stats = None
+        self._tids = {}
+
+    # ---------- writes ----------
+    def begin(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    def commit(self, version=None):
+        if version is not None:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('index_version', ?)", (version,)
+            )
+        self.conn.execute("COMMIT")
+        self._stats = None
+
+    def rollback(self):
+        if self.conn.in_transaction:
+            self.conn.execute("ROLLBACK")
+        self._tids.clear()  # may hold IDs of rolled-back terms
+
+    def _term_ids(self, terms):
+        missing = [t for t in terms if t not in self._tids]
+        if missing:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO terms (term) VALUES (?)", ((t,) for t in missing)
+            )
+            for i in range(0, len(missing), 500):
+                part = missing[i:i + 500]
+                marks = ",".join("?" * len(part))
+                self._tids.update(
+                    (term, tid) for tid, term in
+                    self.conn.execute(f"SELECT tid, term FROM terms WHERE term IN ({marks})", part)
+                )
+        return [self._tids[t] for t in terms]
+
+    def add(self, items):
+        """items: iterable of (chunk_id, text); replaces existing entries."""
+        for id_, text in items:
+            self.delete([id_])
+            counts = Counter(tokenize(text))
+            doc = self.conn.execute(
+                "INSERT INTO docs (id, length) VALUES (?, ?)", (id_, sum(counts.values()))
+            ).lastrowid
+            tids = self._term_ids(list(counts))
+            self.conn.executemany(
+                "INSERT INTO postings (tid, doc, tf) VALUES (?, ?, ?)",
+                ((tid, doc, tf) for tid, tf in zip(tids, counts.values())),
+            )
+
+    def delete(self, ids):
+        for id_ in ids:
+            row = self.conn.execute("SELECT doc FROM docs WHERE id = ?", (id_,)).fetchone()
+            if row is not None:
+                self.conn.execute("DELETE FROM postings WHERE doc = ?", row)
+                self.conn.execute("DELETE FROM docs WHERE doc = ?", row)
+
+    def rebuild_from_docstore(self, index_path: Path):
+        """Re-index every chunk stored in the FAISS docstore."""
+        index_path = Path(index_path)
+        source = sqlite3.connect(str(index_path / DOCSTORE_FILE))
+        try:
+            self.begin()
+            try:
+                self.conn.execute("DELETE FROM postings")
+                self.conn.execute("DELETE FROM docs")
+                self.conn.execute("DELETE FROM terms")
+                self._tids.clear()
+                self.add(source.execute("SELECT id, text FROM docs"))
+                self.commit(index_version(index_path))
+            except Exception:
+                self.rollback()
+                raise
+        finally:
+            source.close()
+
+    # ---------- reads ----------
+    def version(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'index_version'").fetchone()
+        return row[0] if row else None
+
+    def sync(self, index_path: Path):
+        """Rebuild if the FAISS index was saved by a writer that did not update us."""
+        current = index_version(index_path)
+        if current is not None and self.version() != current:
+            print("🔁 Building BM25 index from docstore...")
+            self.rebuild_from_docstore(index_path)
+        return self
+
+    def stats(self):
+        with self._lock:
+            if self._stats is None:
+                n, avgdl = self.conn.execute("SELECT COUNT(*), AVG(length) FROM docs").fetchone()
+                self._stats = (n, avgdl or 0.0)
+            return self._stats
+
+    def __len__(self):
+        return self.stats()[0]
+
+    def search(self, query, k=20):
+        """Return [(chunk_id, bm25_score)] best first."""
+        terms = list(set(tokenize(query)))
+        n, avgdl = self.stats()
+        if not terms or not n:
+            return []
+
+        marks = ",".join("?" * len(terms))
+        tids = dict(self.conn.execute(
+            f"SELECT tid, term FROM terms WHERE term IN ({marks})", terms
+        ))
+        if not tids:
+            return []
+
+        marks = ",".join("?" * len(tids))
+        df = dict(self.conn.execute(
+            f"SELECT tid, COUNT(*) FROM postings WHERE tid IN ({marks}) GROUP BY tid", list(tids)
+        ))
+        idf = {t: math.log(1 + (n - d + 0.5) / (d + 0.5)) for t, d in df.items()}
+
+        scores = {}
+        rows = self.conn.execute(
+            f"SELECT p.tid, d.id, p.tf, d.length FROM postings p "
+            f"JOIN docs d ON d.doc = p.doc WHERE p.tid IN ({marks})",
+            list(tids),
+        )
+        for tid, id_, tf, length in rows:
+            norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avgdl)
+            scores[id_] = scores.get(id_, 0.0) + idf[tid] * tf * (BM25_K1 + 1) / norm
+
+        return heapq.nlargest(k, scores.items(), key=lambda kv: kv[1])
+
+
+def open_sparse_index(index_path: Path):
+    """Open (and if needed rebuild) the BM25 index of a saved FAISS index."""
+    index_path = Path(index_path)
+    index_path.mkdir(parents=True, exist_ok=True)
+    return SparseIndex(index_path / SPARSE_FILE).sync(index_path)
+
+
+# -------------- HYBRID RETRIEVAL --------------
+def rrf_fuse(rankings, weights, k=RRF_K):
+    """
+    Weighted reciprocal rank fusion: score(d) = sum w_i / (k + rank_i(d)).
+    `rankings` are lists of IDs, best first. Returns IDs best first.
+    """
+    scores = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, id_ in enumerate(ranking, 1):
+            scores[id_] = scores.get(id_, 0.0) + weight / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def hybrid_search(vs, sparse, query, k=4, fetch_k=20, dense_weight=1.0,
+                  sparse_weight=1.0, dense_search="similarity", rrf_k=RRF_K, mmr=None):
+    """
+    Fuse the top `fetch_k` dense hits (similarity or MMR) with the top
+    `fetch_k` BM25 hits and return the best `k` documents. `mmr` is an
+    optional mmr.VectorMMR used for dense_search="mmr".
+    """
+    if dense_search == "mmr" and mmr is not None:
+        dense = mmr.search(query, k=fetch_k, fetch_k=2 * fetch_k)
+    elif dense_search == "mmr":
+        dense = vs.max_marginal_relevance_search(query, k=fetch_k, fetch_k=2 * fetch_k)
+    else:
+        dense = vs.similarity_search(query, k=fetch_k)
+
+    docs = {d.id: d for d in dense if d.id}
+    sparse_ids = [id_ for id_, _ in sparse.search(query, fetch_k)] if sparse_weight else []
+
+    fused = rrf_fuse(
+        [[d.id for d in dense if d.id], sparse_ids],
+        [dense_weight, sparse_weight],
+        k=rrf_k,
+    )
+
+    results = []
+    for id_ in fused:
+        doc = docs.get(id_)
+        if doc is None:
+            doc = vs.docstore.search(id_)
+            if isinstance(doc, str):  # in BM25 but no longer in the docstore
+                continue
+        results.append(doc)
+        if len(results) == k:
+            break
+    return results
+
+
+def hybrid_retriever(vs, sparse, **kwargs):
+    """LangChain retriever wrapping `hybrid_search` (LangChain imported lazily)."""
+    from langchain_core.retrievers import BaseRetriever
+
+    class HybridRetriever(BaseRetriever):
+        vectorstore: object
+        sparse: object
+        search_kwargs: dict
+
+        def _get_relevant_documents(self, query, *, run_manager=None):
+            return hybrid_search(self.vectorstore, self.sparse, query, **self.search_kwargs)
+
+    return HybridRetriever(vectorstore=vs, sparse=sparse, search_kwargs=kwargs)
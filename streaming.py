@@ -0,0 +1,68 @@
+# streaming.py
+"""
+Helpers for streaming LLM output token by token while recording
+time-to-first-token (TTFT) and throughput.
+"""
+
+import time
+
+
+class StreamStats:
+    """Timing of one streamed completion. Create it right before the request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first = None
+        self.end = None
+        self.tokens = 0
+        self.chars = 0
+
+    @property
+    def ttft(self):
+        return None if self.first is None else self.first - self.start
+
+    @property
+    def elapsed(self):
+        return (self.end or time.perf_counter()) - self.start
+
+    @property
+    def tokens_per_sec(self):
+        # Generation rate after the first token arrives
+        if self.first is None or self.tokens < 2:
+            return 0.0
+        duration = (self.end or time.perf_counter()) - self.first
+        return (self.tokens - 1) / duration if duration > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            "ttft_s": round(self.ttft, 3) if self.ttft is not None else None,
+            "elapsed_s": round(self.elapsed, 3),
+            "tokens": self.tokens,
+            "chars": self.chars,
+            "tokens_per_sec": round(self.tokens_per_sec, 1),
+        }
+
+    def summary(self):
+        ttft = f"{self.ttft:.2f}s" if self.ttft is not None else "n/a"
+        return (
+            f"first token {ttft} · {self.tokens} tokens in {self.elapsed:.2f}s "
+            f"· {self.tokens_per_sec:.1f} tokens/s"
+        )
+
+
+def timed_stream(pieces, stats: StreamStats):
+    """
+    Yield the text of each streamed piece (str or message chunk) and
+    update `stats`. Each non-empty chunk is counted as one token, which
+    matches how Groq streams completions.
+    """
+    for piece in pieces:
+        text = getattr(piece, "content", piece)
+        if not text:
+            continue
+        if stats.first is None:
+            stats.first = time.perf_counter()
+        stats.tokens += 1
+        stats.chars += len(text)
+        yield text
+    stats.end = time.perf_counter()
@@ -0,0 +1,57 @@
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# rag_system exits at import without a key; tests never call the API
+os.environ.setdefault("GROQ_API_KEY", "test-key")
+
+import pytest
+
+
+@pytest.fixture
+def reg_env(tmp_path, monkeypatch):
+    """regulatory.py pointed at a scratch dataset with the two sample contracts."""
+    import regulatory
+
+    dataset = tmp_path / "Dataset"
+    (dataset / "contracts").mkdir(parents=True)
+    monkeypatch.setattr(regulatory, "DATASET", str(dataset))
+    monkeypatch.setattr(regulatory, "REG_FILE", str(dataset / "regulations.json"))
+    monkeypatch.setattr(regulatory, "CONTRACT_FILE", str(dataset / "contracts_index.json"))
+    monkeypatch.setattr(regulatory, "CONTRACT_DIR", str(dataset / "contracts"))
+    monkeypatch.setattr(regulatory, "DB_FILE", str(dataset / "regulatory.db"))
+    monkeypatch.setattr(regulatory, "FEED_DIR", str(dataset / "feed"))
+    monkeypatch.setattr(regulatory, "store", None)
+    monkeypatch.setattr(regulatory, "reg_index", None)
+    regulatory.init_sample_data()
+    yield regulatory
+    regulatory.store = None
+
+
+@pytest.fixture
+def rag_env(tmp_path, monkeypatch):
+    """
+    rag_system working in tmp_path with a fake embedding model; returns
+    three small contract files. Skipped without langchain_groq.
+    """
+    pytest.importorskip("langchain_groq")
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    import rag_system
+    from embedding_cache import CachedEmbeddings
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(rag_system, "REBUILD_INDEX", False)
+    monkeypatch.setattr(rag_system, "EMBED_WORKERS", 1)
+    monkeypatch.setattr(
+        rag_system, "_embeddings",
+        CachedEmbeddings(DeterministicFakeEmbedding(size=32), "fake", tmp_path / "cache"),
+    )
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for i in range(3):
+        (docs / f"c{i}.txt").write_text(f"Contract {i}. " + f"Clause {i} on data retention. " * 40)
+    return sorted(docs.glob("*.txt"))
@@ -0,0 +1,39 @@
+import math
+
+import app
+from conftest import ROOT
+
+DATASET_TXT = ROOT / "Dataset" / "Dataset.txt"
+
+
+def test_dataset_needs_fewer_calls_than_fixed_slices():
+    text = DATASET_TXT.read_text(encoding="utf-8")
+    chunks = list(app.stream_dataset_chunks(DATASET_TXT))
+
+    assert len(chunks) <= math.ceil(len(text) / 4000)
+    assert all(len(c["contract_ids"]) >= 2 for c in chunks[:-1])
+
+
+def test_contracts_are_never_split_or_repeated():
+    with open(DATASET_TXT, encoding="utf-8") as f:
+        expected = [cid for cid, _ in app._iter_contracts(f)]
+    chunks = list(app.stream_dataset_chunks(DATASET_TXT))
+
+    ids = [cid for c in chunks for cid in c["contract_ids"]]
+    assert ids == [cid for cid in expected if cid is not None]
+    assert all(app.estimate_tokens(c["text"]) <= app.CHUNK_TOKENS for c in chunks)
+
+
+def test_oversized_contract_is_split_on_clauses_with_header():
+    header = "=" * 20 + "\nContract #900\nTitle: Big\n" + "=" * 20 + "\n"
+    clauses = [f"{i}. Clause {i} " + "word " * 60 + "\n" for i in range(1, 11)]
+    lines = (header + "".join(clauses)).splitlines(keepends=True)
+
+    chunks = list(app.iter_contract_chunks(lines, max_tokens=200))
+    assert len(chunks) > 1
+    for c in chunks:
+        assert c["contract_ids"] == ["900"]
+        assert c["text"].startswith("=" * 20 + "\nContract #900")
+        assert app.estimate_tokens(c["text"]) <= 200
+    body = "".join(c["text"].split("=" * 20 + "\n", 2)[-1] for c in chunks)
+    assert body.count("Clause ") == 10
@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+
+import app
+import llm_retry
+from llm_retry import TokenBucket
+
+
+@pytest.fixture
+def result_cache(tmp_path, monkeypatch):
+    cache = app.ResultCache(app.SqliteResultStore(str(tmp_path / "results.sqlite")))
+    monkeypatch.setattr(app, "cache", cache)
+    monkeypatch.setattr(app, "REQUESTS_PER_MINUTE", 0)   # no default limiter
+    yield cache
+    cache.store.close()
+
+
+class CountingClient(app.StubClient):
+    """StubClient that records how many calls run at once."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.active = 0
+        self.peak = 0
+        self._active_lock = threading.Lock()
+
+    def _create(self, *args, **kwargs):
+        with self._active_lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            return super()._create(*args, **kwargs)
+        finally:
+            with self._active_lock:
+                self.active -= 1
+
+
+def chunks(n):
+    return [{"text": f"Contract #{i:03d} text", "contract_ids": [f"{i:03d}"]} for i in range(n)]
+
+
+def test_pool_runs_chunks_concurrently_in_order(result_cache):
+    client = CountingClient(latency=0.05)
+    start = time.perf_counter()
+    out = app.process_chunks(chunks(12), client=client, max_workers=4,
+                             limiter=TokenBucket(6000, capacity=4))
+    elapsed = time.perf_counter() - start
+
+    assert client.calls == 12
+    assert client.peak == 4
+    assert elapsed < 12 * 0.05 / 2
+    positions = [out.index(f"Contract #{i:03d}") for i in range(12)]
+    assert positions == sorted(positions)
+
+
+def test_cached_and_duplicate_chunks_skip_the_llm(result_cache):
+    client = app.StubClient()
+    work = chunks(3) + chunks(3)
+    first = app.process_chunks(work, client=client, max_workers=2, limiter=None)
+    assert client.calls == 3
+
+    again = app.process_chunks(work, client=client, max_workers=2, limiter=None)
+    assert client.calls == 3
+    assert again == first
+    assert result_cache.stats()["hits"] >= 6
+
+
+def test_rate_limited_calls_are_retried(result_cache, monkeypatch):
+    monkeypatch.setattr(llm_retry.time, "sleep", lambda s: None)
+    client = app.StubClient(fail_every=3)
+    out = app.process_chunks(chunks(6), client=client, max_workers=2, limiter=None)
+
+    assert "Error processing" not in out
+    assert client.calls > 6
+    assert len(result_cache.order) == 6
+
+
+def test_chunks_are_pulled_lazily(result_cache):
+    pulled = []
+
+    def source():
+        for c in chunks(40):
+            pulled.append(c)
+            yield c
+
+    client = app.StubClient(latency=0.02)
+    seen = []
+    original = client._create
+
+    def create(*args, **kwargs):
+        seen.append(len(pulled))
+        return original(*args, **kwargs)
+
+    client.chat.completions.create = create
+    app.process_chunks(source(), client=client, max_workers=2, limiter=None)
+
+    # Never more than 2 * max_workers chunks ahead of the one being analysed
+    assert all(p - i <= 2 * 2 + 1 for i, p in enumerate(seen, 1))
@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+import app
+
+
+@pytest.fixture(params=["jsonl", "sqlite"])
+def open_store(request, tmp_path):
+    opened = []
+
+    def _open():
+        store = app.open_result_store(request.param, str(tmp_path / "results"))
+        opened.append(store)
+        return store
+
+    yield _open
+    for store in opened:
+        store.close()
+
+
+def test_store_roundtrip_survives_reopen(open_store):
+    store = open_store()
+    store.put("a", "first")
+    store.put("b", "second")
+    store.put("a", "updated")
+    store.delete("b")
+    store.close()
+
+    store = open_store()
+    assert store.get("a") == "updated"
+    assert store.get("b") is None
+    assert len(store) == 1
+
+
+def test_jsonl_store_skips_torn_line_and_compacts(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    store = app.JsonlResultStore(path)
+    for i in range(150):
+        store.put("k", f"v{i}")
+    store.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"key": "torn", "val')
+
+    store = app.JsonlResultStore(path)
+    assert store.keys() == ["k"]
+    assert store.get("k") == "v149"
+    with open(path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 1   # compacted on open
+    store.close()
+
+
+def test_migrate_legacy_cache(tmp_path):
+    legacy = tmp_path / "processed_results.json"
+    legacy.write_text(json.dumps({"chunk_1": "positional", "abc123": "hashed"}))
+    store = app.SqliteResultStore(str(tmp_path / "results.sqlite"))
+
+    assert app.migrate_legacy_cache(store, str(legacy)) == 1
+    assert store.get("abc123") == "hashed"
+    assert store.get("chunk_1") is None
+    assert not legacy.exists()
+    assert (tmp_path / "processed_results.json.migrated").exists()
+    assert app.migrate_legacy_cache(store, str(legacy)) == 0
+    store.close()
+
+
+def test_result_cache_evicts_least_recently_used(tmp_path):
+    store = app.SqliteResultStore(str(tmp_path / "results.sqlite"))
+    cache = app.ResultCache(store, max_entries=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.get("a")
+    cache.put("c", "3")
+
+    assert store.get("b") is None
+    assert cache.get("a") == "1" and cache.get("c") == "3"
+    assert cache.stats()["evictions"] == 1
+    store.close()
+
+
+def test_jsonl_store_appends_cleanly_after_torn_line(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    store = app.JsonlResultStore(path)
+    store.put("a", "1")
+    store.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"key": "b", "val')   # crash mid-write, too few lines to compact
+
+    store = app.JsonlResultStore(path)
+    store.put("c", "3")
+    store.close()
+
+    store = app.JsonlResultStore(path)
+    assert store.keys() == ["a", "c"]
+    store.close()
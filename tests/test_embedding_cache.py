@@ -0,0 +1,104 @@
+import multiprocessing as mp
+
+import numpy as np
+
+from embedding_cache import EmbeddingCache, CachedEmbeddings
+
+
+def vec(x):
+    return [float(x), float(x)]
+
+
+def test_roundtrip_and_reopen(tmp_path):
+    cache = EmbeddingCache(tmp_path)
+    cache.add_many(["a", "b"], [vec(1), vec(2)])
+    cache.add_many(["b", "c"], [vec(9), vec(3)])  # "b" already cached
+
+    again = EmbeddingCache(tmp_path)
+    got = again.get_many(["a", "b", "c", "missing"])
+    assert sorted(got) == ["a", "b", "c"]
+    assert got["b"].tolist() == vec(2)
+    assert got["c"].tolist() == vec(3)
+
+
+def test_unkeyed_trailing_rows_are_dropped(tmp_path):
+    cache = EmbeddingCache(tmp_path)
+    cache.add_many(["a", "b"], [vec(1), vec(2)])
+    # Crash between writing vectors and keys: one row without a key
+    with open(tmp_path / "vectors.f32", "ab") as f:
+        f.write(np.asarray([vec(9)], dtype=np.float32).tobytes())
+
+    reopened = EmbeddingCache(tmp_path)
+    reopened.add_many(["c"], [vec(3)])
+    assert reopened.get_many(["c"])["c"].tolist() == vec(3)
+    assert EmbeddingCache(tmp_path).get_many(["a", "c"])["c"].tolist() == vec(3)
+
+
+def test_partial_row_is_dropped(tmp_path):
+    cache = EmbeddingCache(tmp_path)
+    cache.add_many(["a"], [vec(1)])
+    with open(tmp_path / "vectors.f32", "ab") as f:
+        f.write(b"\x00\x01\x02")
+
+    cache.add_many(["b"], [vec(2)])
+    got = EmbeddingCache(tmp_path).get_many(["a", "b"])
+    assert got["a"].tolist() == vec(1)
+    assert got["b"].tolist() == vec(2)
+
+
+def test_two_instances_share_files(tmp_path):
+    a = EmbeddingCache(tmp_path)
+    b = EmbeddingCache(tmp_path)
+    a.add_many(["a"], [vec(1)])
+    b.add_many(["b"], [vec(2)])
+    a.add_many(["c"], [vec(3)])
+
+    assert b.get_many(["b"])["b"].tolist() == vec(2)
+    assert b.get_many(["a", "c"])["c"].tolist() == vec(3)
+    assert a.get_many(["b"])["b"].tolist() == vec(2)
+
+
+def _writer(directory, prefix, n):
+    cache = EmbeddingCache(directory)
+    for i in range(n):
+        value = float(prefix * 1000 + i)
+        cache.add_many([f"{prefix}-{i}"], [[value, value]])
+
+
+def test_concurrent_processes(tmp_path):
+    procs = [mp.Process(target=_writer, args=(tmp_path, p, 100)) for p in (1, 2, 3)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+        assert p.exitcode == 0
+
+    cache = EmbeddingCache(tmp_path)
+    assert len(cache) == 300
+    for prefix in (1, 2, 3):
+        got = cache.get_many([f"{prefix}-{i}" for i in range(100)])
+        for i in range(100):
+            assert got[f"{prefix}-{i}"][0] == prefix * 1000 + i
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return [[float(len(t)), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0]
+
+
+def test_cached_embeddings_embed_each_text_once(tmp_path):
+    base = CountingEmbeddings()
+    emb = CachedEmbeddings(base, "test/model", cache_dir=tmp_path)
+    first = emb.embed_documents(["x", "yy", "x"])
+    second = CachedEmbeddings(base, "test/model", cache_dir=tmp_path).embed_documents(["yy", "x"])
+
+    assert base.calls == 2
+    assert first == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    assert second == [[2.0, 1.0], [1.0, 1.0]]
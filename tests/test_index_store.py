@@ -0,0 +1,72 @@
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from index_store import (
+    LEGACY_PICKLE, PositionMap, SqliteDocstore, index_exists, index_version,
+    load_index, migrate_pickle_index, save_index,
+)
+
+EMB = DeterministicFakeEmbedding(size=16)
+TEXTS = ["retention of personal data", "cross-border transfers", "breach notification"]
+
+
+def contents(vs):
+    return sorted(vs.docstore.search(i).page_content for i in vs.index_to_docstore_id.values())
+
+
+def test_save_load_add_delete_round_trip(tmp_path):
+    vs = FAISS.from_texts(TEXTS, EMB, metadatas=[{"n": i} for i in range(3)], ids=["a", "b", "c"])
+    assert index_version(tmp_path) is None
+    save_index(vs, tmp_path)
+    assert index_exists(tmp_path)
+    assert isinstance(vs.docstore, SqliteDocstore)
+
+    vs = load_index(tmp_path, EMB, mmap=False)
+    assert vs.index.ntotal == 3
+    assert contents(vs) == sorted(TEXTS)
+    assert vs.docstore.search("b").metadata == {"n": 1}
+    assert vs.similarity_search("breach notification", k=1)[0].id == "c"
+
+    vs.add_texts(["audit rights"], ids=["d"])
+    vs.delete(["a"])
+    save_index(vs, tmp_path)
+
+    vs = load_index(tmp_path, EMB)
+    assert vs.index.ntotal == 3
+    assert contents(vs) == sorted(["cross-border transfers", "breach notification", "audit rights"])
+    assert vs.docstore.search("a") == "ID a not found."
+    assert vs.similarity_search("audit rights", k=1)[0].id == "d"
+
+
+def test_position_map_delete_is_saved(tmp_path):
+    vs = FAISS.from_texts(TEXTS, EMB, ids=["a", "b", "c"])
+    save_index(vs, tmp_path)
+    positions = vs.index_to_docstore_id
+    assert isinstance(positions, PositionMap)
+
+    positions[3] = "d"
+    del positions[1]
+    del positions[3]
+    assert dict(positions) == {0: "a", 2: "c"}
+    assert len(positions) == 2
+    with pytest.raises(KeyError):
+        del positions[1]
+
+    save_index(vs, tmp_path)
+    assert dict(PositionMap(vs.docstore.conn)) == {0: "a", 2: "c"}
+
+
+def test_pickle_migration_needs_opt_in(tmp_path, monkeypatch):
+    FAISS.from_texts(TEXTS, EMB, ids=["a", "b", "c"]).save_local(str(tmp_path))
+
+    monkeypatch.delenv("ALLOW_PICKLE_MIGRATION", raising=False)
+    assert migrate_pickle_index(tmp_path, EMB) is None
+    assert (tmp_path / LEGACY_PICKLE).exists()
+
+    monkeypatch.setenv("ALLOW_PICKLE_MIGRATION", "1")
+    vs = migrate_pickle_index(tmp_path, EMB)
+    assert contents(vs) == sorted(TEXTS)
+    assert not (tmp_path / LEGACY_PICKLE).exists()
+    assert (tmp_path / (LEGACY_PICKLE + ".migrated")).exists()
+    assert contents(load_index(tmp_path, EMB)) == sorted(TEXTS)
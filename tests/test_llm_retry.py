@@ -0,0 +1,68 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import llm_retry
+from llm_retry import TokenBucket, is_retryable, retry_delay, with_retries
+
+
+class StatusError(Exception):
+    def __init__(self, status, headers=None):
+        super().__init__(f"HTTP {status}")
+        self.response = SimpleNamespace(status_code=status, headers=headers or {})
+
+
+def test_token_bucket_allows_burst_then_paces():
+    bucket = TokenBucket(rate_per_minute=600, capacity=3)   # one token per 0.1s
+    start = time.monotonic()
+    for _ in range(3):
+        bucket.acquire()
+    assert time.monotonic() - start < 0.05
+    for _ in range(2):
+        bucket.acquire()
+    assert time.monotonic() - start >= 0.18
+
+
+def test_retryable_errors_and_delays():
+    assert is_retryable(StatusError(429))
+    assert is_retryable(StatusError(503))
+    assert is_retryable(ConnectionError())
+    assert not is_retryable(StatusError(400))
+    assert not is_retryable(ValueError())
+
+    assert retry_delay(StatusError(429, {"retry-after": "2"}), 0) == 2.0
+    assert retry_delay(StatusError(429, {"retry-after": "999"}), 0) == llm_retry.RETRY_MAX_DELAY
+    assert 0.5 * 4 <= retry_delay(StatusError(503), 2) <= 4
+
+
+def test_with_retries_retries_transient_errors(monkeypatch):
+    monkeypatch.setattr(llm_retry.time, "sleep", lambda s: None)
+    errors = [StatusError(429), ConnectionError()]
+
+    def call():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert with_retries(call, "m") == "ok"
+
+
+def test_with_retries_gives_up(monkeypatch):
+    monkeypatch.setattr(llm_retry.time, "sleep", lambda s: None)
+    calls = []
+
+    def failing(exc):
+        def call():
+            calls.append(1)
+            raise exc
+        return call
+
+    with pytest.raises(StatusError):
+        with_retries(failing(StatusError(400)), "m")
+    assert len(calls) == 1
+
+    calls.clear()
+    with pytest.raises(StatusError):
+        with_retries(failing(StatusError(500)), "m", max_retries=2)
+    assert len(calls) == 3
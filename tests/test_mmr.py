@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from mmr import VectorMMR, mmr_select, normalize
+
+
+def reference_mmr(query, cands, valid, k, lambda_mult):
+    """Plain one-query greedy MMR loop."""
+    picked = []
+    options = [i for i in range(len(cands)) if valid[i]]
+    while options and len(picked) < k:
+        def score(i):
+            rel = cands[i] @ query
+            if not picked:
+                return rel
+            red = max(cands[i] @ cands[j] for j in picked)
+            return lambda_mult * rel - (1 - lambda_mult) * red
+        best = max(options, key=score)
+        picked.append(best)
+        options.remove(best)
+    return picked + [-1] * (k - len(picked))
+
+
+@pytest.mark.parametrize("lambda_mult", [0.0, 0.5, 1.0])
+def test_batched_selection_matches_reference(lambda_mult):
+    rng = np.random.default_rng(0)
+    B, F, d, k = 6, 12, 8, 5
+    queries = normalize(rng.normal(size=(B, d))).astype(np.float32)
+    cands = normalize(rng.normal(size=(B, F, d))).astype(np.float32)
+    valid = np.ones((B, F), dtype=bool)
+    valid[1, 3:] = False   # a query with only 3 candidates
+
+    picked = mmr_select(queries, cands, valid, k, lambda_mult)
+    for b in range(B):
+        assert picked[b].tolist() == reference_mmr(queries[b], cands[b], valid[b], k, lambda_mult)
+    assert picked[1, 3:].tolist() == [-1, -1]
+
+
+@pytest.fixture
+def store():
+    texts = [f"Clause {i}: obligation number {i} on topic {i % 7}" for i in range(60)]
+    return FAISS.from_texts(texts, DeterministicFakeEmbedding(size=24))
+
+
+def test_search_matches_langchain_mmr(store):
+    mmr = VectorMMR(store)
+    for q in ["data retention", "termination notice", "governing law"]:
+        ours = [d.page_content for d in mmr.search(q, k=4, fetch_k=20, lambda_mult=0.5)]
+        theirs = [d.page_content for d in
+                  store.max_marginal_relevance_search(q, k=4, fetch_k=20, lambda_mult=0.5)]
+        assert ours == theirs
+
+
+def test_batch_and_cache(store):
+    mmr = VectorMMR(store)
+    queries = ["data retention", "termination notice", "data retention"]
+    batch = mmr.search_batch(queries, k=3, fetch_k=10)
+    assert mmr.misses == 2   # duplicate query embedded once
+
+    single = [mmr.search(q, k=3, fetch_k=10) for q in queries]
+    assert [[d.page_content for d in r] for r in batch] == \
+           [[d.page_content for d in r] for r in single]
+    assert mmr.hits == 3
+
+
+def test_added_vectors_refresh_candidates(store):
+    mmr = VectorMMR(store)
+    mmr.search("new clause", k=2, fetch_k=10)
+    store.add_texts(["new clause"])
+    assert "new clause" in [d.page_content for d in mmr.search("new clause", k=2, fetch_k=10)]
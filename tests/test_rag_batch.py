@@ -0,0 +1,110 @@
+import json
+
+import pytest
+
+pytest.importorskip("langchain_groq")
+
+from langchain_core.messages import AIMessage
+
+import rag_system
+
+ANSWER = """Analysis Result:
+
+KEY CLAUSES:
+- Data Retention (Clause 2)
+- Termination (Clause 9)
+
+POTENTIAL COMPLIANCE ISSUES:
+- Retention period is unbounded (Risk Level: Medium)
+Reason: No deletion schedule.
+- Transfers lack safeguards (Risk Level: High)
+Reason: No SCCs.
+"""
+
+
+class StubLLM:
+    """Chat model stand-in: fails for prompts containing `fail_on`."""
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.prompts = []
+
+    def invoke(self, messages):
+        prompt = messages[-1][1]
+        self.prompts.append(prompt)
+        if self.fail_on and self.fail_on in prompt:
+            raise ValueError("model refused")
+        return AIMessage(content=ANSWER)
+
+
+@pytest.fixture
+def batch_env(rag_env, tmp_path):
+    vs = rag_system.update_faiss(rag_env)
+    contracts = tmp_path / "portfolio"
+    contracts.mkdir()
+    (contracts / "alpha.txt").write_text("Alpha services agreement. Data retention applies. " * 20)
+    (contracts / "beta.txt").write_text("Beta hosting agreement. Transfers abroad allowed. " * 20)
+    (contracts / "empty.txt").write_text("")
+    return vs, contracts, tmp_path / "results.jsonl"
+
+
+def read_lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_parse_analysis():
+    result = rag_system.parse_analysis(ANSWER)
+    assert result["key_clauses"] == ["Data Retention (Clause 2)", "Termination (Clause 9)"]
+    assert [i["risk"] for i in result["issues"]] == ["Medium", "High"]
+    assert result["issues"][1]["reason"] == "No SCCs."
+    assert result["overall_risk"] == "High"
+    assert rag_system.parse_analysis("no structure")["overall_risk"] is None
+
+
+def test_batch_writes_error_lines_and_resumes(batch_env):
+    vs, contracts, output = batch_env
+
+    llm = StubLLM(fail_on="Beta hosting")
+    totals = rag_system.run_batch(vs, [contracts], output, workers=2,
+                                  requests_per_minute=0, llm=llm)
+    assert totals == {"ok": 1, "error": 2}
+
+    records = {rec["contract"].rsplit("/", 1)[-1]: rec for rec in read_lines(output)}
+    assert records["alpha.txt"]["status"] == "ok"
+    assert records["alpha.txt"]["overall_risk"] == "High"
+    assert records["beta.txt"]["error"] == "ValueError: model refused"
+    assert records["empty.txt"]["error"] == "ValueError: no extractable text"
+    assert list(rag_system.load_checkpoint(output)) == [str(contracts / "alpha.txt")]
+
+    # Resume: alpha is skipped, failures are retried
+    llm = StubLLM()
+    totals = rag_system.run_batch(vs, [contracts], output, workers=2,
+                                  requests_per_minute=0, llm=llm)
+    assert totals == {"ok": 1, "error": 1}
+    assert len(llm.prompts) == 1 and "Beta hosting" in llm.prompts[0]
+    assert len(rag_system.load_checkpoint(output)) == 2
+
+    # An edited contract is analysed again
+    (contracts / "alpha.txt").write_text("Alpha services agreement, amended. " * 20)
+    llm = StubLLM()
+    rag_system.run_batch(vs, [contracts], output, requests_per_minute=0, llm=llm)
+    assert len(llm.prompts) == 1 and "amended" in llm.prompts[0]
+
+
+def test_checkpoint_ignores_torn_last_line(tmp_path):
+    path = tmp_path / "results.jsonl"
+    path.write_text('{"contract": "a", "digest": "1", "status": "ok"}\n{"contract": "b", "dig')
+    assert rag_system.load_checkpoint(path) == {"a": "1"}
+
+    writer = rag_system.ResultWriter(path)
+    writer.write({"contract": "c", "digest": "3", "status": "ok"})
+    writer.close()
+    assert rag_system.load_checkpoint(path) == {"a": "1", "c": "3"}
+
+
+@pytest.mark.parametrize("argv", [["--workers", "0"], ["--rpm", "-1"]])
+def test_batch_args_are_validated(argv):
+    with pytest.raises(SystemExit):
+        rag_system.parse_args(["--batch", "x"] + argv)
+    assert rag_system.parse_args(["--batch", "x", "--rpm", "0"]).rpm == 0
@@ -0,0 +1,75 @@
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import rag_cache
+from index_store import index_version, save_index
+from rag_cache import RagCache, TTLCache
+
+
+def test_retrievals_follow_the_index_version():
+    cache = RagCache()
+    assert cache.check_index("v1") is False   # first version seen, nothing to drop
+    cache.put_ids("What is GDPR?", 4, ["a", "b"])
+    assert cache.get_ids("  what is   gdpr? ", 4) == ["a", "b"]
+    assert cache.get_ids("What is GDPR?", 8) is None
+    assert cache.get_ids("What is GDPR?", 4, mode="hybrid") is None
+
+    assert cache.check_index("v1") is False
+    assert cache.get_ids("What is GDPR?", 4) == ["a", "b"]
+
+    cache.put_answer("prompt", "model", "answer")
+    assert cache.check_index("v2") is True
+    assert cache.get_ids("What is GDPR?", 4) is None
+    # Answers are keyed by the full prompt, which embeds the retrieved context
+    assert cache.get_answer("prompt", "model") == "answer"
+    assert cache.get_answer("prompt", "other-model") is None
+
+
+def test_saving_the_index_changes_its_version(tmp_path):
+    emb = DeterministicFakeEmbedding(size=8)
+    vs = FAISS.from_texts(["one", "two"], emb)
+    assert index_version(tmp_path) is None
+
+    save_index(vs, tmp_path)
+    first = index_version(tmp_path)
+    vs.add_texts(["three"])
+    save_index(vs, tmp_path)
+
+    cache = RagCache()
+    cache.check_index(first)
+    cache.put_ids("q", 4, ["x"])
+    assert cache.check_index(index_version(tmp_path)) is True
+    assert cache.get_ids("q", 4) is None
+
+
+def test_ttl_and_lru_bounds(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(rag_cache.time, "monotonic", lambda: now[0])
+    cache = TTLCache(ttl=10, max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+
+    now[0] += 11
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 1
+
+
+def test_clause_retrievals_cached_per_contract_and_index():
+    cache = RagCache()
+    cache.check_index("v1")
+    clauses = ["1. Scope of services.", "2. Personal data is processed in the EU."]
+    assert cache.get_clause_ids(clauses, 3) is None
+
+    cache.put_clause_ids(clauses, 3, ["a", "b"])
+    assert cache.get_clause_ids(list(clauses), 3) == ["a", "b"]
+    assert cache.get_clause_ids(clauses, 5) is None
+    assert cache.get_clause_ids(clauses[:1], 3) is None
+    # Clause boundaries are part of the key, not just the joined text
+    assert cache.get_clause_ids(["".join(clauses)], 3) is None
+
+    cache.check_index("v2")
+    assert cache.get_clause_ids(clauses, 3) is None
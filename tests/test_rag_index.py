@@ -0,0 +1,205 @@
+from pathlib import Path
+from types import SimpleNamespace
+
+import faiss
+import numpy as np
+import pytest
+
+pytest.importorskip("langchain_groq")
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import rag_system
+from embedding_cache import text_hash
+
+
+def test_missing_index_files_trigger_full_reindex(rag_env):
+    n = rag_system.update_faiss(rag_env).index.ntotal
+    assert n > 0
+    assert rag_system.MANIFEST_FILE.exists()
+
+    (rag_system.INDEX_PATH / "index.faiss").unlink()
+    vs = rag_system.update_faiss(rag_env)
+    assert vs.index.ntotal == n
+
+
+def test_changed_file_replaces_only_its_vectors(rag_env):
+    rag_system.update_faiss(rag_env)
+    rag_env[0].write_text("Contract 0, rewritten. " * 40)
+
+    vs = rag_system.update_faiss(rag_env)
+    texts = [vs.docstore.search(i).page_content for i in vs.index_to_docstore_id.values()]
+    assert len(texts) == vs.index.ntotal
+    assert not any(t.startswith("Contract 0.") for t in texts)
+    assert sum("rewritten" in t for t in texts) >= 1
+    assert sum(t.startswith("Contract 1.") for t in texts) == 1
+
+
+class FakeModel(DeterministicFakeEmbedding):
+    def __init__(self, model_name=None, **kwargs):
+        super().__init__(size=32)
+
+
+def test_float16_index_keeps_full_precision_cache(rag_env, monkeypatch):
+    # Forked embed workers pick up the patched model class
+    monkeypatch.setattr(rag_system, "HuggingFaceEmbeddings", FakeModel)
+    monkeypatch.setattr(rag_system, "EMBED_WORKERS", 2)
+    monkeypatch.setattr(rag_system, "EMBED_DTYPE", "float16")
+
+    vs = rag_system.update_faiss(rag_env)
+    texts = [vs.docstore.search(i).page_content for i in vs.index_to_docstore_id.values()]
+    exact = np.asarray(FakeModel().embed_documents(texts), dtype=np.float32)
+
+    cache = rag_system.get_embeddings().cache
+    cached = cache.get_many([text_hash(t) for t in texts])
+    assert np.array_equal(np.stack([cached[text_hash(t)] for t in texts]), exact)
+
+    assert not np.array_equal(exact, exact.astype(np.float16).astype(np.float32))
+
+    indexed = vs.index.reconstruct_n(0, vs.index.ntotal)
+    assert np.array_equal(indexed, rag_system.prepare_vectors(exact))
+
+
+def failing_loader(bad_name):
+    """TextLoader stand-in that cannot read `bad_name`."""
+    real = rag_system.TextLoader
+
+    def loader(path, *args, **kwargs):
+        if path.endswith(bad_name):
+            raise OSError(f"cannot read {bad_name}")
+        return real(path, *args, **kwargs)
+    return loader
+
+
+def test_failed_load_keeps_old_vectors_and_is_retried(rag_env, monkeypatch, capsys):
+    n = rag_system.update_faiss(rag_env).index.ntotal
+    before = rag_system.load_manifest()
+    rag_env[1].write_text("Contract 1, rewritten. " * 40)
+
+    loader = rag_system.TextLoader
+    monkeypatch.setattr(rag_system, "TextLoader", failing_loader("c1.txt"))
+    vs = rag_system.update_faiss(rag_env)
+    assert vs.index.ntotal == n
+    assert rag_system.load_manifest()[str(rag_env[1])] == before[str(rag_env[1])]
+
+    monkeypatch.setattr(rag_system, "TextLoader", loader)
+    capsys.readouterr()
+    vs = rag_system.update_faiss(rag_env)
+    assert "up to date" not in capsys.readouterr().out
+    texts = [vs.docstore.search(i).page_content for i in vs.index_to_docstore_id.values()]
+    assert any("rewritten" in t for t in texts)
+    assert not any(t.startswith("Contract 1.") for t in texts)
+
+
+def test_failed_new_file_is_not_recorded(rag_env, monkeypatch):
+    monkeypatch.setattr(rag_system, "TextLoader", failing_loader("c2.txt"))
+    vs = rag_system.update_faiss(rag_env)
+    assert str(rag_env[2]) not in rag_system.load_manifest()
+    assert vs.index.ntotal == 4
+
+
+# -------------- ANN INDEX TYPES --------------
+def synthetic_flat(n, dim=32):
+    flat = faiss.IndexFlatL2(dim)
+    flat.add(np.random.default_rng(0).standard_normal((n, dim)).astype(np.float32))
+    return flat
+
+
+@pytest.fixture
+def ann_env(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag_system, "INDEX_PATH", tmp_path)
+    monkeypatch.setattr(rag_system, "ANN_INDEX_FILE", tmp_path / "index.ann.faiss")
+    monkeypatch.setattr(rag_system, "INDEX_CONFIG_FILE", tmp_path / "index_config.json")
+    # PQ needs 39 * 2**nbits training vectors and m dividing the dimension
+    monkeypatch.setattr(rag_system, "PQ_M", 8)
+    monkeypatch.setattr(rag_system, "PQ_NBITS", 4)
+    return tmp_path
+
+
+def reported_types(rows):
+    return {r["type"] for r in rows}
+
+
+def test_index_report_covers_each_type_above_training_thresholds(ann_env):
+    rows = rag_system.index_report(synthetic_flat(1000), n_queries=50)
+    assert reported_types(rows) == {"flat", "ivf_flat", "ivf_pq", "hnsw", "sq_fp16"}
+    assert (ann_env / "index_report.json").exists()
+
+    best = {}
+    for r in rows:
+        best[r["type"]] = max(best.get(r["type"], 0), r["recall"])
+    assert best["flat"] == 1.0
+    assert best["sq_fp16"] > 0.95 and best["hnsw"] > 0.9 and best["ivf_flat"] > 0.9
+
+    # ivf_pq needs 39 * 16 = 624 vectors, ivf_flat needs 39
+    assert reported_types(rag_system.index_report(synthetic_flat(200))) == {
+        "flat", "ivf_flat", "hnsw", "sq_fp16"}
+    assert reported_types(rag_system.index_report(synthetic_flat(30))) == {
+        "flat", "hnsw", "sq_fp16"}
+
+
+@pytest.mark.parametrize("kind, index_cls", [
+    ("ivf_flat", "IndexIVFFlat"),
+    ("ivf_pq", "IndexIVFPQ"),
+    ("hnsw", "IndexHNSWFlat"),
+    ("sq_fp16", "IndexScalarQuantizer"),
+])
+def test_apply_index_type_builds_and_reuses(ann_env, monkeypatch, kind, index_cls):
+    monkeypatch.setattr(rag_system, "INDEX_TYPE", kind)
+    vs = rag_system.apply_index_type(SimpleNamespace(index=synthetic_flat(1000)))
+    assert type(vs.index).__name__ == index_cls
+    assert rag_system.ANN_INDEX_FILE.exists()
+    if kind.startswith("ivf"):
+        assert faiss.extract_index_ivf(vs.index).nprobe == rag_system.NPROBE
+
+    # Unchanged vectors and settings: the saved ANN index is reused
+    built = rag_system.ANN_INDEX_FILE.stat().st_mtime_ns
+    vs = rag_system.apply_index_type(SimpleNamespace(index=synthetic_flat(1000)), changed=False)
+    assert type(vs.index).__name__ == index_cls
+    assert rag_system.ANN_INDEX_FILE.stat().st_mtime_ns == built
+    assert rag_system.load_index_config()["type"] == kind
+
+
+def test_apply_index_type_falls_back_to_flat_below_threshold(ann_env, monkeypatch):
+    monkeypatch.setattr(rag_system, "INDEX_TYPE", "ivf_pq")
+    vs = rag_system.apply_index_type(SimpleNamespace(index=synthetic_flat(200)))
+    assert type(vs.index).__name__ == "IndexFlatL2"
+    assert rag_system.load_index_config()["type"] == "flat"
+    assert not rag_system.ANN_INDEX_FILE.exists()
+
+
+# -------------- DOCUMENT LOADING --------------
+@pytest.mark.parametrize("workers", [1, 3])
+def test_iter_documents_order_bound_and_errors(tmp_path, monkeypatch, workers):
+    paths = []
+    for i in range(8):
+        paths.append(tmp_path / f"doc{i}.txt")
+        paths[-1].write_text(f"Document {i}")
+    (tmp_path / "broken.pdf").write_bytes(b"not a pdf")
+    paths.insert(3, tmp_path / "broken.pdf")
+
+    monkeypatch.setattr(rag_system, "TextLoader", failing_loader("doc5.txt"))
+    produced = []
+    real_parts = rag_system._file_parts
+
+    def counting_parts(ps):
+        for part in real_parts(ps):
+            produced.append(part[0])
+            yield part
+    monkeypatch.setattr(rag_system, "_file_parts", counting_parts)
+
+    timings, seen = {}, []
+    for p, docs, last in rag_system.iter_documents(paths, timings, workers=workers):
+        seen.append(p)
+        assert last
+        assert len(produced) - len(seen) <= 2 * workers - 1
+        if p.suffix == ".txt" and p.name != "doc5.txt":
+            assert [d.page_content for d in docs] == [f"Document {p.stem[3:]}"]
+        else:
+            assert docs == []
+
+    assert seen == paths
+    failed = {Path(p).name for p, stats in timings.items() if stats["errors"]}
+    assert failed == {"broken.pdf", "doc5.txt"}
+    assert timings[str(paths[0])]["pages"] == 1
+    assert "cannot read doc5.txt" in timings[str(tmp_path / "doc5.txt")]["errors"][0]
@@ -0,0 +1,178 @@
+import json
+import threading
+import time
+
+import pytest
+
+from regulatory import LocalFeedSource, RegulationScheduler, validate_regulation
+
+
+def reg(rid, juris="EU", keywords=("consent",)):
+    return {"id": rid, "title": f"Reg {rid}", "jurisdiction": juris,
+            "summary": "s", "keywords": list(keywords)}
+
+
+class ListSource:
+    """Feed yielding queued batches of regulations, one batch per poll."""
+
+    def __init__(self, *batches, fail_first=False):
+        self.batches = list(batches)
+        self.fail_first = fail_first
+
+    def poll(self):
+        if self.fail_first:
+            self.fail_first = False
+            raise OSError("feed unavailable")
+        if self.batches:
+            for r in self.batches.pop(0):
+                yield r, (lambda: None)
+
+
+def wait_for(cond, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if cond():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_validate_regulation():
+    assert validate_regulation(reg("A")) is None
+    assert "jurisdiction" in validate_regulation({"id": "X3", "title": "t"})
+    assert "keywords" in validate_regulation({**reg("A"), "keywords": "consent"})
+    assert validate_regulation("nope") == "not an object"
+
+
+def test_bad_feed_files_are_rejected(reg_env, tmp_path):
+    feed = tmp_path / "feed"
+    feed.mkdir()
+    (feed / "a_good.json").write_text(json.dumps([reg("G1"), reg("G2")]))
+    (feed / "b_missing.json").write_text(json.dumps({"id": "X3", "title": "t"}))
+    (feed / "c_broken.json").write_text("{not json")
+
+    source = LocalFeedSource(str(feed), synthetic=False)
+    items = list(source.poll())
+    assert [r["id"] for r, _ in items] == ["G1", "G2"]
+    for _, ack in items:
+        ack()
+
+    processed = sorted(p.name for p in (feed / "processed").iterdir())
+    assert processed == ["a_good.json", "b_missing.json.bad", "c_broken.json.bad"]
+    assert source.rejected == 2
+    assert list(source.poll()) == []
+
+
+def test_poller_survives_failing_pass(reg_env):
+    sched = RegulationScheduler(ListSource([reg("R1")], fail_first=True),
+                                interval=0.05, window=0.05)
+    sched.start()
+    try:
+        assert wait_for(lambda: sched.metrics.snapshot()["processed"] == 1)
+        snap = sched.metrics.snapshot()
+        assert snap["poll_errors"] == 1
+        assert "feed unavailable" in snap["last_poll_error"]
+        assert sched.is_alive()
+    finally:
+        sched.shutdown()
+    assert not sched.is_running()
+
+
+class DyingSource:
+    def poll(self):
+        raise SystemExit("poller thread killed")
+        yield
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_dead_poller_reported_unhealthy(reg_env):
+    sched = RegulationScheduler(DyingSource(), interval=0.05, window=0.05)
+    sched.start()
+    try:
+        assert wait_for(lambda: not sched.is_alive())
+        assert not sched.metrics.snapshot()["poller_alive"]
+        assert sched.is_running()  # dispatcher still needs shutting down
+        assert sched.metrics.snapshot()["dispatcher_alive"]
+    finally:
+        sched.shutdown()
+
+
+def test_burst_is_coalesced_and_matches_relevance(reg_env):
+    regs = [reg(f"R{i}", keywords=("consent", "cross-border")) for i in range(5)]
+    sched = RegulationScheduler(ListSource(), window=0.2, max_batch=50)
+    for r in regs + regs[:2]:
+        sched.enqueue(r)
+        reg_env.get_store().add_regulation(r)
+
+    batch = sched.next_batch()
+    assert sorted(r["id"] for r, _ in batch) == [r["id"] for r in regs]
+    assert sched.metrics.snapshot()["duplicates_coalesced"] == 2
+
+    sched.process(batch)
+    store = reg_env.get_store()
+    contracts = store.load_contracts()
+    for r in regs:
+        scores = {cid: score for cid, score, _ in store.load_scores(r["id"])}
+        for cid, meta in contracts.items():
+            expected, _ = reg_env.relevance(r, meta, reg_env.read_contract(meta))
+            assert scores.get(cid, 0) == expected
+    sched.pool.shutdown()
+
+
+def test_full_queue_applies_backpressure(reg_env):
+    sched = RegulationScheduler(ListSource(), max_queue=2)
+    assert sched.enqueue(reg("A")) and sched.enqueue(reg("B"))
+
+    result = {}
+    producer = threading.Thread(target=lambda: result.setdefault("ok", sched.enqueue(reg("C"))))
+    producer.start()
+    assert wait_for(lambda: sched.metrics.snapshot()["backpressure_waits"] >= 1)
+    assert producer.is_alive()  # blocked, not dropped
+
+    sched.queue.get()
+    producer.join(5)
+    assert result["ok"] is True
+    assert sched.metrics.snapshot()["max_queue_depth"] == 2
+    sched.pool.shutdown()
+
+
+def add_contracts(reg_env, n):
+    """Add contracts CT100.. with one distinctive clause each."""
+    s = reg_env.get_store()
+    with s.transaction() as conn:
+        for i in range(n):
+            cid, path = f"CT{100 + i}", f"contracts/CT{100 + i}-v1.txt"
+            s.put_contract(cid, {"name": cid, "jurisdiction": "US", "version": 1, "file": path}, conn)
+            with open(f"{reg_env.DATASET}/{path}", "w") as f:
+                f.write(f"Service terms. Clause {i}: supplier keeps audit-log-{i} records.")
+
+
+def test_postings_read_each_contract_once_then_only_candidates(reg_env):
+    add_contracts(reg_env, 20)
+    postings = reg_env.KeywordPostings()
+    contracts = reg_env.get_store().load_contracts()
+
+    hits = postings.lookup(contracts, ["consent", "service terms"])
+    assert postings.reads == len(contracts)
+    assert hits["consent"] == {"CT001"}
+    assert len(hits["service terms"]) == 20
+
+    # New keywords read only the contracts holding all their trigrams
+    hits = postings.lookup(contracts, ["audit-log-7", "india", "nowhere at all"])
+    assert postings.reads == len(contracts) + 2
+    assert hits == {"audit-log-7": {"CT107"}, "india": {"CT002"}, "nowhere at all": set()}
+
+    keywords = ["consent", "service terms", "audit-log-7", "india", "data", "ce"]
+    hits = postings.lookup(contracts, keywords)
+    for kw in keywords:
+        expected = {cid for cid, m in contracts.items() if kw in reg_env.read_contract(m)}
+        assert hits[kw] == expected, kw
+
+    # A new version is re-read once and updates every posting
+    amendment = dict(reg("R-X"), summary="Data must stay in India.")
+    reg_env.apply_regulation(amendment, "CT001")
+    reads = postings.reads
+    contracts = reg_env.get_store().load_contracts()
+    hits = postings.lookup(contracts, ["india"])
+    assert postings.reads == reads + 1
+    assert hits["india"] == {"CT001", "CT002"}
@@ -0,0 +1,121 @@
+import json
+
+import pytest
+
+
+def regulation(rid, title="Breach Notice", keywords=("personal data",)):
+    return {"id": rid, "title": title, "jurisdiction": "EU",
+            "summary": f"Summary of {rid}.", "keywords": list(keywords)}
+
+
+def add(reg_env, *regs):
+    for r in regs:
+        reg_env.get_store().add_regulation(r)
+
+
+def test_delta_versions_replay_to_full_text(reg_env, monkeypatch):
+    monkeypatch.setattr(reg_env, "amendment_text", lambda reg: f"\n[{reg['id']}]\n")
+    r1, r2 = regulation("R1"), regulation("R2")
+    add(reg_env, r1, r2)
+    store = reg_env.get_store()
+    base = open(f"{reg_env.DATASET}/contracts/CT001-v1.txt").read()
+
+    reg_env.apply_regulation(r1, "CT001")
+    reg_env.apply_regulation(r2, "CT001")
+    reg_env.apply_regulation(r2, "CT001")  # already applied: no new version
+
+    meta = store.get_contract("CT001")
+    assert meta["version"] == 3
+    assert meta["applied"] == ["R1", "R2"]
+
+    v2 = base.lower() + "\n[R1]\n"
+    v3 = v2.lower() + "\n[R2]\n"
+    assert store.version_text("CT001", 2) == v2
+    assert store.version_text("CT001", 3) == v3
+
+    # Cold cache: a new store rebuilds the same text from the blobs
+    reg_env.store = None
+    assert reg_env.get_store().version_text("CT001", 3) == v3
+    assert reg_env.export_version("CT001", 2) == v2
+
+
+def test_bulk_apply_shares_one_blob(reg_env):
+    reg = regulation("R-ALL", keywords=("data",))
+    add(reg_env, reg)
+    store = reg_env.get_store()
+    blobs_before = store.conn().execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+
+    amended = reg_env.bulk_apply_regulation(reg, min_score=1)
+    assert sorted(amended) == ["CT001", "CT002"]
+    assert store.conn().execute("SELECT COUNT(*) FROM blobs").fetchone()[0] == blobs_before + 1
+    assert reg_env.bulk_apply_regulation(reg, min_score=1) == []
+
+    for cid in amended:
+        meta = store.get_contract(cid)
+        assert meta["version"] == 2
+        assert "r-all" not in store.version_text(cid, 1)
+        assert store.version_text(cid, 2).endswith(f"Summary: {reg['summary']}\n")
+
+
+def _rows(path):
+    with open(path) as f:
+        return sorted(json.dumps(json.loads(line), sort_keys=True) for line in f)
+
+
+def test_batch_pool_matches_in_process(reg_env, tmp_path):
+    add(reg_env, regulation("R1"), regulation("R2", keywords=("cross-border",)))
+    reg_env.apply_regulation(regulation("R1"), "CT001")  # CT001 v2 lives in the DB only
+
+    serial, pooled = tmp_path / "serial.jsonl", tmp_path / "pooled.jsonl"
+    reg_env.run_batch(str(serial), workers=1, batch_size=1)
+    summary = reg_env.run_batch(str(pooled), workers=2, batch_size=1)
+
+    assert _rows(pooled) == _rows(serial)
+    assert summary["contracts"] == 2
+    # The parent's connection is still usable after the pool
+    assert reg_env.get_store().get_contract("CT001")["version"] == 2
+
+
+def test_export_rejects_versions_that_do_not_exist(reg_env):
+    base = open(f"{reg_env.DATASET}/contracts/CT001-v1.txt").read()
+    assert reg_env.export_version("CT001") == base
+    assert reg_env.export_version("CT001", 1) == base
+
+    for missing in (0, 2, 7):
+        with pytest.raises(SystemExit, match="no version"):
+            reg_env.export_version("CT001", missing)
+
+    reg_env.apply_regulation(regulation("R1"), "CT001")
+    with pytest.raises(SystemExit, match="no version"):
+        reg_env.export_version("CT001", 7)
+    assert reg_env.export_version("CT001", 1) == base
+
+
+def test_export_does_not_fall_back_for_old_versions(reg_env):
+    s = reg_env.get_store()
+    with s.transaction() as conn:
+        conn.execute("UPDATE contracts SET version = 3 WHERE id = 'CT001'")
+    with pytest.raises(SystemExit, match="not stored"):
+        reg_env.export_version("CT001", 2)
+
+
+def test_batch_records_bad_contract_and_continues(reg_env, tmp_path):
+    add(reg_env, regulation("R1"), regulation("R2", keywords=("cross-border",)))
+    reg_env.apply_regulation(regulation("R1"), "CT001")
+    s = reg_env.get_store()
+    with s.transaction() as conn:
+        # v2's parent disappears: rebuilding it raises ValueError
+        conn.execute("DELETE FROM versions WHERE contract_id = 'CT001' AND version = 1")
+    s._versions.clear()
+
+    for workers in (1, 2):
+        out = tmp_path / f"batch-{workers}.jsonl"
+        summary = reg_env.run_batch(str(out), workers=workers, batch_size=1)
+        rows = [json.loads(line) for line in open(out)]
+
+        assert summary["contracts"] == 2
+        assert summary["errors"] == 1
+        errors = [r for r in rows if "error" in r]
+        assert errors == [{"contract_id": "CT001",
+                           "error": "ValueError: Missing version 1 of contract CT001"}]
+        assert {r["contract_id"] for r in rows if "error" not in r} == {"CT002"}
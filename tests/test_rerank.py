@@ -0,0 +1,68 @@
+from langchain_core.documents import Document
+
+from instrumentation import estimate_tokens
+from rerank import MIN_OVERLAP, drop_overlaps, overlap, pack, rerank, select_context
+
+HEAD = "The processor shall notify the controller of any breach. "
+SHARED = "Personal data may only be transferred with adequate safeguards in place. "
+TAIL = "Records of processing are kept for five years after termination. "
+
+
+def test_overlap_needs_min_length():
+    assert len(SHARED) >= MIN_OVERLAP
+    assert overlap(HEAD + SHARED, SHARED + TAIL) == len(SHARED)
+    assert overlap(HEAD + "short tail.", "short tail." + TAIL) == 0
+    assert overlap(HEAD, TAIL) == 0
+
+
+def test_drop_overlaps_removes_repeats_and_trims_spans():
+    first = HEAD + SHARED
+    kept = drop_overlaps([
+        first,
+        first,                      # duplicate
+        "  " + SHARED + "\n",       # contained in a higher-ranked chunk
+        SHARED + TAIL,              # splitter overlap at the head
+        "Annex I lists the sub-processors in detail. " + HEAD,  # overlap at the tail
+        "",
+    ])
+    assert kept == [
+        first.strip(),
+        TAIL.strip(),
+        "Annex I lists the sub-processors in detail.",
+    ]
+
+
+def test_drop_overlaps_drops_short_leftovers():
+    assert drop_overlaps([HEAD + SHARED, SHARED + "Fine."]) == [(HEAD + SHARED).strip()]
+
+
+def test_pack_stays_within_budget_and_skips_oversize_chunks():
+    small, medium = "a" * 40, "b" * 200
+    huge = "c" * 4000
+    budget = 100
+    assert estimate_tokens(huge) > budget
+
+    parts, used = pack([huge, medium, small, small, huge], budget)
+    assert parts == [medium, small, small]
+    assert used == estimate_tokens(medium) + 2 * estimate_tokens(small) <= budget
+
+    assert pack([huge], budget) == ([], 0)
+    assert pack([medium, medium, medium], budget=estimate_tokens(medium) * 2) == (
+        [medium, medium], estimate_tokens(medium) * 2)
+
+
+class ReverseModel:
+    def predict(self, pairs, batch_size=None):
+        return [-i for i in range(len(pairs))][::-1]
+
+
+def test_select_context_reranks_dedupes_and_packs():
+    docs = [Document(page_content=t) for t in (HEAD + SHARED, SHARED + TAIL, HEAD + SHARED)]
+    assert rerank("q", docs, model=ReverseModel()) == docs[::-1]
+
+    context, used = select_context("q", docs, budget=1000, use_rerank=False)
+    assert used == 2
+    assert context == (HEAD + SHARED).strip() + "\n\n" + TAIL.strip()
+
+    context, used = select_context("q", docs, budget=1000, top_k=1, use_rerank=False)
+    assert (context, used) == ((HEAD + SHARED).strip(), 1)
@@ -0,0 +1,97 @@
+import math
+
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import sparse_index
+from index_store import save_index
+from sparse_index import SparseIndex, hybrid_search, open_sparse_index, rrf_fuse, tokenize
+
+DOCS = {
+    "gdpr": "Personal data breaches must be notified within 72 hours under the GDPR.",
+    "pci": "Card data is protected under PCI-DSS 4.0 and PCI DSS audits run yearly.",
+    "lease": "The tenant pays rent monthly and keeps the premises in good repair.",
+    "data": "Data data data retention schedules for records.",
+}
+
+
+@pytest.fixture
+def sparse(tmp_path):
+    index = SparseIndex(tmp_path / "bm25.sqlite")
+    index.begin()
+    index.add(DOCS.items())
+    index.commit()
+    return index
+
+
+def test_tokenize_keeps_codes_and_phrases():
+    terms = tokenize("Under the PCI-DSS 4.2 rules, the AI Act applies")
+    assert "pci-dss" in terms and "4.2" in terms
+    assert "ai act" in terms
+    assert "the" not in terms and "under the" not in terms
+
+
+def test_bm25_scores_match_the_formula(sparse):
+    n, avgdl = sparse.stats()
+    assert n == 4
+
+    lengths = {id_: len(tokenize(text)) for id_, text in DOCS.items()}
+    df = sum("data" in tokenize(text) for text in DOCS.values())
+    idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def expected(id_):
+        tf = tokenize(DOCS[id_]).count("data")
+        k1, b = sparse_index.BM25_K1, sparse_index.BM25_B
+        return idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths[id_] / avgdl))
+
+    results = dict(sparse.search("data"))
+    assert set(results) == {"gdpr", "pci", "data"}
+    for id_, score in results.items():
+        assert score == pytest.approx(expected(id_))
+    assert sparse.search("data", k=1)[0][0] == "data"
+
+
+def test_exact_phrase_outranks_loose_words(sparse):
+    assert sparse.search("pci dss audit")[0][0] == "pci"
+    assert sparse.search("personal data breach notified")[0][0] == "gdpr"
+    assert sparse.search("unrelated words entirely") == []
+
+
+def test_rollback_and_replace(sparse):
+    sparse.begin()
+    sparse.add([("new", "spaceship contract")])
+    sparse.delete(["lease"])
+    sparse.rollback()
+    assert sparse.search("spaceship") == []
+    assert sparse.search("tenant rent")[0][0] == "lease"
+
+    sparse.begin()
+    sparse.add([("lease", "The landlord maintains the boiler.")])
+    sparse.commit()
+    assert sparse.search("tenant") == []
+    assert sparse.search("boiler")[0][0] == "lease"
+    assert len(sparse) == 4
+
+
+def test_rrf_fuse_weights_and_agreement():
+    # "b" is second in both lists and beats each list's single winner
+    assert rrf_fuse([["a", "b"], ["c", "b"]], [1.0, 1.0], k=60)[0] == "b"
+    assert rrf_fuse([["a", "b"], ["c", "b"]], [1.0, 0.0], k=60)[:2] == ["a", "b"]
+    assert rrf_fuse([["a"], ["c"]], [1.0, 3.0])[0] == "c"
+
+
+def test_index_rebuilt_from_docstore_and_used_for_hybrid(tmp_path):
+    ids = list(DOCS)
+    vs = FAISS.from_texts(list(DOCS.values()), DeterministicFakeEmbedding(size=16), ids=ids)
+    save_index(vs, tmp_path)
+
+    sparse = open_sparse_index(tmp_path)   # no BM25 file yet: built from the docstore
+    assert len(sparse) == 4
+    assert sparse.version() is not None
+
+    # Pure BM25 weighting returns the keyword match even if dense ranks it last
+    docs = hybrid_search(vs, sparse, "tenant rent premises", k=1, fetch_k=4, dense_weight=0.0)
+    assert docs[0].id == "lease"
+    docs = hybrid_search(vs, sparse, "tenant rent premises", k=4, fetch_k=4)
+    assert {d.id for d in docs} == set(ids)